@@ -1,9 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import numpy as np
 import pickle
 import os
+import sys
+import json
 import pandas as pd
+from types import MappingProxyType
+# model_registry and columnar_cache are shared with crop_recommandation-main
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "crop_recommandation-main"))
+from model_registry import ModelRegistry, ModelUnavailable
+from columnar_cache import read_table
 
 app = Flask(__name__)
 CORS(app)
@@ -13,51 +20,101 @@ CROP_MODEL_PATH = "XGBoost.pkl"
 CROP_LE_PATH = "crop_label_encoder.pkl"
 FERT_PIPE_PATH = "xgb_pipeline.pkl"
 FERT_LE_PATH = "fertilizer_label_encoder.pkl"
-RAIN_CSV = "data2.csv"     # <-- correct rainfall/state–district file
+RAIN_CSV = "data2.csv"     # <-- correct rainfall/state–district file (data2.cols.npz when fresh)
 
 
-# ---------------- LOAD MODELS ----------------
-for p in [CROP_MODEL_PATH, CROP_LE_PATH, FERT_PIPE_PATH, FERT_LE_PATH]:
-    if not os.path.exists(p):
-        raise FileNotFoundError(f"Model file missing: {p}")
+# Artifacts that must be resident before /readyz reports ready
+REQUIRED_MODELS = [m.strip() for m in os.environ.get("REQUIRED_MODELS", "crop,fertilizer,rainfall").split(",") if m.strip()]
 
-crop_model = pickle.load(open(CROP_MODEL_PATH, "rb"))
-crop_le = pickle.load(open(CROP_LE_PATH, "rb"))
 
-fert_pipeline = pickle.load(open(FERT_PIPE_PATH, "rb"))
-fert_label_enc = pickle.load(open(FERT_LE_PATH, "rb"))
+# ---------------- MODEL LOADERS (run lazily on first use) ----------------
+def _require(*paths):
+    for p in paths:
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"Model file missing: {p}")
+
+
+def load_crop():
+    _require(CROP_MODEL_PATH, CROP_LE_PATH)
+    return {
+        "model": pickle.load(open(CROP_MODEL_PATH, "rb")),
+        "le": pickle.load(open(CROP_LE_PATH, "rb"))
+    }
+
+
+def load_fertilizer():
+    _require(FERT_PIPE_PATH, FERT_LE_PATH)
+    fert_pipeline = pickle.load(open(FERT_PIPE_PATH, "rb"))
+    return {
+        "model": fert_pipeline["model"],
+        "label_enc": pickle.load(open(FERT_LE_PATH, "rb")),
+        "soil_le": fert_pipeline["soil_label_encoder"],
+        "crop_le": fert_pipeline["crop_label_encoder"],
+        "feature_order": fert_pipeline["feature_order"]
+    }
+
+
+# ---------------- STATE -> DISTRICT INDEX ----------------
+# Built once at load time; /states and /districts serve pre-serialized bytes
+def build_state_index(df, state_col, dist_col):
+    grouped = df.dropna(subset=[dist_col]).groupby(state_col)[dist_col].unique()
+    return MappingProxyType({s: tuple(sorted(grouped[s].tolist())) for s in sorted(grouped.index)})
+
+
+def _json_bytes(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+EMPTY_STATES_JSON = _json_bytes({"states": [], "mapping": {}})
+EMPTY_DISTRICTS_JSON = _json_bytes({"districts": []})
 
-soil_le = fert_pipeline["soil_label_encoder"]
-crop_le_f = fert_pipeline["crop_label_encoder"]
-fert_model = fert_pipeline["model"]
-feature_order = fert_pipeline["feature_order"]
 
 # ---------------- LOAD STATE & DISTRICT DATA ----------------
-df_rain = pd.read_csv(RAIN_CSV)
+def load_rainfall():
+    _require(RAIN_CSV)
+    df_rain = read_table(RAIN_CSV)
+
+    # Clean column names
+    df_rain.columns = [c.strip() for c in df_rain.columns]
+
+    # Detect correct columns
+    state_col = None
+    dist_col = None
 
-# Clean column names
-df_rain.columns = [c.strip() for c in df_rain.columns]
+    for c in df_rain.columns:
+        lc = c.lower()
+        if "state" in lc:
+            state_col = c
+        if "district" in lc:
+            dist_col = c
 
-# Detect correct columns
-STATE_COL = None
-DIST_COL = None
+    if state_col is None or dist_col is None:
+        raise ValueError(f"Could not detect state/district columns in {list(df_rain.columns)}")
 
-for c in df_rain.columns:
-    lc = c.lower()
-    if "state" in lc:
-        STATE_COL = c
-    if "district" in lc:
-        DIST_COL = c
+    # Ensure strings
+    # (the columnar cache already stores them stripped, as categoricals)
+    for col in (state_col, dist_col):
+        if not isinstance(df_rain[col].dtype, pd.CategoricalDtype):
+            df_rain[col] = df_rain[col].astype(str).str.strip()
 
-if STATE_COL is None or DIST_COL is None:
-    print("❌ ERROR: Could not detect state/district columns")
-    print(df_rain.columns)
-    raise SystemExit
+    index = build_state_index(df_rain, state_col, dist_col)
+    return {
+        "states_json": _json_bytes({
+            "states": list(index),
+            "mapping": {st: list(d) for st, d in index.items()}
+        }),
+        "districts_json": MappingProxyType({st: _json_bytes({"districts": list(d)}) for st, d in index.items()})
+    }
 
 
-# Ensure strings
-df_rain[STATE_COL] = df_rain[STATE_COL].astype(str).str.strip()
-df_rain[DIST_COL] = df_rain[DIST_COL].astype(str).str.strip()
+registry = ModelRegistry()
+registry.register("crop", load_crop, required="crop" in REQUIRED_MODELS)
+registry.register("fertilizer", load_fertilizer, required="fertilizer" in REQUIRED_MODELS)
+registry.register("rainfall", load_rainfall, required="rainfall" in REQUIRED_MODELS)
+
+
+def model_error(e):
+    return jsonify({"error": str(e)}), 503
 
 
 # ---------------- HOME ----------------
@@ -69,41 +126,62 @@ def home():
 # ---------------- META ----------------
 @app.route("/meta", methods=["GET"])
 def meta():
+    try:
+        crop = registry.get("crop")
+        fert = registry.get("fertilizer")
+    except ModelUnavailable as e:
+        return model_error(e)
+
     return jsonify({
-        "crop_classes": list(crop_le.classes_),
-        "fert_crop_classes": list(crop_le_f.classes_),
-        "soil_types": list(soil_le.classes_),
-        "feature_order": feature_order
+        "crop_classes": list(crop["le"].classes_),
+        "fert_crop_classes": list(fert["crop_le"].classes_),
+        "soil_types": list(fert["soil_le"].classes_),
+        "feature_order": fert["feature_order"]
     })
 
 
-# ---------------- STATES API ----------------
-@app.route("/states", methods=["GET"])
-def get_states():
+# ---------------- HEALTH CHECKS ----------------
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
 
-    mapping = {}
-    states = sorted(df_rain[STATE_COL].unique().tolist())
 
-    for st in states:
-        districts = df_rain[df_rain[STATE_COL] == st][DIST_COL].unique().tolist()
-        mapping[st] = sorted(districts)
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Kick off a background warmup on the first probe (e.g. under gunicorn)
+    registry.warm(background=True)
+    ready = registry.ready()
+    return jsonify({"ready": ready, "models": registry.status()}), (200 if ready else 503)
 
-    return jsonify({
-        "states": states,
-        "mapping": mapping
-    })
+
+# ---------------- STATES API ----------------
+@app.route("/states", methods=["GET"])
+def get_states():
+    try:
+        body = registry.get("rainfall")["states_json"]
+    except ModelUnavailable:
+        body = EMPTY_STATES_JSON
+    return Response(body, mimetype="application/json")
 
 
 # ---------------- DISTRICTS API ----------------
 @app.route("/districts/<state>", methods=["GET"])
 def get_districts(state):
-    d = df_rain[df_rain[STATE_COL] == state][DIST_COL].dropna().unique().tolist()
-    return jsonify({"districts": sorted(d)})
+    try:
+        body = registry.get("rainfall")["districts_json"].get(state, EMPTY_DISTRICTS_JSON)
+    except ModelUnavailable:
+        body = EMPTY_DISTRICTS_JSON
+    return Response(body, mimetype="application/json")
 
 
 # ---------------- CROP PREDICTION ----------------
 @app.route("/predict_crop", methods=["POST"])
 def predict_crop():
+    try:
+        crop = registry.get("crop")
+    except ModelUnavailable as e:
+        return model_error(e)
+
     try:
         data = request.json
 
@@ -117,8 +195,8 @@ def predict_crop():
             float(data["rainfall"])
         ]])
 
-        pred_idx = crop_model.predict(x)[0]
-        crop_name = crop_le.inverse_transform([pred_idx])[0]
+        pred_idx = crop["model"].predict(x)[0]
+        crop_name = crop["le"].inverse_transform([pred_idx])[0]
 
         return jsonify({"crop": crop_name})
 
@@ -129,6 +207,14 @@ def predict_crop():
 # ---------------- FERTILIZER PREDICTION ----------------
 @app.route("/predict_fertilizer", methods=["POST"])
 def predict_fertilizer():
+    try:
+        fert = registry.get("fertilizer")
+    except ModelUnavailable as e:
+        return model_error(e)
+
+    soil_le = fert["soil_le"]
+    crop_le_f = fert["crop_le"]
+
     try:
         data = request.json
 
@@ -144,7 +230,7 @@ def predict_fertilizer():
         crop_enc = crop_le_f.transform([crop])[0]
 
         row = []
-        for col in feature_order:
+        for col in fert["feature_order"]:
             if col == "soil_enc":
                 row.append(soil_enc)
             elif col == "crop_enc":
@@ -166,8 +252,8 @@ def predict_fertilizer():
                     row.append(0)
 
         x = np.array([row])
-        pred = fert_model.predict(x)[0]
-        fert_name = fert_label_enc.inverse_transform([pred])[0]
+        pred = fert["model"].predict(x)[0]
+        fert_name = fert["label_enc"].inverse_transform([pred])[0]
 
         return jsonify({"fertilizer": fert_name})
 
@@ -177,4 +263,11 @@ def predict_fertilizer():
 
 # ---------------- RUN SERVER ----------------
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    PORT = int(os.environ.get("PORT", 5000))
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # Bind first, then load models in the background. Under the debug reloader
+    # only the serving child process (WERKZEUG_RUN_MAIN) warms up; the watching
+    # parent never serves a request.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        registry.warm(background=True, wait_for_port=PORT)
+    app.run(debug=debug, port=PORT)
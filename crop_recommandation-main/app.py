@@ -1,10 +1,31 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, g
 from flask_cors import CORS
 import numpy as np
 import pickle
 import joblib
 import os
+import io
+import json
+import time
+import threading
+import random
+import cProfile
 import pandas as pd
+from types import MappingProxyType
+from tree_ensemble import compile_xgboost
+from model_registry import ModelRegistry, ModelUnavailable
+from suitability_grid import load_grid
+from prediction_cache import PredictionCache, MISS
+from microbatch import MicroBatcher
+from model_zoo import ZOO, load_model
+import model_store
+import metrics
+from columnar_cache import read_table, cache_path
+from telemetry import TelemetryStore, TelemetryError, UnknownDevice, FIELDS, RECORD_CONTENT_TYPE, follow_records
+from rollup_store import RollupStore, columns_to_json
+from irrigation import GateEngine, IrrigationError, parse_fields, load_fields
+from suitability_grid import predict_proba
+from suitability_stream import StreamHub, sse_events
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 CORS(app)
@@ -17,84 +38,623 @@ CORS(app)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Crop Prediction & Fertilizer Paths
-CROP_MODEL_PATH = os.path.join(BASE_DIR, "XGBoost.pkl")
+# Serving crop model: any name in model_zoo.ZOO (compare them with `python model_zoo.py bench`)
+CROP_MODEL = os.environ.get("CROP_MODEL", "xgboost")
+if CROP_MODEL not in ZOO:
+    raise SystemExit(f"CROP_MODEL={CROP_MODEL!r} is not one of: {', '.join(ZOO)}")
+CROP_MODEL_PATH = os.path.join(BASE_DIR, ZOO[CROP_MODEL])
+# Confidence-gated cascade for /api/predict_crop: a cheap zoo model answers when its
+# top-class probability is >= CROP_CASCADE_THRESHOLD, otherwise CROP_MODEL does.
+# Pick the pair and threshold with `python model_zoo.py cascade`. Empty = off.
+CROP_CASCADE = os.environ.get("CROP_CASCADE", "")
+CROP_CASCADE_THRESHOLD = float(os.environ.get("CROP_CASCADE_THRESHOLD", 0.9))
+if CROP_CASCADE and CROP_CASCADE not in ZOO:
+    raise SystemExit(f"CROP_CASCADE={CROP_CASCADE!r} is not one of: {', '.join(ZOO)}")
 CROP_LE_PATH = os.path.join(BASE_DIR, "crop_label_encoder.pkl")
 FERT_PIPE_PATH = os.path.join(BASE_DIR, "xgb_pipeline.pkl")
 FERT_LE_PATH = os.path.join(BASE_DIR, "fertilizer_label_encoder.pkl")
-RAIN_CSV = os.path.join(BASE_DIR, "data2.csv")
+RAIN_CSV = os.path.join(BASE_DIR, "data2.csv")  # loads data2.cols.npz when fresh: python columnar_cache.py build data2.csv
 
 # Suitability Checker Paths
 SUITABILITY_MODEL_PATH = os.path.join(BASE_DIR, "suitability_model.pkl")
 SUITABILITY_LE_PATH = os.path.join(BASE_DIR, "label_encoder.pkl") 
+SUITABILITY_GRID_PREFIX = os.path.join(BASE_DIR, "suitability_grid")  # built by suitability_grid.py
+
+# Crop model input columns, in the order the model was trained on
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+# Batch prediction limits
+CROP_BATCH_MAX_ROWS = int(os.environ.get("CROP_BATCH_MAX_ROWS", 10000))
+CROP_BATCH_DEFAULT_TOP_K = 3
+
+# Rainfall auto-fill: month windows (inclusive, may wrap past December)
+SEASONS = {"kharif": (6, 10), "rabi": (11, 3), "zaid": (3, 6), "annual": (1, 12)}
+DEFAULT_SEASON = os.environ.get("DEFAULT_SEASON", "kharif")
+
+# Score small inputs with the compiled NumPy tree walk instead of XGBoost's DMatrix path.
+# Above NATIVE_MAX_ROWS rows XGBoost's threaded predictor is faster.
+USE_NATIVE_TREES = os.environ.get("USE_NATIVE_TREES", "1") == "1"
+NATIVE_MAX_ROWS = int(os.environ.get("NATIVE_MAX_ROWS", 64))
+
+# Micro-batching of concurrent single-row crop/fertilizer requests
+MICROBATCH = os.environ.get("MICROBATCH", "0") == "1"
+MICROBATCH_MAX_BATCH = int(os.environ.get("MICROBATCH_MAX_BATCH", 64))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 2))
+
+# Opt-in: answer suitability requests from the precomputed grid when one matches the
+# model and its accuracy report is within the bounds in suitability_grid.py
+USE_SUITABILITY_GRID = os.environ.get("USE_SUITABILITY_GRID", "0") == "1"
+
+# Opt-in prediction caches (entries per model, 0 = off; TTL in seconds; rounding of
+# the cache key). A hit answers with the prediction for an input that rounds the same.
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 0))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", 600))
+PREDICTION_CACHE_DIGITS = int(os.environ.get("PREDICTION_CACHE_DIGITS", 1))
+
+# Hot reload: poll artifact files every N seconds (0 = off). /admin/reload
+# needs the X-Admin-Token header when ADMIN_TOKEN is set, else a local caller.
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", 0))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Per-request timing breakdown: send "X-Timing: 1" or ?timing=1 to get a "timing"
+# block in the response. A PROFILE_SAMPLE_RATE fraction of prediction requests is
+# run under cProfile and dumped to PROFILE_DIR (open with snakeviz, flameprof or pstats).
+ALLOW_TIMING = os.environ.get("ALLOW_TIMING", "1") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+
+# Model format: "pickle" unpickles the .pkl files; "store" memory-maps the arrays
+# exported by `python model_store.py export`; "auto" uses the store when an export
+# exists and was made from the current .pkl files, otherwise the pickles.
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "auto")
+if MODEL_FORMAT not in ("auto", "pickle", "store"):
+    raise SystemExit(f"MODEL_FORMAT={MODEL_FORMAT!r} is not one of: auto, pickle, store")
+MODEL_STORE_DIR = os.environ.get("MODEL_STORE_DIR", model_store.DEFAULT_STORE)
+
+# IoT telemetry (/api/telemetry): readings kept per device (3600 = one hour at 1 Hz),
+# max devices tracked, and the X-Device-Token devices must send when set
+TELEMETRY_CAPACITY = int(os.environ.get("TELEMETRY_CAPACITY", 3600))
+TELEMETRY_MAX_DEVICES = int(os.environ.get("TELEMETRY_MAX_DEVICES", 10000))
+TELEMETRY_TOKEN = os.environ.get("TELEMETRY_TOKEN")
+# Long-term history: 1m/1h/1d rollups of every stored reading under this folder (empty = off)
+TELEMETRY_ROLLUP_DIR = os.environ.get("TELEMETRY_ROLLUP_DIR", "")
+# Local stand-in for devices: a serial_reader.py --store records file tailed into the store (empty = off)
+TELEMETRY_FEED_FILE = os.environ.get("TELEMETRY_FEED_FILE", "")
+# Irrigation gates (/api/irrigation): JSON file of {"device", "crop", "rainfall"} fields
+# loaded at start, and the limits on how often one gate may switch
+IRRIGATION_FIELDS = os.environ.get("IRRIGATION_FIELDS", "")
+IRRIGATION_MIN_SWITCH_SECONDS = float(os.environ.get("IRRIGATION_MIN_SWITCH_SECONDS", 300))
+IRRIGATION_MAX_SWITCHES_PER_HOUR = float(os.environ.get("IRRIGATION_MAX_SWITCHES_PER_HOUR", 4))
+IRRIGATION_STALE_SECONDS = float(os.environ.get("IRRIGATION_STALE_SECONDS", 120))
+# Live suitability (/api/suitability/stream/<device>): a stream is rescored when temperature
+# or humidity moved more than these deltas, at most once per debounce interval
+SUITABILITY_STREAM_DELTA_TEMPERATURE = float(os.environ.get("SUITABILITY_STREAM_DELTA_TEMPERATURE", 0.5))
+SUITABILITY_STREAM_DELTA_HUMIDITY = float(os.environ.get("SUITABILITY_STREAM_DELTA_HUMIDITY", 2.0))
+SUITABILITY_STREAM_DEBOUNCE_SECONDS = float(os.environ.get("SUITABILITY_STREAM_DEBOUNCE_SECONDS", 2))
+
+# Artifacts that must be resident before /readyz reports ready
+REQUIRED_MODELS = [m.strip() for m in os.environ.get("REQUIRED_MODELS", "crop,fertilizer,rainfall").split(",") if m.strip()]
 
 # ==========================================
-# 2. LOAD MODELS
+# 2. MODEL LOADERS (run lazily on first use)
 # ==========================================
 
-# --- Load Crop Prediction Models ---
-crop_model = None
-crop_le = None
-try:
-    if os.path.exists(CROP_MODEL_PATH):
-        crop_model = pickle.load(open(CROP_MODEL_PATH, "rb"))
-        crop_le = pickle.load(open(CROP_LE_PATH, "rb"))
-        print("✅ Crop Prediction Models Loaded")
-    else:
-        print("❌ XGBoost.pkl not found")
-except Exception as e:
-    print(f"⚠️ Warning (Crop Model): {e}")
-
-# --- Load Fertilizer Models ---
-fert_model = None
-try:
-    if os.path.exists(FERT_PIPE_PATH):
-        fert_pipeline = pickle.load(open(FERT_PIPE_PATH, "rb"))
-        fert_label_enc = pickle.load(open(FERT_LE_PATH, "rb"))
-        soil_le = fert_pipeline["soil_label_encoder"]
-        crop_le_f = fert_pipeline["crop_label_encoder"]
-        fert_model = fert_pipeline["model"]
-        feature_order = fert_pipeline["feature_order"]
-        print("✅ Fertilizer Models Loaded")
-    else:
-        print("❌ Fertilizer pipeline not found")
-except Exception as e:
-    print(f"⚠️ Warning (Fertilizer Model): {e}")
-
-# --- Load Suitability Models ---
-s_model = None
-s_le = None
-if os.path.exists(SUITABILITY_MODEL_PATH) and os.path.exists(SUITABILITY_LE_PATH):
-    try:
-        s_model = joblib.load(SUITABILITY_MODEL_PATH)
-        s_le = joblib.load(SUITABILITY_LE_PATH)
-        print("✅ Suitability Models Loaded")
+def _require(*paths):
+    for p in paths:
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"{os.path.basename(p)} not found")
+
+def _compile_native(model, name):
+    # Score single rows with the compiled NumPy tree walk when enabled
+    if not USE_NATIVE_TREES:
+        return None
+    try:
+        return compile_xgboost(model)
     except Exception as e:
-        print(f"❌ Error loading Suitability models: {e}")
-else:
-    print("⚠️ Suitability files not found. Using Mock Mode.")
+        print(f"⚠️ Warning (Native Trees, {name}): {e}. Falling back to XGBoost predict.")
+        return None
+
+def _open_store(name):
+    # Memory-mapped export of `name`, or None to fall back to the pickles
+    if MODEL_FORMAT == "pickle":
+        return None
+    path = os.path.join(MODEL_STORE_DIR, name)
+    # In "store" mode the export is trusted as is; "auto" only takes it if the pickles match
+    sources = None if MODEL_FORMAT == "store" else model_store.SOURCES[name]
+    try:
+        return model_store.load(path, sources)
+    except model_store.StoreMissing:
+        if MODEL_FORMAT == "store":
+            raise
+        return None
+    except model_store.StoreError as e:
+        if MODEL_FORMAT == "store":
+            raise
+        print(f"⚠️ Model store ({name}): {e}. Loading the pickles instead.")
+        return None
+
+def _lazy_pickle(stored, path, load_fn, name):
+    # The pickle is only used while it is the file the export was made from
+    expected = stored["manifest"]["sources"].get(os.path.basename(path))
+    return model_store.LazyPickle(load_fn, stored["model"], name, path, expected)
+
+def load_lazy_models():
+    # Unpickles the large-batch models now instead of on first use. prefork_server.py
+    # calls this before forking, so the workers share one copy.
+    for name in ("crop", "fertilizer"):
+        bundle = get_or_none(name)
+        if bundle is not None and isinstance(bundle["model"], model_store.LazyPickle):
+            bundle["model"].load()
+
+# --- Crop Prediction Models ---
+def load_crop():
+    stored = _open_store("crop") if CROP_MODEL == "xgboost" else None
+    if stored is not None:
+        # The exported trees serve up to NATIVE_MAX_ROWS; XGBoost is only unpickled
+        # for the first larger batch (or by prefork_server.py before forking), where
+        # its predictor is faster
+        return {
+            "model": _lazy_pickle(stored, CROP_MODEL_PATH, lambda: pickle.load(open(CROP_MODEL_PATH, "rb")), "crop"),
+            "le": stored["labels"]["crop"],
+            "native": stored["model"],
+            "reference": stored["reference"],
+        }
+    _require(CROP_MODEL_PATH, CROP_LE_PATH)
+    le = pickle.load(open(CROP_LE_PATH, "rb"))
+    model = load_model(CROP_MODEL, le)
+    return {
+        "model": model,
+        "le": le,
+        "native": _compile_native(model, "crop") if CROP_MODEL == "xgboost" else None,
+    }
+
+def load_crop_cascade():
+    path = os.path.join(BASE_DIR, ZOO[CROP_CASCADE])
+    _require(path, CROP_LE_PATH)
+    le = pickle.load(open(CROP_LE_PATH, "rb"))
+    return {"model": load_model(CROP_CASCADE, le), "le": le}
+
+# --- Fertilizer Models ---
+def load_fertilizer():
+    stored = _open_store("fertilizer")
+    if stored is not None:
+        labels = stored["labels"]
+        return {
+            "model": _lazy_pickle(stored, FERT_PIPE_PATH, lambda: pickle.load(open(FERT_PIPE_PATH, "rb"))["model"],
+                                  "fertilizer"),
+            "label_enc": labels["fertilizer"],
+            "soil_le": labels["soil"],
+            "crop_le": labels["crop"],
+            "feature_order": stored["meta"]["feature_order"],
+            "native": stored["model"],
+            "reference": stored["reference"],
+        }
+    _require(FERT_PIPE_PATH, FERT_LE_PATH)
+    pipeline = pickle.load(open(FERT_PIPE_PATH, "rb"))
+    return {
+        "model": pipeline["model"],
+        "label_enc": pickle.load(open(FERT_LE_PATH, "rb")),
+        "soil_le": pipeline["soil_label_encoder"],
+        "crop_le": pipeline["crop_label_encoder"],
+        "feature_order": pipeline["feature_order"],
+        "native": _compile_native(pipeline["model"], "fertilizer"),
+    }
+
+# --- Suitability Models ---
+def load_suitability():
+    stored = _open_store("suitability")
+    if stored is not None:
+        suit = {"model": stored["model"], "le": stored["labels"]["suitability"], "grid": None,
+                "reference": stored["reference"]}
+    else:
+        _require(SUITABILITY_MODEL_PATH, SUITABILITY_LE_PATH)
+        suit = {
+            "model": joblib.load(SUITABILITY_MODEL_PATH),
+            "le": joblib.load(SUITABILITY_LE_PATH),
+            "grid": None,
+        }
+    if USE_SUITABILITY_GRID:
+        model_path = SUITABILITY_MODEL_PATH if os.path.exists(SUITABILITY_MODEL_PATH) else None
+        suit["grid"] = load_grid(SUITABILITY_GRID_PREFIX, model_path)
+        if suit["grid"] is not None and list(suit["grid"].classes) != list(suit["le"].classes_):
+            print("⚠️ Suitability grid classes do not match label_encoder.pkl; ignoring it")
+            suit["grid"] = None
+    return suit
 
 # ==========================================
 # 3. LOAD STATE DATA
 # ==========================================
-try:
-    if os.path.exists(RAIN_CSV):
-        df_rain = pd.read_csv(RAIN_CSV)
-        df_rain.columns = [c.strip() for c in df_rain.columns]
-        STATE_COL = next(c for c in df_rain.columns if "state" in c.lower())
-        DIST_COL = next(c for c in df_rain.columns if "district" in c.lower())
-        df_rain[STATE_COL] = df_rain[STATE_COL].astype(str).str.strip()
-        df_rain[DIST_COL] = df_rain[DIST_COL].astype(str).str.strip()
-        print("✅ Rainfall CSV Loaded")
+
+# --- State -> District index (built once, served as pre-serialized JSON) ---
+def build_state_index(df, state_col, dist_col):
+    grouped = df.groupby(state_col)[dist_col].unique()
+    return MappingProxyType({s: tuple(sorted(grouped[s].tolist())) for s in sorted(grouped.index)})
+
+def _json_bytes(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+EMPTY_STATES_JSON = _json_bytes({"states": [], "mapping": {}})
+EMPTY_DISTRICTS_JSON = _json_bytes({"districts": []})
+
+# --- Rainfall cube: dense (district x month) array with prefix sums ---
+def build_rainfall_cube(df, state_col, dist_col):
+    month_col = next(c for c in df.columns if c.lower() == "month")
+    value_col = next(c for c in df.columns if c.lower() == "value")
+    keys = pd.MultiIndex.from_frame(df[[state_col, dist_col]]).unique().sort_values()
+    rows = keys.get_indexer(pd.MultiIndex.from_frame(df[[state_col, dist_col]]))
+    months = pd.to_numeric(df[month_col], errors="coerce").to_numpy()
+    values = pd.to_numeric(df[value_col], errors="coerce").to_numpy()
+    ok = (months >= 1) & (months <= 12) & np.isfinite(values)
+
+    monthly = np.full((len(keys), 12), np.nan, dtype=np.float32)
+    monthly[rows[ok], months[ok].astype(int) - 1] = values[ok]
+
+    # Prefix sums over months (missing months count as 0 and are excluded from the mean)
+    present = np.isfinite(monthly)
+    csum = np.zeros((len(keys), 13))
+    ccount = np.zeros((len(keys), 13), dtype=np.int32)
+    csum[:, 1:] = np.cumsum(np.where(present, monthly, 0.0), axis=1)
+    ccount[:, 1:] = np.cumsum(present, axis=1)
+    return {
+        "rows": MappingProxyType({k: i for i, k in enumerate(keys)}),
+        "monthly": monthly,
+        "csum": csum,
+        "ccount": ccount,
+    }
+
+class UnknownDistrict(LookupError):
+    pass
+
+def season_window(season=None, start_month=None, end_month=None):
+    if start_month is not None or end_month is not None:
+        start, end = int(start_month or 1), int(end_month or 12)
+    else:
+        season = (season or DEFAULT_SEASON).strip().lower()
+        if season not in SEASONS:
+            raise ValueError(f"Unknown season: {season} (expected one of {', '.join(SEASONS)})")
+        start, end = SEASONS[season]
+    if not (1 <= start <= 12 and 1 <= end <= 12):
+        raise ValueError("Months must be between 1 and 12")
+    return start, end
+
+def lookup_rainfall(cube, state, district, start, end):
+    # O(1): two prefix-sum reads (four when the window wraps past December)
+    i = cube["rows"].get((str(state).strip(), str(district).strip()))
+    if i is None:
+        raise UnknownDistrict(f"Unknown district: {state} / {district}")
+    cs, cc = cube["csum"][i], cube["ccount"][i]
+    if start <= end:
+        total, count = cs[end] - cs[start - 1], cc[end] - cc[start - 1]
     else:
-        print("❌ data2.csv not found")
-except Exception as e:
-    print(f"⚠️ Error loading CSV: {e}")
+        total = (cs[12] - cs[start - 1]) + cs[end]
+        count = (cc[12] - cc[start - 1]) + cc[end]
+    if count == 0:
+        raise UnknownDistrict(f"No rainfall data for {state} / {district} in months {start}-{end}")
+    return float(total / count), float(total), int(count)
+
+def load_rainfall():
+    _require(RAIN_CSV)
+    df_rain = read_table(RAIN_CSV)
+    df_rain.columns = [c.strip() for c in df_rain.columns]
+    state_col = next(c for c in df_rain.columns if "state" in c.lower())
+    dist_col = next(c for c in df_rain.columns if "district" in c.lower())
+    for col in (state_col, dist_col):
+        # The columnar cache already stores these stripped, as categoricals
+        if not isinstance(df_rain[col].dtype, pd.CategoricalDtype):
+            df_rain[col] = df_rain[col].astype(str).str.strip()
+
+    index = build_state_index(df_rain, state_col, dist_col)
+    return {
+        "df": df_rain,
+        "state_col": state_col,
+        "dist_col": dist_col,
+        "index": index,
+        "cube": build_rainfall_cube(df_rain, state_col, dist_col),
+        "states_json": _json_bytes({"states": list(index),
+                                    "mapping": {s: list(d) for s, d in index.items()}}),
+        "districts_json": MappingProxyType({s: _json_bytes({"districts": list(d)}) for s, d in index.items()}),
+    }
+
+# --- Smoke checks: a new artifact must predict sensibly before it is served ---
+# Store exports are checked against the pickle's output recorded at export time
+# (their "model" is only loaded for large batches); pickles against their compiled trees.
+def _check_reference(model, reference):
+    try:
+        model_store.check_reference(model, reference)
+    except model_store.StoreError as e:
+        raise ValueError(str(e))
+
+def check_crop(crop):
+    x = np.array([[90, 42, 43, 20.9, 82.0, 6.5, 202.9]], dtype=np.float64)
+    if "reference" in crop:
+        _check_reference(crop["native"], crop["reference"])
+        crop["le"].inverse_transform(crop["native"].predict(x))
+        return
+    pred = crop["model"].predict(x)
+    crop["le"].inverse_transform(pred)
+    if crop["native"] is not None and crop["native"].predict(x)[0] != pred[0]:
+        raise ValueError("native tree ensemble disagrees with XGBoost")
+
+def check_crop_cascade(cheap):
+    probs = cheap["model"].predict_proba(np.array([[90, 42, 43, 20.9, 82.0, 6.5, 202.9]], dtype=np.float64))
+    if probs.shape != (1, len(cheap["le"].classes_)):
+        raise ValueError("cascade model does not match the crop label encoder")
+
+def check_fertilizer(fert):
+    row = [0.0 if col in ("soil_enc", "crop_enc") else 30.0 for col in fert["feature_order"]]
+    if "reference" in fert:
+        _check_reference(fert["native"], fert["reference"])
+        fert["label_enc"].inverse_transform(fert["native"].predict(np.array([row])))
+        return
+    pred = fert["model"].predict(np.array([row]))
+    fert["label_enc"].inverse_transform(pred)
+    if fert["native"] is not None and fert["native"].predict(np.array([row]))[0] != pred[0]:
+        raise ValueError("native tree ensemble disagrees with XGBoost")
+
+def check_suitability_model(suit):
+    if "reference" in suit:
+        _check_reference(suit["model"], suit["reference"])
+    probs = suit["model"].predict_proba(np.array([[25.0, 70.0, 100.0]]))[0]
+    if len(probs) != len(suit["le"].classes_) or not np.isclose(probs.sum(), 1.0):
+        raise ValueError("suitability model does not match its label encoder")
+
+def check_rainfall(rain):
+    if not rain["index"]:
+        raise ValueError("no states found in rainfall data")
+
+def _store_manifest(name):
+    return os.path.join(MODEL_STORE_DIR, name, model_store.MANIFEST)
+
+registry = ModelRegistry()
+registry.register("crop", load_crop, required="crop" in REQUIRED_MODELS,
+                  check=check_crop, watch=[CROP_MODEL_PATH, CROP_LE_PATH, _store_manifest("crop")])
+if CROP_CASCADE:
+    registry.register("crop_cascade", load_crop_cascade, required="crop" in REQUIRED_MODELS,
+                      check=check_crop_cascade, watch=[os.path.join(BASE_DIR, ZOO[CROP_CASCADE]), CROP_LE_PATH])
+registry.register("fertilizer", load_fertilizer, required="fertilizer" in REQUIRED_MODELS,
+                  check=check_fertilizer, watch=[FERT_PIPE_PATH, FERT_LE_PATH, _store_manifest("fertilizer")])
+registry.register("suitability", load_suitability, required="suitability" in REQUIRED_MODELS,
+                  check=check_suitability_model,
+                  watch=[SUITABILITY_MODEL_PATH, SUITABILITY_LE_PATH, SUITABILITY_GRID_PREFIX + ".npy",
+                         SUITABILITY_GRID_PREFIX + ".mask.npy", _store_manifest("suitability")])
+registry.register("rainfall", load_rainfall, required="rainfall" in REQUIRED_MODELS,
+                  check=check_rainfall, watch=[RAIN_CSV, cache_path(RAIN_CSV)])
+
+def get_or_none(name):
+    try:
+        return registry.get(name)
+    except ModelUnavailable:
+        return None
+
+def get_with_version(name):
+    try:
+        return registry.get_versioned(name)
+    except ModelUnavailable:
+        return None, None
+
+# --- Prediction caches, emptied whenever their model is reloaded ---
+CACHES = {name: PredictionCache(name, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DIGITS)
+          for name in ("crop", "fertilizer", "suitability")}
+
+def _invalidate_cache(name, version):
+    if name == "crop_cascade":
+        name = "crop"
+    if name in CACHES:
+        CACHES[name].clear()
+
+registry.on_reload(_invalidate_cache)
+
+# --- Metrics (served on /metrics in the Prometheus text format) ---
+REQUESTS = metrics.Counter("http_requests_total", "HTTP requests by route, method and status",
+                           ["route", "method", "status"])
+REQUEST_ERRORS = metrics.Counter("http_request_errors_total",
+                                 "Requests answered with a 4xx/5xx status or an error payload", ["route"])
+REQUEST_SECONDS = metrics.Histogram("http_request_duration_seconds", "Request latency by route", ["route"])
+CASCADE_ANSWERS = metrics.Counter("crop_cascade_answers_total",
+                                  "Crop predictions by the cascade stage that answered", ["stage"])
+STAGE_SECONDS = metrics.Histogram("inference_stage_seconds",
+                                  "Time per request stage: json_parse, validate, encode, predict, inverse_transform, serialize",
+                                  ["service", "stage"], buckets=metrics.STAGE_BUCKETS)
+
+TELEMETRY_READINGS = metrics.Counter("telemetry_readings_total",
+                                     "IoT readings received, by whether they were stored", ["result"])
+IRRIGATION_COMMANDS = metrics.Counter("irrigation_commands_total",
+                                      "Gate switches decided, and switches held back by the rate limits",
+                                      ["command"])
+
+def _collect_app_metrics():
+    yield ("prediction_cache_hits_total", "counter", "Prediction cache hits",
+           [({"cache": n}, c.hits) for n, c in CACHES.items()])
+    yield ("prediction_cache_misses_total", "counter", "Prediction cache misses",
+           [({"cache": n}, c.misses) for n, c in CACHES.items()])
+    yield ("prediction_cache_entries", "gauge", "Entries currently cached",
+           [({"cache": n}, len(c)) for n, c in CACHES.items()])
+    status = registry.status()
+    yield ("model_loaded", "gauge", "1 when the model is loaded and serving",
+           [({"model": n}, int(s["state"] == "loaded")) for n, s in status.items()])
+    yield ("model_version", "gauge", "Number of successful loads of the model",
+           [({"model": n}, s["version"] or 0) for n, s in status.items()])
+    yield ("telemetry_devices", "gauge", "Devices with readings in the telemetry store",
+           [({}, len(telemetry))])
+    if _irrigation is not None:
+        yield ("irrigation_gates_open", "gauge", "Gates currently commanded open",
+               [({}, _irrigation.stats()["open"])])
+    if BATCHERS:
+        yield ("microbatch_batches_total", "counter", "Batches run by the micro-batcher",
+               [({"model": n}, b.batches) for n, b in BATCHERS.items()])
+        yield ("microbatch_items_total", "counter", "Rows scored through the micro-batcher",
+               [({"model": n}, b.items) for n, b in BATCHERS.items()])
+
+metrics.add_collector(_collect_app_metrics)
+
+# --- IoT telemetry: per-device ring buffers, filled by /api/telemetry ---
+telemetry = TelemetryStore(TELEMETRY_CAPACITY, TELEMETRY_MAX_DEVICES)
+history = RollupStore(TELEMETRY_ROLLUP_DIR) if TELEMETRY_ROLLUP_DIR else None
+if history is not None:
+    telemetry.on_append(history.append)
+
+# Set by disable_telemetry(): the reason the IoT routes answer 503
+TELEMETRY_DISABLED = None
+IOT_ROUTE_PREFIXES = ("/api/telemetry", "/api/irrigation", "/api/suitability/stream")
+
+def disable_telemetry(reason):
+    # The telemetry store, rollup writer, gate engine and stream hub live in process
+    # memory. prefork_server.py calls this before forking several workers, where each
+    # would see a slice of the devices and all would append to the same rollup files.
+    global TELEMETRY_DISABLED, history
+    TELEMETRY_DISABLED = reason
+    history = None
+
+# --- Irrigation gates: fleet-wide decisions over the newest telemetry readings ---
+# Built on first use (it reads Fertilizer Prediction.csv), not at import
+_irrigation = None
+_irrigation_lock = threading.Lock()
+
+def get_irrigation():
+    global _irrigation
+    if _irrigation is None:
+        with _irrigation_lock:
+            if _irrigation is None:
+                engine = GateEngine(min_switch_seconds=IRRIGATION_MIN_SWITCH_SECONDS,
+                                    max_switches_per_hour=IRRIGATION_MAX_SWITCHES_PER_HOUR,
+                                    stale_seconds=IRRIGATION_STALE_SECONDS)
+                if IRRIGATION_FIELDS:
+                    engine.set_fields(load_fields(IRRIGATION_FIELDS))
+                _irrigation = engine
+    return _irrigation
+
+# --- Live suitability: rescored from the telemetry feed, pushed over SSE ---
+def score_suitability_rows(X, crops):
+    suit = get_or_none("suitability")
+    if suit is None:
+        return [{"error": "Suitability model unavailable"}] * len(X)
+    probs = predict_proba(suit["grid"], suit["model"], X)
+    return [describe_suitability(p, suit["le"], crop) for p, crop in zip(probs, crops)]
+
+suitability_hub = StreamHub(score_suitability_rows,
+                            (SUITABILITY_STREAM_DELTA_TEMPERATURE, SUITABILITY_STREAM_DELTA_HUMIDITY),
+                            SUITABILITY_STREAM_DEBOUNCE_SECONDS)
+telemetry.on_append(suitability_hub.on_append)
+
+def start_telemetry_feed():
+    if TELEMETRY_FEED_FILE:
+        threading.Thread(target=follow_records, args=(telemetry, TELEMETRY_FEED_FILE),
+                         name="telemetry-feed", daemon=True).start()
+        print(f"✅ Following {TELEMETRY_FEED_FILE} for telemetry")
+
+# --- Row scoring shared by the single-row, micro-batched and batch paths ---
+def _scorer(bundle, n_rows):
+    if bundle["native"] is not None and n_rows <= NATIVE_MAX_ROWS:
+        return bundle["native"]
+    return bundle["model"]
+
+def predict_crop_rows(crop, X):
+    with STAGE_SECONDS.time("crop", "predict"):
+        idx = _scorer(crop, len(X)).predict(X)
+    with STAGE_SECONDS.time("crop", "inverse_transform"):
+        return crop["le"].inverse_transform(idx)
+
+def predict_fertilizer_rows(fert, X):
+    with STAGE_SECONDS.time("fertilizer", "predict"):
+        idx = _scorer(fert, len(X)).predict(X)
+    with STAGE_SECONDS.time("fertilizer", "inverse_transform"):
+        return fert["label_enc"].inverse_transform(idx)
+
+BATCHERS = {}
+if MICROBATCH:
+    BATCHERS["crop"] = MicroBatcher("crop", predict_crop_rows, MICROBATCH_MAX_BATCH, MICROBATCH_MAX_WAIT_MS)
+    BATCHERS["fertilizer"] = MicroBatcher("fertilizer", predict_fertilizer_rows,
+                                          MICROBATCH_MAX_BATCH, MICROBATCH_MAX_WAIT_MS)
+
+def predict_one(name, bundle, row):
+    # Goes through the micro-batcher when enabled, otherwise scores the row directly
+    if name in BATCHERS:
+        # Runs on the batcher thread: queue wait and decoding count as predict here
+        with metrics.span("predict"):
+            return BATCHERS[name].submit(bundle, row)
+    rows_fn = predict_crop_rows if name == "crop" else predict_fertilizer_rows
+    return rows_fn(bundle, np.array([row], dtype=np.float64))[0]
+
+def score_crop(crop, x):
+    # Returns (crop name, model that answered), trying the cascade's cheap model first
+    cheap = get_or_none("crop_cascade") if CROP_CASCADE else None
+    if cheap is not None:
+        with STAGE_SECONDS.time("crop", "cascade"):
+            probs = cheap["model"].predict_proba(np.array([x], dtype=np.float64))[0]
+        i = int(probs.argmax())
+        if probs[i] >= CROP_CASCADE_THRESHOLD:
+            CASCADE_ANSWERS.inc(CROP_CASCADE)
+            return str(cheap["le"].classes_[i]), CROP_CASCADE
+        CASCADE_ANSWERS.inc(CROP_MODEL)
+    return predict_one("crop", crop, x), CROP_MODEL
 
 
 # ==========================================
 # 4. ROUTES
 # ==========================================
 
+@app.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+
+@app.before_request
+def _check_telemetry_enabled():
+    if TELEMETRY_DISABLED and request.path.startswith(IOT_ROUTE_PREFIXES):
+        return jsonify({"error": TELEMETRY_DISABLED}), 503
+
+@app.after_request
+def _record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUESTS.inc(route, request.method, str(response.status_code))
+    if response.status_code >= 400 or g.get("failed"):
+        REQUEST_ERRORS.inc(route)
+    if "started" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.started, route)
+    return response
+
+def _timing_requested():
+    return ALLOW_TIMING and (request.headers.get("X-Timing") == "1" or request.args.get("timing") == "1")
+
+def _dump_profile(profiler, name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.getrandbits(24):06x}.prof")
+    profiler.dump_stats(path)
+
+def _note_cache(value):
+    trace = metrics.current_trace()
+    if trace is not None:
+        trace.notes["cache"] = "miss" if value is MISS else "hit"
+
+def _serve(name, service):
+    # Parses the JSON body, runs the service and serializes the answer. Notes error
+    # payloads for the metrics and, when asked for, returns the stage timings.
+    trace = metrics.start_trace() if _timing_requested() else None
+    profiler = cProfile.Profile() if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with STAGE_SECONDS.time(name, "json_parse"):
+            data = request.get_json()
+        body, status = service(data)
+        with STAGE_SECONDS.time(name, "serialize"):
+            response = jsonify(body)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(profiler, name)
+        metrics.end_trace()
+    if "error" in body:
+        g.failed = True
+    if trace is not None:
+        # serialize was measured on the payload without this block
+        timing = trace.as_ms()
+        timing["total"] = round((time.perf_counter() - g.started) * 1000, 3)
+        timing.update(trace.notes)
+        response = jsonify({**body, "timing": timing})
+        response.headers["Server-Timing"] = ", ".join(
+            f"{k};dur={v}" for k, v in timing.items() if isinstance(v, float))
+    return response, status
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -111,115 +671,522 @@ def fertilizer_page():
 # 5. API ROUTES
 # ==========================================
 
-@app.route("/meta", methods=["GET"])
-def meta():
+# Each API is a plain function of the parsed request returning (payload, status),
+# so the Flask routes here and the async server in asgi_app.py share one code path.
+
+def meta_service():
     # Helper to prevent crash if models aren't loaded
-    c_classes = list(crop_le.classes_) if crop_le else []
-    fc_classes = list(crop_le_f.classes_) if 'crop_le_f' in globals() else []
-    s_types = list(soil_le.classes_) if 'soil_le' in globals() else []
-    f_order = feature_order if 'feature_order' in globals() else []
-    
-    return jsonify({
+    crop = get_or_none("crop")
+    fert = get_or_none("fertilizer")
+    c_classes = list(crop["le"].classes_) if crop else []
+    fc_classes = list(fert["crop_le"].classes_) if fert else []
+    s_types = list(fert["soil_le"].classes_) if fert else []
+    f_order = fert["feature_order"] if fert else []
+
+    return {
+        "crop_model": CROP_MODEL,
+        "crop_cascade": {"model": CROP_CASCADE, "threshold": CROP_CASCADE_THRESHOLD} if CROP_CASCADE else None,
         "crop_classes": c_classes,
         "fert_crop_classes": fc_classes,
         "soil_types": s_types,
         "feature_order": f_order
-    })
+    }, 200
+
+def states_body():
+    rain = get_or_none("rainfall")
+    return rain["states_json"] if rain else EMPTY_STATES_JSON
+
+def districts_body(state):
+    rain = get_or_none("rainfall")
+    return rain["districts_json"].get(state, EMPTY_DISTRICTS_JSON) if rain else EMPTY_DISTRICTS_JSON
+
+@app.route("/meta", methods=["GET"])
+def meta():
+    body, status = meta_service()
+    return jsonify(body), status
 
 @app.route("/states", methods=["GET"])
 def get_states():
-    if 'df_rain' not in globals(): return jsonify({"states": [], "mapping": {}})
-    mapping = {}
-    states = sorted(df_rain[STATE_COL].unique().tolist())
-    for s in states:
-        dists = df_rain[df_rain[STATE_COL] == s][DIST_COL].unique().tolist()
-        mapping[s] = sorted(dists)
-    return jsonify({"states": states, "mapping": mapping})
+    return Response(states_body(), mimetype="application/json")
 
 @app.route("/districts/<state>", methods=["GET"])
 def get_districts(state):
-    if 'df_rain' not in globals(): return jsonify({"districts": []})
-    dists = df_rain[df_rain[STATE_COL] == state][DIST_COL].unique().tolist()
-    return jsonify({"districts": sorted(dists)})
+    return Response(districts_body(state), mimetype="application/json")
+
+# --- Rainfall auto-fill for a district and season window ---
+@app.route("/rainfall", methods=["GET"])
+def get_rainfall():
+    rain = get_or_none("rainfall")
+    if rain is None: return jsonify({"error": "Rainfall data not loaded"}), 503
+    state = request.args.get("state", "")
+    district = request.args.get("district", "")
+    try:
+        start, end = season_window(request.args.get("season"),
+                                   request.args.get("start_month"), request.args.get("end_month"))
+        mean, total, months = lookup_rainfall(rain["cube"], state, district, start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownDistrict as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({
+        "state": state, "district": district,
+        "start_month": start, "end_month": end,
+        "rainfall": round(mean, 2),        # mean monthly rainfall (mm), the crop model's scale
+        "total": round(total, 2),          # total over the window (mm)
+        "months": months
+    })
+
+# --- Health checks ---
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Kick off a background warmup on the first probe (e.g. under gunicorn)
+    registry.warm(background=True)
+    ready = registry.ready()
+    return jsonify({"ready": ready, "models": registry.status()}), (200 if ready else 503)
+
+# --- Prediction cache counters ---
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({name: cache.stats() for name, cache in CACHES.items()})
+
+# --- Micro-batching counters (batch sizes, queue wait) ---
+@app.route("/microbatch/stats", methods=["GET"])
+def microbatch_stats():
+    return jsonify({"enabled": MICROBATCH, "endpoints": {n: b.stats() for n, b in BATCHERS.items()}})
+
+# --- Admin: hot model reload ---
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    if ADMIN_TOKEN:
+        if request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+            return jsonify({"error": "Forbidden"}), 403
+    elif request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    names = data.get("models") or registry.names()
+    unknown = [n for n in names if n not in registry.names()]
+    if unknown:
+        return jsonify({"error": f"Unknown models: {', '.join(unknown)}"}), 400
+
+    # Loads run here, on the admin request; prediction requests keep using
+    # the current artifacts until each new one passes its smoke check.
+    results, ok = {}, True
+    for name in names:
+        try:
+            results[name] = {"reloaded": True, "version": registry.reload(name)}
+        except ModelUnavailable as e:
+            ok = False
+            results[name] = {"reloaded": False, "version": registry.version(name), "error": e.reason}
+    return jsonify({"models": results}), (200 if ok else 409)
 
 # --- 1. CROP PREDICTION API ---
+def crop_service(data):
+    crop, version = get_with_version("crop")
+    if crop is None: return {"error": "Model not loaded"}, 503
+    try:
+        rainfall, autofilled = data.get("rainfall"), False
+        if rainfall in (None, "") and data.get("state") and data.get("district"):
+            rain = get_or_none("rainfall")
+            if rain is None: return {"error": "Rainfall data not loaded"}, 503
+            start, end = season_window(data.get("season"), data.get("start_month"), data.get("end_month"))
+            rainfall = lookup_rainfall(rain["cube"], data["state"], data["district"], start, end)[0]
+            autofilled = True
+        if rainfall in (None, ""):
+            return {"error": "Provide rainfall, or state and district to auto-fill it"}, 200
+
+        cache = CACHES["crop"]
+        with STAGE_SECONDS.time("crop", "validate"):
+            values = [float(data["N"]), float(data["P"]), float(data["K"]),
+                      float(data["temperature"]), float(data["humidity"]),
+                      float(data["ph"]), float(rainfall)]
+        with STAGE_SECONDS.time("crop", "encode"):
+            key = (version, cache.key_for(values))
+        answer = cache.get(key)
+        _note_cache(answer)
+        if answer is MISS:
+            answer = score_crop(crop, values)
+            cache.put(key, answer)
+        crop_name, stage = answer
+        out = {"recommended_crop": crop_name}
+        if CROP_CASCADE:
+            out["stage"] = stage
+        if autofilled:
+            out["rainfall"] = round(float(rainfall), 2)
+        return out, 200
+    except UnknownDistrict as e:
+        return {"error": str(e)}, 200
+    except Exception as e:
+        return {"error": str(e)}, 200
+
 @app.route("/api/predict_crop", methods=["POST"])
 def predict_crop():
-    if crop_model is None: return jsonify({"error": "Model not loaded"})
-    data = request.json
-    try:
-        x = np.array([[float(data["N"]), float(data["P"]), float(data["K"]),
-                       float(data["temperature"]), float(data["humidity"]),
-                       float(data["ph"]), float(data["rainfall"])]])
-        pred = crop_model.predict(x)[0]
-        return jsonify({"recommended_crop": crop_le.inverse_transform([pred])[0]})
+    return _serve("crop", crop_service)
+
+# --- 1b. BATCH CROP PREDICTION API ---
+def _read_crop_batch():
+    # Accepts a CSV body (text/csv) or a JSON array of rows / {"rows": [...]}
+    if request.mimetype in ("text/csv", "application/csv"):
+        df = pd.read_csv(io.StringIO(request.get_data(as_text=True)))
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("rows")
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array of rows or a CSV body")
+        if not all(isinstance(r, dict) for r in data):
+            raise ValueError("Every row must be a JSON object")
+        df = pd.DataFrame(data)
+
+    # Match columns case-insensitively to the model's feature names
+    cols = {str(c).strip().lower(): c for c in df.columns}
+    missing = [f for f in CROP_FEATURES if f.lower() not in cols]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df[[cols[f.lower()] for f in CROP_FEATURES]].set_axis(CROP_FEATURES, axis=1)
+
+@app.route("/api/predict_crop_batch", methods=["POST"])
+def predict_crop_batch():
+    crop = get_or_none("crop")
+    if crop is None: return jsonify({"error": "Model not loaded"}), 503
+    try:
+        with STAGE_SECONDS.time("crop_batch", "json_parse"):
+            df = _read_crop_batch()
     except Exception as e:
-        return jsonify({"error": str(e)})
+        return jsonify({"error": str(e)}), 400
+
+    if len(df) == 0:
+        return jsonify({"count": 0, "results": []})
+    if len(df) > CROP_BATCH_MAX_ROWS:
+        return jsonify({"error": f"Batch too large: {len(df)} rows (max {CROP_BATCH_MAX_ROWS})"}), 413
+
+    # Validate every row in one pass and report all bad rows together
+    with STAGE_SECONDS.time("crop_batch", "encode"):
+        X = df.apply(pd.to_numeric, errors="coerce")
+        bad = X.isna() | ~np.isfinite(X)
+    if bad.values.any():
+        errors = [{"row": int(i), "invalid": [c for c in CROP_FEATURES if bad.at[i, c]]}
+                  for i in np.flatnonzero(bad.values.any(axis=1))]
+        return jsonify({"error": "Invalid rows", "errors": errors}), 400
+
+    try:
+        top_k = int(request.args.get("top_k", CROP_BATCH_DEFAULT_TOP_K))
+    except ValueError:
+        return jsonify({"error": "top_k must be an integer"}), 400
+    classes = crop["le"].classes_
+    top_k = max(1, min(top_k, len(classes)))
+
+    # One predict_proba call over the whole matrix
+    with STAGE_SECONDS.time("crop_batch", "predict"):
+        probs = _scorer(crop, len(X)).predict_proba(X.to_numpy(dtype=np.float64))
+    with STAGE_SECONDS.time("crop_batch", "inverse_transform"):
+        top_idx = np.argsort(-probs, axis=1)[:, :top_k]
+        top_conf = np.take_along_axis(probs, top_idx, axis=1)
+        top_names = classes[top_idx]
+
+    results = []
+    for names, conf in zip(top_names.tolist(), top_conf.tolist()):
+        results.append({
+            "recommended_crop": names[0],
+            "confidence": conf[0],
+            "top_k": [{"crop": n, "confidence": c} for n, c in zip(names, conf)]
+        })
+    return jsonify({"count": len(results), "results": results})
 
 # --- 2. FERTILIZER PREDICTION API ---
+def fertilizer_service(data):
+    fert, version = get_with_version("fertilizer")
+    if fert is None: return {"error": "Model not loaded"}, 503
+    try:
+        cache = CACHES["fertilizer"]
+        with STAGE_SECONDS.time("fertilizer", "validate"):
+            values = {k: float(data[k]) for k in ("N", "P", "K", "moisture", "temperature", "humidity")
+                      if k in data}
+        with STAGE_SECONDS.time("fertilizer", "encode"):
+            soil_enc = fert["soil_le"].transform([data["soil_type"]])[0]
+            crop_enc = fert["crop_le"].transform([data["crop"]])[0]
+
+            row = []
+            for col in fert["feature_order"]:
+                lc = col.lower()
+                if col == "soil_enc": row.append(soil_enc)
+                elif col == "crop_enc": row.append(crop_enc)
+                elif lc == "nitrogen": row.append(values["N"])
+                elif lc.startswith("phospho"): row.append(values["P"])
+                elif lc.startswith("potass"): row.append(values["K"])
+                elif lc == "moisture": row.append(values["moisture"])
+                elif lc == "temperature": row.append(values["temperature"])
+                elif lc == "humidity": row.append(values["humidity"])
+                else: row.append(0)
+            key = (version, cache.key_for(row))
+        fert_name = cache.get(key)
+        _note_cache(fert_name)
+        if fert_name is MISS:
+            fert_name = predict_one("fertilizer", fert, row)
+            cache.put(key, fert_name)
+        return {"fertilizer": fert_name}, 200
+    except Exception as e:
+        return {"error": str(e)}, 200
+
 @app.route("/predict_fertilizer", methods=["POST"])
 def predict_fertilizer():
-    if fert_model is None: return jsonify({"error": "Model not loaded"})
-    data = request.json
-    try:
-        soil_enc = soil_le.transform([data["soil_type"]])[0]
-        crop_enc = crop_le_f.transform([data["crop"]])[0]
-
-        row = []
-        for col in feature_order:
-            lc = col.lower()
-            if col == "soil_enc": row.append(soil_enc)
-            elif col == "crop_enc": row.append(crop_enc)
-            elif lc == "nitrogen": row.append(float(data["N"]))
-            elif lc.startswith("phospho"): row.append(float(data["P"]))
-            elif lc.startswith("potass"): row.append(float(data["K"]))
-            elif lc == "moisture": row.append(float(data["moisture"]))
-            elif lc == "temperature": row.append(float(data["temperature"]))
-            elif lc == "humidity": row.append(float(data["humidity"]))
-            else: row.append(0)
-
-        pred = fert_model.predict([row])[0]
-        return jsonify({"fertilizer": fert_label_enc.inverse_transform([pred])[0]})
-    except Exception as e:
-        return jsonify({"error": str(e)})
+    return _serve("fertilizer", fertilizer_service)
 
 # --- 3. SUITABILITY CHECKER API ---
-@app.route("/check_suitability", methods=["POST"])
-def check_suitability():
-    data = request.get_json() or {}
+def describe_suitability(probs, s_le, crop_val):
+    top_idxs = probs.argsort()[-3:][::-1]
+    top_list = []
+    for idx in top_idxs:
+        top_list.append({
+            "crop": s_le.inverse_transform([idx])[0],
+            "confidence": float(probs[idx])
+        })
+
+    is_suitable = False
+    classes = s_le.classes_
+    if crop_val in classes:
+        idx = np.where(classes == crop_val)[0][0]
+        if probs[idx] > 0.05:
+            is_suitable = True
+    return {"crop": crop_val, "isSuitable": is_suitable, "top_crops": top_list}
+
+def suitability_service(data):
+    data = data or {}
     crop_val = data.get("crop", "").strip().lower()
 
-    if s_model is not None and s_le is not None:
+    suit, version = get_with_version("suitability")
+    if suit is not None:
+        s_model, s_le = suit["model"], suit["le"]
         try:
-            temp = float(data.get("temperature", 0))
-            humid = float(data.get("humidity", 0))
-            rain = float(data.get("rainfall", 0))
-
-            X = np.array([[temp, humid, rain]])
-            probs = s_model.predict_proba(X)[0]
-            
-            top_idxs = probs.argsort()[-3:][::-1]
-            top_list = []
-            for idx in top_idxs:
-                top_list.append({
-                    "crop": s_le.inverse_transform([idx])[0],
-                    "confidence": float(probs[idx])
-                })
-
-            is_suitable = False
-            classes = s_le.classes_
-            if crop_val in classes:
-                idx = np.where(classes == crop_val)[0][0]
-                if probs[idx] > 0.05:
-                    is_suitable = True
+            cache = CACHES["suitability"]
+            with STAGE_SECONDS.time("suitability", "validate"):
+                values = [float(data.get("temperature", 0)), float(data.get("humidity", 0)),
+                          float(data.get("rainfall", 0))]
+            temp, humid, rain = values
+            with STAGE_SECONDS.time("suitability", "encode"):
+                key = (version, cache.key_for(values))
+            probs = cache.get(key)
+            _note_cache(probs)
+            if probs is MISS:
+                # Inputs in a served cell of the precomputed grid skip the forest
+                with STAGE_SECONDS.time("suitability", "predict"):
+                    probs = suit["grid"].lookup(temp, humid, rain) if suit["grid"] is not None else None
+                    if probs is None:
+                        probs = s_model.predict_proba(np.array([[temp, humid, rain]]))[0]
+                cache.put(key, probs)
             
-            return jsonify({"crop": crop_val, "isSuitable": is_suitable, "top_crops": top_list})
+            with STAGE_SECONDS.time("suitability", "inverse_transform"):
+                return describe_suitability(probs, s_le, crop_val), 200
         except Exception as e:
-            return jsonify({"error": "Prediction failed"}), 400
+            return {"error": "Prediction failed"}, 400
 
     # Fallback Mock
     mock_top = [{"crop": "rice", "confidence": 0.85}, {"crop": "maize", "confidence": 0.10}]
-    return jsonify({"crop": crop_val, "isSuitable": True, "top_crops": mock_top, "note": "Mock Data"})
+    return {"crop": crop_val, "isSuitable": True, "top_crops": mock_top, "note": "Mock Data"}, 200
+
+@app.route("/check_suitability", methods=["POST"])
+def check_suitability():
+    return _serve("suitability", suitability_service)
+
+# --- 4. IOT TELEMETRY API ---
+def _query_float(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, "") else None
+
+def _json_column(values):
+    # NaN (sensor did not report) becomes null
+    return [None if v != v else v for v in values.tolist()]
+
+def _device_forbidden():
+    return TELEMETRY_TOKEN and request.headers.get("X-Device-Token") != TELEMETRY_TOKEN
+
+@app.route("/api/telemetry", methods=["POST"])
+def ingest_telemetry():
+    # JSON batches, or packed telemetry.RECORD structs as application/octet-stream
+    if _device_forbidden():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        if request.mimetype == RECORD_CONTENT_TYPE:
+            accepted, dropped = telemetry.ingest_records(request.get_data())
+        else:
+            payload = request.get_json(silent=True)
+            if payload is None:
+                return jsonify({"error": "Invalid JSON body"}), 400
+            accepted, dropped = telemetry.ingest_json(payload)
+    except TelemetryError as e:
+        return jsonify({"error": str(e)}), 400
+    TELEMETRY_READINGS.inc("accepted", amount=accepted)
+    if dropped:
+        TELEMETRY_READINGS.inc("dropped", amount=dropped)
+    return jsonify({"accepted": accepted, "dropped": dropped})
+
+@app.route("/api/telemetry/devices", methods=["GET"])
+def telemetry_devices():
+    return jsonify({"devices": telemetry.devices(), **telemetry.stats()})
+
+@app.route("/api/telemetry/<device>/latest", methods=["GET"])
+def telemetry_latest(device):
+    try:
+        return jsonify({"device": device, **telemetry.latest(device)})
+    except UnknownDevice as e:
+        return jsonify({"error": str(e)}), 404
+
+@app.route("/api/telemetry/<device>", methods=["GET"])
+def telemetry_window(device):
+    # ?since=&until= (epoch seconds) or ?seconds=N (last N seconds), ?last=N readings,
+    # ?agg=1 for min/max/mean/count per field instead of the raw columns
+    try:
+        since, until = _query_float("since"), _query_float("until")
+        seconds = _query_float("seconds")
+        if seconds is not None:
+            since = time.time() - seconds
+        last = request.args.get("last")
+        ts, values = telemetry.window(device, since, until, int(last) if last else None)
+    except UnknownDevice as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError:
+        return jsonify({"error": "since, until, seconds and last must be numbers"}), 400
+
+    out = {"device": device, "count": len(ts)}
+    if request.args.get("agg") == "1":
+        counts = (~np.isnan(values)).sum(axis=0)
+        sums = np.nansum(values, axis=0, dtype=np.float64)
+        out["fields"] = {f: {"count": int(counts[i]),
+                             "min": float(np.nanmin(values[:, i])) if counts[i] else None,
+                             "max": float(np.nanmax(values[:, i])) if counts[i] else None,
+                             "mean": float(sums[i] / counts[i]) if counts[i] else None}
+                         for i, f in enumerate(FIELDS)}
+        if len(ts):
+            out["from"], out["to"] = float(ts[0]), float(ts[-1])
+        return jsonify(out)
+    out["ts"] = ts.tolist()
+    out.update({f: _json_column(values[:, i]) for i, f in enumerate(FIELDS)})
+    return jsonify(out)
+
+def _history_range():
+    # ?start=&end= epoch seconds, or ?hours=N back from now (default 24)
+    end = _query_float("end") or time.time()
+    start = _query_float("start")
+    if start is None:
+        start = end - float(request.args.get("hours", 24)) * 3600
+    return start, end
+
+@app.route("/api/telemetry/<device>/history", methods=["GET"])
+def telemetry_history(device):
+    # Series from the rollups: the finest resolution that fits ?max_points buckets,
+    # or ?resolution=0|60|3600|86400
+    if history is None:
+        return jsonify({"error": "History is off (set TELEMETRY_ROLLUP_DIR)"}), 404
+    try:
+        start, end = _history_range()
+        resolution = request.args.get("resolution")
+        resolution, cols = history.series(device, start, end, int(request.args.get("max_points", 1000)),
+                                          int(resolution) if resolution else None)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"device": device, **columns_to_json(resolution, cols)})
+
+@app.route("/api/telemetry/<device>/summary", methods=["GET"])
+def telemetry_summary(device):
+    if history is None:
+        return jsonify({"error": "History is off (set TELEMETRY_ROLLUP_DIR)"}), 404
+    try:
+        start, end = _history_range()
+        return jsonify({"device": device, **history.summary(device, start, end)})
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# --- 5. IRRIGATION GATE API ---
+@app.route("/api/irrigation/fields", methods=["GET", "POST"])
+def irrigation_fields():
+    # POST [{"device", "crop", "rainfall", "open_below", "close_above"}, ...] or
+    # {"fields": [...], "replace": true} to drop the fields not listed
+    if request.method == "GET":
+        return jsonify({"fields": get_irrigation().fields()})
+    if _device_forbidden():
+        return jsonify({"error": "Forbidden"}), 403
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({"error": "Invalid JSON body"}), 400
+    try:
+        fields = parse_fields(payload)
+    except IrrigationError as e:
+        return jsonify({"error": str(e)}), 400
+    replace = isinstance(payload, dict) and payload.get("replace") is True
+    return jsonify({"updated": len(fields), "fields": get_irrigation().set_fields(fields, replace)})
+
+@app.route("/api/irrigation/decide", methods=["POST"])
+def irrigation_decide():
+    # One pass over the newest reading of every device; returns the gates to switch
+    if _device_forbidden():
+        return jsonify({"error": "Forbidden"}), 403
+    out = get_irrigation().evaluate(*telemetry.fleet(), suit=get_or_none("suitability"))
+    for command in ("open", "close", "held"):
+        if out[command]:
+            IRRIGATION_COMMANDS.inc(command, amount=len(out[command]))
+    return jsonify(out)
+
+@app.route("/api/irrigation/stats", methods=["GET"])
+def irrigation_stats():
+    return jsonify(get_irrigation().stats())
+
+@app.route("/api/irrigation/<device>", methods=["GET"])
+def irrigation_state(device):
+    # Commanded gate for one device (what its firmware should apply), as of the last pass
+    try:
+        return jsonify(get_irrigation().state(device))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
+# --- 6. LIVE SUITABILITY STREAM (Server-Sent Events) ---
+@app.route("/api/suitability/stream/<device>", methods=["GET"])
+def suitability_stream(device):
+    # ?crop= to check, ?rainfall= season rainfall in mm (defaults to the field's
+    # rainfall registered under /api/irrigation/fields). Sends the current score,
+    # then a new one whenever the device's temperature / humidity move enough.
+    field = get_irrigation().fields().get(device) or {}
+    crop = (request.args.get("crop") or field.get("crop") or "").strip().lower()
+    try:
+        rainfall = _query_float("rainfall")
+    except ValueError:
+        return jsonify({"error": "rainfall must be a number"}), 400
+    if rainfall is None:
+        rainfall = field.get("rainfall")
+    if rainfall is None or not np.isfinite(rainfall):
+        return jsonify({"error": "Give ?rainfall= or register the field's rainfall"}), 400
+    try:
+        seed = telemetry.latest(device)
+    except UnknownDevice:
+        seed = None
+    topic, q = suitability_hub.subscribe(device, crop, rainfall, seed)
+    return Response(sse_events(suitability_hub, topic, q), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/suitability/stream", methods=["GET"])
+def suitability_stream_stats():
+    return jsonify(suitability_hub.stats())
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    PORT = int(os.environ.get("PORT", 5000))
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # Bind first, then load models in the background. Under the debug reloader
+    # only the serving child process (WERKZEUG_RUN_MAIN) warms up; the watching
+    # parent never serves a request.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        registry.warm(background=True, wait_for_port=PORT)
+        if MODEL_WATCH_SECONDS > 0:
+            registry.start_watcher(MODEL_WATCH_SECONDS)
+        start_telemetry_feed()
+    app.run(debug=debug, port=PORT)
\ No newline at end of file
@@ -0,0 +1,219 @@
+# asgi_app.py
+# Async serving mode for the crop / fertilizer / suitability APIs.
+#
+# A plain ASGI application (no framework needed) exposing the same JSON routes
+# as app.py. Request parsing and responses stay on the event loop; model calls
+# go to a bounded thread pool, so one slow prediction or a large payload does
+# not stop the server from accepting and parsing other requests. When more
+# than INFERENCE_QUEUE_LIMIT calls are waiting, new ones get a 503 instead of
+# piling up.
+#
+#   python asgi_app.py                       # needs: pip install uvicorn
+#   uvicorn asgi_app:application --port 5000
+#
+# The HTML pages and static files are still served by the Flask app.
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as api
+import metrics
+
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", min(8, (os.cpu_count() or 1) + 2)))
+INFERENCE_QUEUE_LIMIT = int(os.environ.get("INFERENCE_QUEUE_LIMIT", 256))
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", 1 << 20))
+# Bodies larger than this are JSON-decoded off the event loop as well
+INLINE_PARSE_BYTES = 64 * 1024
+
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_slots = None
+
+JSON_HEADERS = [(b"content-type", b"application/json"),
+                (b"access-control-allow-origin", b"*")]
+
+
+def _get_slots():
+    # Created lazily so the semaphore binds to the running loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(INFERENCE_QUEUE_LIMIT)
+    return _slots
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def offload(fn, *args):
+    slots = _get_slots()
+    if slots.locked():
+        raise HTTPError(503, "Server busy, try again")
+    async with slots:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body too large (max {MAX_BODY_BYTES} bytes)")
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def read_json(receive, name):
+    body = await read_body(receive)
+    try:
+        if len(body) > INLINE_PARSE_BYTES:
+            return await offload(json.loads, body)
+        with api.STAGE_SECONDS.time(name, "json_parse"):
+            return json.loads(body or b"null")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+
+
+async def send_response(send, status, body, headers=JSON_HEADERS):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# --- Route handlers: (receive, path) -> (status, body bytes) ---
+
+async def meta(receive, path):
+    payload, status = await offload(api.meta_service)
+    return status, _dumps(payload)
+
+
+async def states(receive, path):
+    rain = api.registry.peek("rainfall")
+    body = rain["states_json"] if rain else await offload(api.states_body)
+    return 200, body
+
+
+async def districts(receive, path):
+    state = path[len("/districts/"):]          # ASGI paths arrive already percent-decoded
+    rain = api.registry.peek("rainfall")
+    if rain:
+        return 200, rain["districts_json"].get(state, api.EMPTY_DISTRICTS_JSON)
+    return 200, await offload(api.districts_body, state)
+
+
+def _post(name, service):
+    async def handler(receive, path):
+        data = await read_json(receive, name)
+        payload, status = await offload(service, data)
+        return status, _dumps(payload)
+    return handler
+
+
+async def metrics_endpoint(receive, path):
+    return 200, metrics.render().encode("utf-8")
+
+
+async def healthz(receive, path):
+    return 200, _dumps({"status": "ok"})
+
+
+async def readyz(receive, path):
+    api.registry.warm(background=True)
+    ready = api.registry.ready()
+    return (200 if ready else 503), _dumps({"ready": ready, "models": api.registry.status()})
+
+
+ROUTES = {
+    ("GET", "/meta"): meta,
+    ("GET", "/states"): states,
+    ("POST", "/api/predict_crop"): _post("crop", api.crop_service),
+    ("POST", "/predict_fertilizer"): _post("fertilizer", api.fertilizer_service),
+    ("POST", "/check_suitability"): _post("suitability", api.suitability_service),
+    ("GET", "/metrics"): metrics_endpoint,
+    ("GET", "/healthz"): healthz,
+    ("GET", "/readyz"): readyz,
+}
+
+
+def resolve(method, path):
+    # Returns (handler, route label for the metrics)
+    if method == "HEAD":
+        method = "GET"
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler, path
+    if method == "GET" and path.startswith("/districts/"):
+        return districts, "/districts/<state>"
+    return None, "unmatched"
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            api.registry.warm(background=True)
+            if api.MODEL_WATCH_SECONDS > 0:
+                api.registry.start_watcher(api.MODEL_WATCH_SECONDS)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        # CORS preflight, matching flask_cors defaults on the Flask app
+        return await send_response(send, 204, b"", [
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+            (b"access-control-allow-headers", b"content-type"),
+        ])
+
+    started = time.perf_counter()
+    handler, route = resolve(method, path)
+    if handler is None:
+        status, body = 404, _dumps({"error": "Not found"})
+    else:
+        try:
+            status, body = await handler(receive, path)
+        except HTTPError as e:
+            status, body = e.status, _dumps({"error": e.message})
+        except Exception as e:
+            status, body = 500, _dumps({"error": str(e)})
+    headers = [(b"content-type", metrics.CONTENT_TYPE.encode()), JSON_HEADERS[1]] \
+        if route == "/metrics" else JSON_HEADERS
+    await send_response(send, status, b"" if method == "HEAD" else body, headers)
+
+    api.REQUESTS.inc(route, method, str(status))
+    if status >= 400 or body.startswith(b'{"error"'):
+        api.REQUEST_ERRORS.inc(route)
+    api.REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("asgi_app needs an ASGI server: pip install uvicorn")
+    uvicorn.run(application, host=os.environ.get("HOST", "127.0.0.1"),
+                port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,89 @@
+# bench_tree_ensemble.py
+# Checks that the compiled NumPy tree ensemble matches the pickled XGBoost
+# models and compares their latency.
+#
+#   python bench_tree_ensemble.py [--repeat 200] [--batch 2200]
+
+import argparse
+import os
+import pickle
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from tree_ensemble import compile_xgboost
+
+warnings.filterwarnings("ignore")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CROP_MODEL_PATH = os.path.join(BASE_DIR, "XGBoost.pkl")
+FERT_PIPE_PATH = os.path.join(BASE_DIR, "xgb_pipeline.pkl")
+CROP_CSV = os.path.join(BASE_DIR, "crop_recommendation.csv")
+FERT_CSV = os.path.join(BASE_DIR, "Fertilizer Prediction.csv")
+
+
+def time_call(fn, repeat):
+    # Returns (median, p95) wall time in microseconds
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return float(np.median(samples)), float(np.percentile(samples, 95))
+
+
+def fertilizer_matrix(pipeline):
+    df = pd.read_csv(FERT_CSV).rename(columns=lambda s: s.strip())
+    df = df.rename(columns={"Temparature": "Temperature"})
+    df["soil_enc"] = pipeline["soil_label_encoder"].transform(df["Soil Type"].astype(str))
+    df["crop_enc"] = pipeline["crop_label_encoder"].transform(df["Crop Type"].astype(str))
+    return df[pipeline["feature_order"]].to_numpy(dtype=np.float64)
+
+
+def compare(name, model, X, repeat, batch):
+    t0 = time.perf_counter()
+    ens = compile_xgboost(model)
+    compile_ms = (time.perf_counter() - t0) * 1e3
+
+    ref = model.predict_proba(X)
+    got = ens.predict_proba(X)
+    max_diff = float(np.abs(ref - got).max())
+    agree = float((ref.argmax(axis=1) == got.argmax(axis=1)).mean())
+
+    row = X[:1]
+    Xb = np.resize(X, (batch, X.shape[1]))
+    xgb_single = time_call(lambda: model.predict(row), repeat)
+    ens_single = time_call(lambda: ens.predict(row), repeat)
+    xgb_batch = time_call(lambda: model.predict(Xb), max(repeat // 10, 5))
+    ens_batch = time_call(lambda: ens.predict(Xb), max(repeat // 10, 5))
+
+    print(f"\n=== {name} ===")
+    print(f"trees={ens.num_trees} nodes={ens.num_nodes} max_depth={ens.max_depth} "
+          f"compile={compile_ms:.1f} ms")
+    print(f"max |proba diff| = {max_diff:.2e}   argmax agreement = {agree * 100:.2f}%")
+    print(f"{'':<20}{'xgboost':>14}{'numpy':>14}{'speedup':>10}")
+    for label, a, b in [("single row p50 us", xgb_single[0], ens_single[0]),
+                        ("single row p95 us", xgb_single[1], ens_single[1]),
+                        (f"batch {batch} p50 us", xgb_batch[0], ens_batch[0])]:
+        print(f"{label:<20}{a:>14.1f}{b:>14.1f}{a / b:>9.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=2200)
+    args = ap.parse_args()
+
+    crop_model = pickle.load(open(CROP_MODEL_PATH, "rb"))
+    X_crop = pd.read_csv(CROP_CSV)[["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]]
+    compare("crop (XGBoost.pkl)", crop_model, X_crop.to_numpy(dtype=np.float64), args.repeat, args.batch)
+
+    pipeline = pickle.load(open(FERT_PIPE_PATH, "rb"))
+    compare("fertilizer (xgb_pipeline.pkl)", pipeline["model"], fertilizer_matrix(pipeline),
+            args.repeat, args.batch)
+
+
+if __name__ == "__main__":
+    main()
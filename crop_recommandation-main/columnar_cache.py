@@ -0,0 +1,191 @@
+# columnar_cache.py
+# Compact binary copies of the CSV / Excel datasets, so the apps and CLIs don't
+# re-parse text (or open an .xlsx) on every start.
+#
+#   python columnar_cache.py build data2.csv rainfall_dataset_cleaned.csv
+#   python columnar_cache.py info data2.csv
+#
+#   df = read_table("data2.csv")   # cached copy when fresh, else the source file
+#
+# The cache sits next to the source as <name>.cols.npz (uncompressed, no
+# pickles): text columns are stored as categorical codes + stripped category
+# names, floats as float32 and integers in the smallest type that holds them.
+# A JSON header records the column order, the sha256 of the source and its
+# size and mtime; when the source changes the cache is ignored until it is
+# rebuilt. A read only stats the source: the sha256 is recomputed when the size
+# matches but the mtime moved (a copy or checkout of the same bytes), and each
+# signature that hashes clean is remembered for the life of the process.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+SUFFIX = ".cols.npz"
+
+# source path -> (size, mtime_ns) already verified against the cache's sha256
+_verified = {}
+
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + SUFFIX
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stat_signature(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def source_matches(path, header):
+    # Cheap stat check first; hash only when the stat no longer proves anything
+    sig = stat_signature(path)
+    if header.get("source_size") is not None and sig[0] != header["source_size"]:
+        return False
+    if sig == (header.get("source_size"), header.get("source_mtime_ns")) or _verified.get(path) == sig:
+        return True
+    if file_sha256(path) != header["source_sha256"]:
+        return False
+    _verified[path] = sig
+    return True
+
+
+def read_source(path):
+    if path.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def _int_dtype(values):
+    lo, hi = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return np.int64
+
+
+def build(path):
+    # Parses the source once and writes its columnar copy; returns the header
+    df = read_source(path)
+    arrays, columns = {}, []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        key = f"c{i}"
+        if pd.api.types.is_bool_dtype(col) or not pd.api.types.is_numeric_dtype(col):
+            cat = pd.Categorical(col.where(col.isna(), col.astype(str).str.strip()))
+            codes = cat.codes
+            arrays[key] = codes.astype(_int_dtype(codes))
+            arrays[key + "_categories"] = np.asarray(cat.categories, dtype=str)
+            kind = "category"
+        elif pd.api.types.is_integer_dtype(col):
+            arrays[key] = col.to_numpy().astype(_int_dtype(col.to_numpy()))
+            kind = "int"
+        else:
+            arrays[key] = col.to_numpy(dtype=np.float32)
+            kind = "float"
+        columns.append({"name": str(name), "key": key, "kind": kind})
+
+    size, mtime_ns = stat_signature(path)
+    header = {
+        "format_version": FORMAT_VERSION,
+        "source": os.path.basename(path),
+        "source_sha256": file_sha256(path),
+        "source_size": size,
+        "source_mtime_ns": mtime_ns,
+        "rows": int(len(df)),
+        "columns": columns,
+    }
+    out = cache_path(path)
+    tmp = out + ".tmp.npz"
+    np.savez(tmp, __header__=np.array(json.dumps(header)), **arrays)
+    os.replace(tmp, out)
+    return header
+
+
+def _read_header(npz):
+    header = json.loads(str(npz["__header__"]))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"unsupported cache format v{header.get('format_version')}")
+    return header
+
+
+def load_cached(path, check=True):
+    # DataFrame from the cache, or None when it is missing or stale
+    cpath = cache_path(path)
+    if not os.path.exists(cpath):
+        return None
+    with np.load(cpath, allow_pickle=False) as npz:
+        header = _read_header(npz)
+        if check and os.path.exists(path) and not source_matches(path, header):
+            return None
+        data = {}
+        for col in header["columns"]:
+            values = npz[col["key"]]
+            if col["kind"] == "category":
+                values = pd.Categorical.from_codes(values, npz[col["key"] + "_categories"])
+            data[col["name"]] = values
+    return pd.DataFrame(data, columns=[c["name"] for c in header["columns"]])
+
+
+def read_table(path):
+    # Cached copy when it matches the source, otherwise parses the source file
+    try:
+        df = load_cached(path)
+    except Exception as e:
+        print(f"⚠️ {os.path.basename(cache_path(path))} is unreadable ({e}); parsing {os.path.basename(path)}")
+        df = None
+    if df is not None:
+        return df
+    if os.path.exists(cache_path(path)):
+        print(f"⚠️ {os.path.basename(path)} changed since its cache was built; "
+              f"rebuild with: python columnar_cache.py build {os.path.basename(path)}")
+    return read_source(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build columnar binary caches of CSV / Excel datasets")
+    ap.add_argument("command", choices=["build", "info"])
+    ap.add_argument("paths", nargs="+")
+    args = ap.parse_args()
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"❌ {path} not found")
+            sys.exit(1)
+        if args.command == "build":
+            t0 = time.perf_counter()
+            header = build(path)
+            print(f"✅ {path} -> {cache_path(path)}: {header['rows']} rows, {len(header['columns'])} columns, "
+                  f"{os.path.getsize(cache_path(path)) / 1e3:.0f} kB in {time.perf_counter() - t0:.2f}s")
+            continue
+
+        t0 = time.perf_counter()
+        read_source(path)
+        source_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        df = load_cached(path)
+        cache_ms = (time.perf_counter() - t0) * 1000
+        if df is None:
+            state = "missing" if not os.path.exists(cache_path(path)) else "stale"
+            print(f"{path}: cache {state}; parsing the source takes {source_ms:.1f} ms")
+            continue
+        kinds = ", ".join(f"{c}:{str(t)}" for c, t in df.dtypes.items())
+        print(f"{path}: {len(df)} rows [{kinds}]; cache {cache_ms:.1f} ms vs source {source_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,37 @@
 # Combined training script for:
 #  - Crop model (crop_recommendation.csv) -> XGBoost.pkl, crop_label_encoder.pkl
 #  - Fertilizer model (Fertilizer Prediction.csv) -> xgb_pipeline.pkl, fertilizer_label_encoder.pkl
-#  - Saves cleaned rainfall CSV from data2.csv -> rainfall_dataset_cleaned.csv
+#  - Saves cleaned rainfall CSV from data2.csv -> rainfall_dataset_cleaned.csv (+ .cols.npz cache)
+#
+# The crop and fertilizer models train in parallel worker processes, each with
+# its own XGBoost thread budget. Every model is keyed by a hash of its input
+# CSV and its hyperparameters; when the key matches the last run the model is
+# skipped, and a key seen before is restored from the artifact store
+# (<out>/.artifacts/<key>/) instead of retrained.
+#
+#   python crop_recommendation.py                        # train what changed
+#   python crop_recommendation.py --out /tmp/models --jobs 2 --threads 4
+#   python crop_recommendation.py --only crop --force
+#
+# Search mode runs cross-validated trials with early stopping over depth,
+# learning rate and the tree-count cap, ranks them on accuracy and single-row
+# scoring latency, and (with --export) trains the pick under the usual names.
+# The pick is kept in <out>/tuned_params.json so later runs keep using it.
+#
+#   python crop_recommendation.py --search crop --trials 12 --export
 
 from __future__ import print_function
 import os, sys
+import argparse, hashlib, itertools, json, random, shutil, time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd, numpy as np, pickle, warnings
 warnings.filterwarnings("ignore")
 
 from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import accuracy_score, classification_report
 import xgboost as xgb
+import columnar_cache
 
 # Filenames used in your folder (from your screenshot)
 CROP_CSV = "crop_recommendation.csv"
@@ -24,175 +44,395 @@ OUT_CROP_LE = "crop_label_encoder.pkl"
 OUT_FERT_PIPE = "xgb_pipeline.pkl"
 OUT_FERT_LE = "fertilizer_label_encoder.pkl"
 OUT_RAIN = "rainfall_dataset_cleaned.csv"
+OUT_RAIN_CACHE = columnar_cache.cache_path(OUT_RAIN)   # what the apps load at startup
 
 RANDOM_STATE = 42
 TEST_SIZE = 0.2
 
+# Bump when the preparation code below changes in a way that alters the artifacts
+PIPELINE_VERSION = 2
+MANIFEST = "training_manifest.json"
+STORE_DIR = ".artifacts"
+TUNED_PARAMS = "tuned_params.json"
+
+# Hyperparameter search: n_estimators is the cap, early stopping picks the count
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 6, 8],
+    "learning_rate": [0.05, 0.1, 0.3],
+    "n_estimators": [100, 200, 400],
+}
+LATENCY_REPEAT = 300
+
+CROP_PARAMS = dict(
+    objective='multi:softprob', eval_metric='mlogloss',
+    n_estimators=200, tree_method='hist', random_state=RANDOM_STATE, verbosity=0
+)
+FERT_PARAMS = dict(
+    objective='multi:softprob', eval_metric='mlogloss',
+    n_estimators=200, tree_method='hist', random_state=RANDOM_STATE, verbosity=0
+)
+
 def ensure_exists(path):
     if not os.path.exists(path):
         print(f"ERROR: required file not found -> {path}")
         sys.exit(1)
 
-# -------------- check files --------------
-ensure_exists(CROP_CSV)
-ensure_exists(FERT_CSV)
-ensure_exists(RAIN_CSV)
-
-print("Loading datasets...")
-df_crop = pd.read_csv(CROP_CSV)
-df_fert = pd.read_csv(FERT_CSV)
-df_rain = pd.read_csv(RAIN_CSV)
-
-print("Shapes:", "crop:", df_crop.shape, "fert:", df_fert.shape, "rain:", df_rain.shape)
-
-# ------------------ CROP MODEL ------------------
-print("\n=== TRAINING CROP MODEL ===")
-# Expect columns: N, P, K, temperature, humidity, ph, rainfall, label
-# Normalize column names to exact lowercase canonical if necessary
-cols_lower = {c.lower(): c for c in df_crop.columns}
-expected = ['n','p','k','temperature','humidity','ph','rainfall','label']
-missing = [e for e in expected if e not in cols_lower]
-if missing:
-    print("Crop CSV missing columns:", missing)
-    # Try common mapping (if your column names are capitalized exactly it's OK already)
-    # If still missing, fail
-    # We will check the exact names present and abort if required columns not present
-    sys.exit(1)
-
-# Rename to canonical lower names for easy access
-df_crop = df_crop.rename(columns={cols_lower[k]: k for k in cols_lower if k in expected})
-# Ensure numeric types
-for c in ['n','p','k','temperature','humidity','ph','rainfall']:
-    df_crop[c] = pd.to_numeric(df_crop[c], errors='coerce')
-
-df_crop = df_crop.dropna(subset=['n','p','k','temperature','humidity','ph','rainfall','label']).reset_index(drop=True)
-print("Crop rows after dropna:", df_crop.shape[0])
-
-# Label encode crop labels
-crop_le = LabelEncoder()
-df_crop['label_enc'] = crop_le.fit_transform(df_crop['label'].astype(str))
-pickle.dump(crop_le, open(OUT_CROP_LE, "wb"))
-
-# Prepare X,y and split
-X_crop = df_crop[['n','p','k','temperature','humidity','ph','rainfall']].values
-y_crop = df_crop['label_enc'].astype(int).values
-
-Xc_train, Xc_test, yc_train, yc_test = train_test_split(
-    X_crop, y_crop, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_crop
-)
-
-crop_model = xgb.XGBClassifier(
-    objective='multi:softprob', eval_metric='mlogloss', use_label_encoder=False,
-    n_estimators=200, random_state=RANDOM_STATE, verbosity=0
-)
-print("Fitting crop model...")
-crop_model.fit(Xc_train, yc_train)
-yc_pred = crop_model.predict(Xc_test)
-print("Crop accuracy:", accuracy_score(yc_test, yc_pred))
-print(classification_report(yc_test, yc_pred, target_names=crop_le.classes_))
-pickle.dump(crop_model, open(OUT_CROP_MODEL, "wb"))
-print("Saved crop model and encoder:", OUT_CROP_MODEL, OUT_CROP_LE)
-
-# ------------------ FERTILIZER MODEL ------------------
-print("\n=== TRAINING FERTILIZER MODEL ===")
-# Clean fertilizer column names (strip whitespace)
-df_fert = df_fert.rename(columns=lambda s: s.strip() if isinstance(s, str) else s)
-
-# Normalize potential typos and map:
-# Observed columns in your uploaded file: 'Temparature', 'Humidity ', 'Moisture', 'Soil Type', 'Crop Type', 'Nitrogen', 'Potassium', 'Phosphorous', 'Fertilizer Name'
-# Map common variants to canonical names
-col_map = {}
-if 'Temparature' in df_fert.columns: col_map['Temparature'] = 'Temperature'
-if 'Humidity ' in df_fert.columns: col_map['Humidity '] = 'Humidity'
-if 'Phosphorous' in df_fert.columns: col_map['Phosphorous'] = 'Phosphorous'
-df_fert = df_fert.rename(columns=col_map)
-
-# Required categorical columns
-req_cats = ['Soil Type','Crop Type','Fertilizer Name']
-for c in req_cats:
-    if c not in df_fert.columns:
-        print(f"ERROR: Fertilizer CSV missing required column: {c}")
-        sys.exit(1)
+# ------------------ data preparation ------------------
+def prepare_crop(df_crop):
+    # Expect columns: N, P, K, temperature, humidity, ph, rainfall, label
+    # Normalize column names to exact lowercase canonical if necessary
+    cols_lower = {c.lower(): c for c in df_crop.columns}
+    expected = ['n','p','k','temperature','humidity','ph','rainfall','label']
+    missing = [e for e in expected if e not in cols_lower]
+    if missing:
+        raise ValueError(f"Crop CSV missing columns: {missing}")
+
+    # Rename to canonical lower names for easy access
+    df_crop = df_crop.rename(columns={cols_lower[k]: k for k in cols_lower if k in expected})
+    # Ensure numeric types
+    for c in ['n','p','k','temperature','humidity','ph','rainfall']:
+        df_crop[c] = pd.to_numeric(df_crop[c], errors='coerce')
+
+    df_crop = df_crop.dropna(subset=['n','p','k','temperature','humidity','ph','rainfall','label']).reset_index(drop=True)
+    print("Crop rows after dropna:", df_crop.shape[0])
+
+    # Label encode crop labels
+    crop_le = LabelEncoder()
+    y_crop = crop_le.fit_transform(df_crop['label'].astype(str)).astype(int)
+    X_crop = df_crop[['n','p','k','temperature','humidity','ph','rainfall']].values
+    return X_crop, y_crop, crop_le
+
+def prepare_fertilizer(df_fert):
+    # Clean fertilizer column names (strip whitespace)
+    df_fert = df_fert.rename(columns=lambda s: s.strip() if isinstance(s, str) else s)
+
+    # Map common variants to canonical names
+    col_map = {}
+    if 'Temparature' in df_fert.columns: col_map['Temparature'] = 'Temperature'
+    if 'Humidity ' in df_fert.columns: col_map['Humidity '] = 'Humidity'
+    df_fert = df_fert.rename(columns=col_map)
+
+    # Required categorical columns
+    for c in ['Soil Type','Crop Type','Fertilizer Name']:
+        if c not in df_fert.columns:
+            raise ValueError(f"Fertilizer CSV missing required column: {c}")
+
+    # Build fertilizer feature order:
+    fert_features = ['Soil Type','Crop Type']
+    if 'Moisture' in df_fert.columns:
+        fert_features.append('Moisture')
+    # Add nutrients in a preferred order if present
+    for nutrient in ['Nitrogen','Phosphorous','Potassium','N','P','K','Temperature','Humidity']:
+        if nutrient in df_fert.columns and nutrient not in fert_features:
+            fert_features.append(nutrient)
+    print("Final fertilizer feature order (readable):", fert_features)
+
+    # Drop rows with missing target
+    df_fert = df_fert.dropna(subset=['Fertilizer Name']).reset_index(drop=True)
+
+    # Encode categorical columns
+    soil_le = LabelEncoder()
+    crop_le_f = LabelEncoder()
+    fert_le = LabelEncoder()
+    df_fert['soil_enc'] = soil_le.fit_transform(df_fert['Soil Type'].astype(str))
+    df_fert['crop_enc'] = crop_le_f.fit_transform(df_fert['Crop Type'].astype(str))
+    df_fert['fert_enc'] = fert_le.fit_transform(df_fert['Fertilizer Name'].astype(str))
+
+    # Construct model input columns (replace Soil Type & Crop Type with encodings)
+    model_feature_cols = []
+    for f in fert_features:
+        if f == 'Soil Type':
+            model_feature_cols.append('soil_enc')
+        elif f == 'Crop Type':
+            model_feature_cols.append('crop_enc')
+        else:
+            model_feature_cols.append(f)
+
+    Xf = df_fert[model_feature_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+    y_f = df_fert['fert_enc'].values
+    encoders = {"soil": soil_le, "crop": crop_le_f, "fert": fert_le}
+    return Xf.values, y_f, encoders, model_feature_cols
+
+# ------------------ training tasks (run in worker processes) ------------------
+def train_crop(data_dir, out_dir, params, n_jobs):
+    X_crop, y_crop, crop_le = prepare_crop(pd.read_csv(os.path.join(data_dir, CROP_CSV)))
+    Xc_train, Xc_test, yc_train, yc_test = train_test_split(
+        X_crop, y_crop, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_crop
+    )
+    crop_model = xgb.XGBClassifier(n_jobs=n_jobs, **params)
+    t0 = time.perf_counter()
+    crop_model.fit(Xc_train, yc_train)
+    fit_s = time.perf_counter() - t0
+    yc_pred = crop_model.predict(Xc_test)
+
+    pickle.dump(crop_model, open(os.path.join(out_dir, OUT_CROP_MODEL), "wb"))
+    pickle.dump(crop_le, open(os.path.join(out_dir, OUT_CROP_LE), "wb"))
+    return {
+        "accuracy": float(accuracy_score(yc_test, yc_pred)),
+        "fit_seconds": round(fit_s, 2),
+        "report": classification_report(yc_test, yc_pred, target_names=crop_le.classes_),
+    }
+
+def train_fertilizer(data_dir, out_dir, params, n_jobs):
+    X_f, y_f, enc, model_feature_cols = prepare_fertilizer(pd.read_csv(os.path.join(data_dir, FERT_CSV)))
+    Xf_train, Xf_test, yf_train, yf_test = train_test_split(
+        X_f, y_f, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_f
+    )
+    fert_model = xgb.XGBClassifier(n_jobs=n_jobs, **params)
+    t0 = time.perf_counter()
+    fert_model.fit(Xf_train, yf_train)
+    fit_s = time.perf_counter() - t0
+    yf_pred = fert_model.predict(Xf_test)
+
+    # Save pipeline dict (encoders + model + feature order as model expects)
+    pipeline = {
+        "soil_label_encoder": enc["soil"],
+        "crop_label_encoder": enc["crop"],
+        "fert_label_encoder": enc["fert"],
+        "feature_order": model_feature_cols,   # e.g. ['soil_enc','crop_enc','Moisture','Nitrogen',...]
+        "model": fert_model
+    }
+    pickle.dump(pipeline, open(os.path.join(out_dir, OUT_FERT_PIPE), "wb"))
+    pickle.dump(enc["fert"], open(os.path.join(out_dir, OUT_FERT_LE), "wb"))
+    return {
+        "accuracy": float(accuracy_score(yf_test, yf_pred)),
+        "fit_seconds": round(fit_s, 2),
+        "report": classification_report(yf_test, yf_pred, target_names=enc["fert"].classes_),
+    }
+
+def export_rainfall(data_dir, out_dir, params, n_jobs):
+    pd.read_csv(os.path.join(data_dir, RAIN_CSV)).to_csv(os.path.join(out_dir, OUT_RAIN), index=False)
+    columnar_cache.build(os.path.join(out_dir, OUT_RAIN))
+    return {}
+
+# name -> (task, input CSV, hyperparameters, artifacts)
+TASKS = {
+    "crop": (train_crop, CROP_CSV, CROP_PARAMS, [OUT_CROP_MODEL, OUT_CROP_LE]),
+    "fertilizer": (train_fertilizer, FERT_CSV, FERT_PARAMS, [OUT_FERT_PIPE, OUT_FERT_LE]),
+    "rainfall": (export_rainfall, RAIN_CSV, {}, [OUT_RAIN, OUT_RAIN_CACHE]),
+}
 
-# Detect numeric nutrient columns available
-possible_numerics = ['Nitrogen','Phosphorous','Potassium','N','P','K','Moisture','Temperature','Humidity']
-present_numerics = [c for c in possible_numerics if c in df_fert.columns]
-print("Detected fertilizer numeric columns:", present_numerics)
-
-# Build fertilizer feature order:
-fert_features = ['Soil Type','Crop Type']
-if 'Moisture' in df_fert.columns:
-    fert_features.append('Moisture')
-# Add nutrients in a preferred order if present
-for nutrient in ['Nitrogen','Phosphorous','Potassium','N','P','K','Temperature','Humidity']:
-    if nutrient in df_fert.columns and nutrient not in fert_features:
-        fert_features.append(nutrient)
-
-print("Final fertilizer feature order (readable):", fert_features)
-
-# Drop rows with missing target
-df_fert = df_fert.dropna(subset=['Fertilizer Name']).reset_index(drop=True)
-
-# Encode categorical columns
-soil_le = LabelEncoder()
-crop_le_f = LabelEncoder()
-fert_le = LabelEncoder()
-
-df_fert['soil_enc'] = soil_le.fit_transform(df_fert['Soil Type'].astype(str))
-df_fert['crop_enc'] = crop_le_f.fit_transform(df_fert['Crop Type'].astype(str))
-df_fert['fert_enc'] = fert_le.fit_transform(df_fert['Fertilizer Name'].astype(str))
-pickle.dump(fert_le, open(OUT_FERT_LE, "wb"))
-
-# Construct model input columns (replace Soil Type & Crop Type with encodings)
-model_feature_cols = []
-for f in fert_features:
-    if f == 'Soil Type':
-        model_feature_cols.append('soil_enc')
-    elif f == 'Crop Type':
-        model_feature_cols.append('crop_enc')
+# ------------------ content-addressed artifact store ------------------
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def task_key(name, data_dir, params):
+    # Same CSV bytes + same hyperparameters + same library versions -> same key
+    _, csv, _, _ = TASKS[name]
+    spec = {
+        "task": name,
+        "pipeline_version": PIPELINE_VERSION,
+        "data_sha256": file_sha256(os.path.join(data_dir, csv)),
+        "params": params,
+        "xgboost": xgb.__version__,
+        "random_state": RANDOM_STATE,
+        "test_size": TEST_SIZE,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(out_dir, manifest):
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+def artifacts_match(out_dir, entry):
+    # The published files are exactly the ones recorded for this key
+    return all(os.path.exists(os.path.join(out_dir, a)) and file_sha256(os.path.join(out_dir, a)) == h
+               for a, h in entry.get("artifacts", {}).items())
+
+def publish(store, out_dir, artifacts):
+    # Copy to a temp name first so the apps never see a half-written artifact
+    for a in artifacts:
+        tmp = os.path.join(out_dir, a + ".tmp")
+        shutil.copyfile(os.path.join(store, a), tmp)
+        os.replace(tmp, os.path.join(out_dir, a))
+
+def run_task(name, data_dir, store, params, n_jobs):
+    task = TASKS[name][0]
+    os.makedirs(store, exist_ok=True)
+    t0 = time.perf_counter()
+    result = task(data_dir, store, params, n_jobs)
+    result["seconds"] = round(time.perf_counter() - t0, 2)
+    return result
+
+# ------------------ pipeline ------------------
+def run_pipeline(data_dir, out_dir, names, jobs, threads, force=False, overrides=None):
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    overrides = overrides or {}
+
+    pending = {}
+    for name in names:
+        _, csv, params, artifacts = TASKS[name]
+        ensure_exists(os.path.join(data_dir, csv))
+        params = dict(params, **overrides.get(name, {}))
+        key = task_key(name, data_dir, params)
+        store = os.path.join(out_dir, STORE_DIR, key)
+        entry = manifest.get(name, {})
+
+        if not force and entry.get("key") == key and artifacts_match(out_dir, entry):
+            print(f"✅ {name}: unchanged (key {key}), skipping")
+            continue
+        if not force and all(os.path.exists(os.path.join(store, a)) for a in artifacts):
+            publish(store, out_dir, artifacts)
+            manifest[name] = dict(entry, key=key, params=params, restored=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                  artifacts={a: file_sha256(os.path.join(out_dir, a)) for a in artifacts})
+            print(f"♻️ {name}: restored from the artifact store (key {key})")
+            continue
+        pending[name] = (key, store, params)
+
+    if pending:
+        jobs = max(1, min(jobs, len(pending)))
+        print(f"Training {', '.join(pending)} in {jobs} process(es), {threads} XGBoost thread(s) each")
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {name: pool.submit(run_task, name, data_dir, store, params, threads)
+                       for name, (key, store, params) in pending.items()}
+            for name, fut in futures.items():
+                key, store, params = pending[name]
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print(f"❌ {name} failed: {e}")
+                    continue
+                artifacts = TASKS[name][3]
+                publish(store, out_dir, artifacts)
+                if "report" in result:
+                    print(f"\n=== {name.upper()} MODEL === accuracy {result['accuracy']:.4f} "
+                          f"(fit {result['fit_seconds']}s)")
+                    print(result.pop("report"))
+                manifest[name] = dict(result, key=key, params=params,
+                                      trained=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                      artifacts={a: file_sha256(os.path.join(out_dir, a)) for a in artifacts})
+                print(f"Saved {name}: {', '.join(artifacts)} (key {key})")
+
+    save_manifest(out_dir, manifest)
+    return manifest
+
+# ------------------ hyperparameter search ------------------
+def load_xy(name, data_dir):
+    if name == "crop":
+        X, y, _ = prepare_crop(pd.read_csv(os.path.join(data_dir, CROP_CSV)))
     else:
-        model_feature_cols.append(f)
-
-# Validate model_feature_cols exist
-for col in model_feature_cols:
-    if col not in df_fert.columns and col not in ['soil_enc','crop_enc']:
-        print("Missing feature in fertilizer CSV:", col)
+        X, y, _, _ = prepare_fertilizer(pd.read_csv(os.path.join(data_dir, FERT_CSV)))
+    return train_test_split(X, y, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y)
+
+def single_row_latency_us(fn, X):
+    # Median microseconds per single-row call, the way the apps score requests
+    rows = [X[i:i + 1] for i in range(min(len(X), 50))]
+    samples = []
+    for i in range(LATENCY_REPEAT):
+        t0 = time.perf_counter()
+        fn(rows[i % len(rows)])
+        samples.append(time.perf_counter() - t0)
+    return round(float(np.median(samples)) * 1e6, 1)
+
+def run_trial(name, data_dir, trial, folds, early_stopping, n_jobs):
+    from tree_ensemble import compile_xgboost
+
+    X_tr, X_te, y_tr, y_te = load_xy(name, data_dir)
+    base = dict(TASKS[name][2], **trial)
+
+    # Cross-validation on the training split; early stopping on each fold's validation part
+    accs, iters = [], []
+    for tr, va in StratifiedKFold(folds, shuffle=True, random_state=RANDOM_STATE).split(X_tr, y_tr):
+        m = xgb.XGBClassifier(n_jobs=n_jobs, early_stopping_rounds=early_stopping, **base)
+        m.fit(X_tr[tr], y_tr[tr], eval_set=[(X_tr[va], y_tr[va])], verbose=False)
+        accs.append(accuracy_score(y_tr[va], m.predict(X_tr[va])))
+        iters.append(m.best_iteration + 1)
+
+    # Refit with the early-stopped tree count and time it the way the apps score
+    params = dict(trial, n_estimators=int(np.median(iters)))
+    model = xgb.XGBClassifier(n_jobs=n_jobs, **dict(base, **params))
+    model.fit(X_tr, y_tr)
+    try:
+        native = compile_xgboost(model)
+    except Exception as e:
+        # Ranked by XGBoost's own latency instead
+        print(f"⚠️ Native trees unavailable for {trial}: {e}")
+        native = None
+    X_te = np.asarray(X_te, dtype=np.float64)
+    return {
+        "trial": trial,
+        "params": params,
+        "cv_accuracy": round(float(np.mean(accs)), 4),
+        "cv_std": round(float(np.std(accs)), 4),
+        "holdout_accuracy": round(float(accuracy_score(y_te, model.predict(X_te))), 4),
+        "native_us": single_row_latency_us(native.predict_proba, X_te) if native is not None else None,
+        "xgboost_us": single_row_latency_us(model.predict_proba, X_te),
+        "model_kb": round(len(pickle.dumps(model)) / 1024, 1),
+    }
+
+def search_trials(n_trials, seed=RANDOM_STATE):
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(SEARCH_SPACE[k] for k in keys))]
+    if n_trials and n_trials < len(grid):
+        grid = random.Random(seed).sample(grid, n_trials)
+    return grid
+
+def rank_trials(results, tolerance):
+    # Among trials within `tolerance` of the best CV accuracy, the fastest to score wins
+    best = max(r["cv_accuracy"] for r in results)
+    latency = lambda r: r["native_us"] if r["native_us"] is not None else r["xgboost_us"]
+    ok = sorted((r for r in results if r["cv_accuracy"] >= best - tolerance), key=latency)
+    rest = sorted((r for r in results if r["cv_accuracy"] < best - tolerance),
+                  key=lambda r: (-r["cv_accuracy"], latency(r)))
+    return ok + rest
+
+def run_search(name, data_dir, out_dir, n_trials, folds, early_stopping, tolerance, jobs, threads):
+    trials = search_trials(n_trials)
+    print(f"Searching {name}: {len(trials)} trials, {folds}-fold CV, early stopping after {early_stopping} rounds, "
+          f"{jobs} process(es) x {threads} thread(s)")
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(run_trial, name, data_dir, t, folds, early_stopping, threads) for t in trials]
+        for fut in futures:
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                print(f"❌ trial failed: {e}")
+    if not results:
+        print("ERROR: every trial failed")
         sys.exit(1)
 
-Xf = df_fert[model_feature_cols].copy()
-# ensure numeric
-Xf = Xf.apply(pd.to_numeric, errors='coerce').fillna(0)
-y_f = df_fert['fert_enc'].values
-
-Xf_train, Xf_test, yf_train, yf_test = train_test_split(
-    Xf.values, y_f, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_f
-)
-
-fert_model = xgb.XGBClassifier(
-    objective='multi:softprob', eval_metric='mlogloss', use_label_encoder=False,
-    n_estimators=200, random_state=RANDOM_STATE, verbosity=0
-)
-print("Fitting fertilizer model...")
-fert_model.fit(Xf_train, yf_train)
-
-yf_pred = fert_model.predict(Xf_test)
-print("Fertilizer accuracy:", accuracy_score(yf_test, yf_pred))
-print(classification_report(yf_test, yf_pred, target_names=fert_le.classes_))
-
-# Save pipeline dict (encoders + model + feature order as model expects)
-pipeline = {
-    "soil_label_encoder": soil_le,
-    "crop_label_encoder": crop_le_f,
-    "fert_label_encoder": fert_le,
-    "feature_order": model_feature_cols,   # e.g. ['soil_enc','crop_enc','Moisture','Nitrogen',...]
-    "model": fert_model
-}
-pickle.dump(pipeline, open(OUT_FERT_PIPE, "wb"))
-print("Saved fertilizer pipeline and encoder:", OUT_FERT_PIPE, OUT_FERT_LE)
-
-# ------------------ save rainfall data ------------------
-df_rain.to_csv(OUT_RAIN, index=False)
-print("Saved rainfall lookup:", OUT_RAIN)
+    ranked = rank_trials(results, tolerance)
+    print(f"\n{'depth':>5} {'lr':>5} {'cap':>5} {'trees':>6} {'cv acc':>8} {'holdout':>8} "
+          f"{'native us':>10} {'xgb us':>8} {'KB':>7}")
+    for r in ranked:
+        t, p = r["trial"], r["params"]
+        print(f"{t['max_depth']:>5} {t['learning_rate']:>5} {t['n_estimators']:>5} {p['n_estimators']:>6} "
+              f"{r['cv_accuracy']:>8.4f} {r['holdout_accuracy']:>8.4f} {str(r['native_us']):>10} "
+              f"{r['xgboost_us']:>8} {r['model_kb']:>7}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, f"search_{name}.json"), "w") as f:
+        json.dump({"model": name, "tolerance": tolerance, "folds": folds,
+                   "early_stopping_rounds": early_stopping, "ranked": ranked}, f, indent=2)
+    best = ranked[0]
+    print(f"\nPicked {best['params']} (cv {best['cv_accuracy']}, native {best['native_us']} us)")
+    return best
+
+def load_tuned(out_dir):
+    path = os.path.join(out_dir, TUNED_PARAMS)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_tuned(out_dir, tuned):
+    with open(os.path.join(out_dir, TUNED_PARAMS), "w") as f:
+        json.dump(tuned, f, indent=2)
 
 # ------------------ helper functions (example usage) ------------------
 def predict_crop_local(N,P,K,temperature,humidity,ph,rainfall):
@@ -224,13 +464,57 @@ def predict_fertilizer_local(soil, crop, numeric_dict):
     pred_idx = model.predict(x)[0]
     return fert_le.inverse_transform([int(pred_idx)])[0]
 
-print("\nTraining completed. Models saved:")
-print(" - Crop model:", OUT_CROP_MODEL)
-print(" - Crop label encoder:", OUT_CROP_LE)
-print(" - Fertilizer pipeline:", OUT_FERT_PIPE)
-print(" - Fertilizer label encoder:", OUT_FERT_LE)
-print(" - Rainfall CSV:", OUT_RAIN)
-print("\nExample function usage (python):")
-print("  from train_all_models import predict_crop_local, predict_fertilizer_local")
-print("  predict_crop_local(90,42,43,20.8,82,6.5,202.9)")
-print("  predict_fertilizer_local('Sandy','Maize', {'Moisture':38,'Nitrogen':37,'Potassium':0,'Phosphorous':0})")
+def main():
+    cpus = os.cpu_count() or 1
+    ap = argparse.ArgumentParser(description="Train the crop and fertilizer models")
+    ap.add_argument("--data", default=".", help="folder with the input CSVs")
+    ap.add_argument("--out", default=".", help="folder the artifacts are written to")
+    ap.add_argument("--only", help="comma separated subset of: " + ", ".join(TASKS))
+    ap.add_argument("--jobs", type=int, default=min(2, cpus), help="models trained at the same time")
+    ap.add_argument("--threads", type=int, default=None, help="XGBoost threads per model (default: cpus / jobs)")
+    ap.add_argument("--force", action="store_true", help="retrain even when the key is unchanged")
+    ap.add_argument("--search", choices=["crop", "fertilizer"], help="run a hyperparameter search for this model")
+    ap.add_argument("--trials", type=int, default=0, help="random subset of the search grid (0 = all)")
+    ap.add_argument("--folds", type=int, default=3)
+    ap.add_argument("--early-stopping", type=int, default=20, help="rounds without improvement")
+    ap.add_argument("--tolerance", type=float, default=0.005,
+                    help="accuracy a faster model may give up against the most accurate one")
+    ap.add_argument("--export", action="store_true", help="train the picked search result under the usual names")
+    ap.add_argument("--default-params", action="store_true", help=f"ignore {TUNED_PARAMS}")
+    args = ap.parse_args()
+
+    if args.search:
+        threads = args.threads or max(1, cpus // max(1, args.jobs))
+        best = run_search(args.search, args.data, args.out, args.trials, args.folds, args.early_stopping,
+                          args.tolerance, args.jobs, threads)
+        if not args.export:
+            return
+        tuned = load_tuned(args.out)
+        tuned[args.search] = best["params"]
+        save_tuned(args.out, tuned)
+        run_pipeline(args.data, args.out, [args.search], 1, cpus, overrides=tuned)
+        return
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(TASKS)
+    for n in names:
+        if n not in TASKS:
+            print(f"ERROR: unknown model {n!r}")
+            sys.exit(1)
+    threads = args.threads or max(1, cpus // max(1, min(args.jobs, len(names))))
+
+    t0 = time.perf_counter()
+    overrides = {} if args.default_params else load_tuned(args.out)
+    run_pipeline(args.data, args.out, names, args.jobs, threads, force=args.force, overrides=overrides)
+    print(f"\nDone in {time.perf_counter() - t0:.1f}s. Models in {os.path.abspath(args.out)}:")
+    print(" - Crop model:", OUT_CROP_MODEL)
+    print(" - Crop label encoder:", OUT_CROP_LE)
+    print(" - Fertilizer pipeline:", OUT_FERT_PIPE)
+    print(" - Fertilizer label encoder:", OUT_FERT_LE)
+    print(" - Rainfall CSV:", OUT_RAIN)
+    print("\nExample function usage (python):")
+    print("  from crop_recommendation import predict_crop_local, predict_fertilizer_local")
+    print("  predict_crop_local(90,42,43,20.8,82,6.5,202.9)")
+    print("  predict_fertilizer_local('Sandy','Maize', {'Moisture':38,'Nitrogen':37,'Potassium':0,'Phosphorous':0})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# irrigation.py
+# Server-side gate decisions for the whole device fleet, replacing the fixed
+# `soilPercent < 30` check in nitte_iot.ino.
+#
+# Every field (device) gets a moisture band from its crop: the gate opens when
+# soil moisture drops below `open_below` and stays open until it rises above
+# `close_above` (hysteresis), so a reading hovering around one threshold does
+# not flap the valve. The bands come from the Moisture column of
+# Fertilizer Prediction.csv per Crop Type (25th percentile / median). When the
+# suitability model rates the field's crop as poorly suited to the current
+# temperature / humidity / season rainfall, both thresholds are raised by up
+# to STRESS_BOOST points to keep a stressed crop wetter.
+#
+# A decision pass reads the newest reading of every device (TelemetryStore.fleet())
+# as arrays and decides all gates at once; per-device state (gate, last switch,
+# rate-limit tokens) lives in arrays in the same order as the fleet table.
+#
+#   engine = GateEngine()
+#   engine.set_fields(parse_fields([{"device": "esp32-01", "crop": "rice", "rainfall": 180}]))
+#   out = engine.evaluate(*store.fleet(), suit=suitability_bundle)
+#   out["open"], out["close"]                  # device ids to switch now
+#
+#   python irrigation.py thresholds            # the per-crop moisture bands
+#   python irrigation.py bench --devices 10000
+#
+# Rate limits: a gate is not switched again within MIN_SWITCH_SECONDS, and at
+# most MAX_SWITCHES_PER_HOUR times per hour (token bucket). A device whose
+# newest reading is older than STALE_SECONDS is closed regardless of the limits.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from suitability_grid import predict_proba
+from telemetry import DEVICE_ID, FIELD_INDEX
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CROP_DATA = os.path.join(BASE_DIR, "Fertilizer Prediction.csv")
+
+# Band for crops without moisture data: the firmware threshold, plus 10 points
+DEFAULT_OPEN_BELOW = 30.0
+DEFAULT_CLOSE_ABOVE = 40.0
+OPEN_QUANTILE = 0.25
+CLOSE_QUANTILE = 0.5
+MIN_BAND = 3.0
+
+MIN_SWITCH_SECONDS = 300
+MAX_SWITCHES_PER_HOUR = 4
+STALE_SECONDS = 120
+
+# Suitability probability below STRESS_P counts as stress; at p = 0 the band is
+# raised by the full STRESS_BOOST. Rescored every STRESS_REFRESH_SECONDS.
+STRESS_P = 0.2
+STRESS_BOOST = 5.0
+STRESS_REFRESH_SECONDS = 60
+
+# Suitability / crop model labels -> Crop Type in Fertilizer Prediction.csv
+CROP_ALIASES = {
+    "rice": "paddy", "groundnut": "ground nuts", "groundnuts": "ground nuts",
+    "blackgram": "pulses", "chickpea": "pulses", "kidneybeans": "pulses", "lentil": "pulses",
+    "mothbeans": "pulses", "mungbean": "pulses", "pigeonpeas": "pulses",
+}
+# Crop Type -> suitability label, for fields registered with the fertilizer names
+SUITABILITY_ALIASES = {"paddy": "rice"}
+
+SOIL, GATE = FIELD_INDEX["soil"], FIELD_INDEX["gate"]
+TEMPERATURE, HUMIDITY = FIELD_INDEX["temperature"], FIELD_INDEX["humidity"]
+
+
+class IrrigationError(ValueError):
+    pass
+
+
+def moisture_thresholds(path=CROP_DATA):
+    # {crop type (lower case): (open_below, close_above)} from the Moisture column
+    from columnar_cache import read_table
+    if not os.path.exists(path):
+        print(f"⚠️ {os.path.basename(path)} not found; every field uses {DEFAULT_OPEN_BELOW:g}-{DEFAULT_CLOSE_ABOVE:g}%")
+        return {}
+    df = read_table(path)
+    moisture = df.groupby(df["Crop Type"].astype(str).str.strip().str.lower(), observed=True)["Moisture"]
+    lo, mid = moisture.quantile(OPEN_QUANTILE), moisture.quantile(CLOSE_QUANTILE)
+    return {crop: (float(lo[crop]), float(max(mid[crop], lo[crop] + MIN_BAND))) for crop in lo.index}
+
+
+def parse_fields(payload):
+    # [{"device", "crop"?, "rainfall"?, "open_below"?, "close_above"?}, ...] or {"fields": [...]}
+    fields = payload.get("fields") if isinstance(payload, dict) else payload
+    if not isinstance(fields, list):
+        raise IrrigationError("Expected a list of fields or {\"fields\": [...]}")
+    out = {}
+    for f in fields:
+        if not isinstance(f, dict):
+            raise IrrigationError("Every field must be a JSON object")
+        device = f.get("device")
+        if not isinstance(device, str) or not DEVICE_ID.match(device):
+            raise IrrigationError(f"Invalid device id: {device!r}")
+        crop = f.get("crop")
+        if crop is not None and not isinstance(crop, str):
+            raise IrrigationError(f"{device}: 'crop' must be a string")
+        field = {"crop": crop.strip().lower() if crop else None}
+        for key in ("rainfall", "open_below", "close_above"):
+            value = f.get(key)
+            try:
+                field[key] = float(value) if value is not None else None
+            except (TypeError, ValueError):
+                raise IrrigationError(f"{device}: '{key}' must be a number")
+        lo, hi = field["open_below"], field["close_above"]
+        if any(v is not None and not 0 <= v <= 100 for v in (lo, hi)):
+            raise IrrigationError(f"{device}: thresholds are soil moisture percentages (0-100)")
+        if lo is not None and hi is not None and hi <= lo:
+            raise IrrigationError(f"{device}: close_above must be greater than open_below")
+        out[device] = field
+    return out
+
+
+def load_fields(path):
+    with open(path) as f:
+        return parse_fields(json.load(f))
+
+
+class GateEngine:
+    def __init__(self, thresholds=None, min_switch_seconds=MIN_SWITCH_SECONDS,
+                 max_switches_per_hour=MAX_SWITCHES_PER_HOUR, stale_seconds=STALE_SECONDS,
+                 stress_p=STRESS_P, stress_boost=STRESS_BOOST, stress_refresh_seconds=STRESS_REFRESH_SECONDS):
+        self.thresholds = moisture_thresholds() if thresholds is None else dict(thresholds)
+        self.min_switch_seconds = float(min_switch_seconds)
+        self.max_switches = float(max_switches_per_hour)
+        self.stale_seconds = float(stale_seconds)
+        self.stress_p = float(stress_p)
+        self.stress_boost = float(stress_boost)
+        self.stress_refresh_seconds = float(stress_refresh_seconds)
+        self._fields = {}
+        self._devices = []
+        self._index = {}
+        self._crops = []                        # suitability label per row, or None
+        self._alloc(64)
+        self._stress_at = -np.inf
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.switches = 0
+        self.held = 0
+
+    def _alloc(self, n):
+        self._open = np.full(n, DEFAULT_OPEN_BELOW)
+        self._close = np.full(n, DEFAULT_CLOSE_ABOVE)
+        self._rainfall = np.full(n, np.nan)
+        self._boost = np.zeros(n)
+        self._state = np.full(n, -1, dtype=np.int8)   # -1 until the first pass sees the device
+        self._last_switch = np.full(n, -np.inf)
+        self._tokens = np.full(n, self.max_switches)
+        self._refill_ts = np.full(n, np.nan)
+
+    def _grow(self, n):
+        old = len(self._open)
+        if n <= old:
+            return
+        size = max(n, 2 * old)
+        arrays = {k: getattr(self, k) for k in ("_open", "_close", "_rainfall", "_boost", "_state",
+                                                "_last_switch", "_tokens", "_refill_ts")}
+        self._alloc(size)
+        for k, arr in arrays.items():
+            getattr(self, k)[:old] = arr
+
+    # --- per-field configuration ---
+    def band(self, field):
+        # (open_below, close_above, rainfall, suitability label) for one field config
+        crop = field.get("crop") if field else None
+        lo, hi = self.thresholds.get(CROP_ALIASES.get(crop, crop), (DEFAULT_OPEN_BELOW, DEFAULT_CLOSE_ABOVE))
+        if field and field.get("open_below") is not None:
+            lo = field["open_below"]
+        if field and field.get("close_above") is not None:
+            hi = field["close_above"]
+        if hi <= lo:
+            hi = lo + MIN_BAND
+        rainfall = field.get("rainfall") if field else None
+        return lo, hi, (np.nan if rainfall is None else rainfall), SUITABILITY_ALIASES.get(crop, crop)
+
+    def _configure(self, row, device):
+        lo, hi, rain, crop = self.band(self._fields.get(device))
+        self._open[row], self._close[row], self._rainfall[row] = lo, hi, rain
+        self._crops[row] = crop
+
+    def set_fields(self, fields, replace=False):
+        # fields: {device: config} as returned by parse_fields
+        with self._lock:
+            if replace:
+                self._fields = {}
+            self._fields.update(fields)
+            for row, device in enumerate(self._devices):
+                if replace or device in fields:
+                    self._configure(row, device)
+            self._stress_at = -np.inf
+        return len(self._fields)
+
+    def fields(self):
+        with self._lock:
+            return dict(self._fields)
+
+    def _sync(self, devices):
+        # Rows follow the fleet table, which only ever appends devices
+        known = len(self._devices)
+        if devices[:known] != self._devices:
+            self._devices, self._index, self._crops = [], {}, []
+            self._alloc(max(64, len(devices)))
+            known = 0
+        if len(devices) > known:
+            self._grow(len(devices))
+            for row in range(known, len(devices)):
+                self._devices.append(devices[row])
+                self._index[devices[row]] = row
+                self._crops.append(None)
+                self._configure(row, devices[row])
+            self._stress_at = -np.inf
+
+    # --- suitability stress ---
+    def _refresh_stress(self, values, suit, n):
+        classes = {c: i for i, c in enumerate(suit["le"].classes_.tolist())}
+        cls = np.array([classes.get(c, -1) for c in self._crops[:n]], dtype=np.int64)
+        X = np.column_stack([values[:, TEMPERATURE], values[:, HUMIDITY], self._rainfall[:n]]).astype(np.float64)
+        rows = np.flatnonzero((cls >= 0) & np.isfinite(X).all(axis=1))
+        p = np.full(n, np.nan)
+        if len(rows):
+            probs = predict_proba(suit.get("grid"), suit["model"], X[rows])
+            p[rows] = probs[np.arange(len(rows)), cls[rows]]
+        boost = self.stress_boost * np.clip(1.0 - p / self.stress_p, 0.0, 1.0)
+        self._boost[:n] = np.nan_to_num(boost, nan=0.0)
+
+    # --- decisions ---
+    def evaluate(self, devices, ts, values, now=None, suit=None):
+        # devices / ts / values as returned by TelemetryStore.fleet(). Returns the
+        # gates to switch now, the ones whose reported state lags the command
+        # ("resend") and the ones held back by the rate limits.
+        now = time.time() if now is None else now
+        n = len(devices)
+        with self._lock:
+            self._sync(devices)
+            if suit is not None and now - self._stress_at >= self.stress_refresh_seconds:
+                self._refresh_stress(values, suit, n)
+                self._stress_at = now
+
+            soil, reported = values[:, SOIL], values[:, GATE]
+            state = self._state[:n]
+            new = state < 0
+            state[new] = reported[new] == 1.0
+            is_open = state == 1
+
+            fresh = (now - ts <= self.stale_seconds) & np.isfinite(soil)
+            limit = np.where(is_open, self._close[:n], self._open[:n]) + self._boost[:n]
+            want = fresh & (soil < limit)
+            change = want != is_open
+
+            tokens = self._tokens[:n]
+            refill = self._refill_ts[:n]
+            elapsed = np.where(np.isnan(refill), 0.0, now - refill)
+            np.minimum(tokens + elapsed * (self.max_switches / 3600.0), self.max_switches, out=tokens)
+            refill[:] = now
+
+            allowed = (now - self._last_switch[:n] >= self.min_switch_seconds) & (tokens >= 1.0)
+            switch = change & (allowed | ~fresh)
+            held = change & ~switch
+            state[switch] = want[switch]
+            self._last_switch[:n][switch] = now
+            tokens[switch & fresh] -= 1.0
+
+            lagging = ~switch & fresh & np.isfinite(reported) & ((reported == 1.0) != (state == 1))
+            opened = np.flatnonzero(switch & want)
+            closed = np.flatnonzero(switch & ~want)
+            self.evaluations += 1
+            self.switches += len(opened) + len(closed)
+            self.held += int(held.sum())
+            return {
+                "ts": now,
+                "evaluated": n,
+                "stale": int((~fresh).sum()),
+                "open": [devices[i] for i in opened],
+                "close": [devices[i] for i in closed],
+                "resend": {"open": [devices[i] for i in np.flatnonzero(lagging & (state == 1))],
+                           "close": [devices[i] for i in np.flatnonzero(lagging & (state == 0))]},
+                "held": [devices[i] for i in np.flatnonzero(held)],
+            }
+
+    def state(self, device):
+        # Commanded gate and effective band for one device; KeyError when no pass has seen it
+        with self._lock:
+            row = self._index.get(device)
+            if row is None:
+                raise KeyError(f"No gate decision for {device} yet")
+            boost = float(self._boost[row])
+            state = int(self._state[row])
+            return {
+                "device": device,
+                "crop": (self._fields.get(device) or {}).get("crop"),
+                "gate": "OPEN" if state == 1 else "CLOSED",
+                "open_below": float(self._open[row]) + boost,
+                "close_above": float(self._close[row]) + boost,
+                "stress_boost": boost,
+                "last_switch": float(self._last_switch[row]) if np.isfinite(self._last_switch[row]) else None,
+                "switch_tokens": float(self._tokens[row]),
+            }
+
+    def stats(self):
+        with self._lock:
+            n = len(self._devices)
+            return {"devices": n, "fields": len(self._fields), "open": int((self._state[:n] == 1).sum()),
+                    "evaluations": self.evaluations, "switches": self.switches, "held": self.held}
+
+
+def bench(n_devices, rounds, seed=0):
+    rng = np.random.default_rng(seed)
+    engine = GateEngine(min_switch_seconds=0, max_switches_per_hour=3600)
+    crops = ["rice", "maize", "cotton", "chickpea", "wheat", None]
+    devices = [f"esp32-{i:05d}" for i in range(n_devices)]
+    engine.set_fields({d: {"crop": crops[i % len(crops)], "rainfall": None, "open_below": None,
+                           "close_above": None} for i, d in enumerate(devices)})
+    values = np.empty((n_devices, len(FIELD_INDEX)), dtype=np.float32)
+    values[:, TEMPERATURE], values[:, HUMIDITY] = 27.0, 70.0
+    values[:, SOIL] = rng.uniform(20, 60, n_devices)
+    values[:, GATE] = 0.0
+    now = time.time()
+    ts = np.full(n_devices, now)
+    timings, switched = [], 0
+    for r in range(rounds):
+        values[:, SOIL] = np.clip(values[:, SOIL] + rng.normal(0, 2, n_devices), 0, 100)
+        t0 = time.perf_counter()
+        out = engine.evaluate(devices, ts + r, values, now=now + r)
+        timings.append(time.perf_counter() - t0)
+        switched += len(out["open"]) + len(out["close"])
+    return np.array(timings), switched
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Crop moisture bands and the fleet gate-decision engine")
+    ap.add_argument("command", choices=["thresholds", "bench"])
+    ap.add_argument("--devices", type=int, default=10000)
+    ap.add_argument("--rounds", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.command == "thresholds":
+        bands = moisture_thresholds()
+        if not bands:
+            sys.exit(1)
+        for crop, (lo, hi) in sorted(bands.items()):
+            print(f"{crop:<12} open below {lo:5.1f}%  close above {hi:5.1f}%")
+        return
+
+    timings, switched = bench(args.devices, args.rounds)
+    print(f"✅ {args.devices} devices x {args.rounds} passes: median {np.median(timings) * 1000:.2f} ms, "
+          f"max {timings.max() * 1000:.2f} ms per pass, {switched} switches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# loadtest.py
+# HTTP load test for the prediction APIs.
+#
+# Starts app.py (and nitte/app.py for its /check route) on free local ports,
+# waits for /readyz, then drives each endpoint with N concurrent keep-alive
+# clients for a fixed time, using rows sampled from crop_recommendation.csv
+# and Fertilizer Prediction.csv. Results (throughput, p50/p95/p99 latency,
+# errors) are written to a JSON file that `compare` can diff against a
+# previous run. Started servers run with SERVER_ENV_DEFAULTS (debugger and
+# reloader off) unless --server-env overrides them.
+#
+#   python loadtest.py run --concurrency 1,8,32 --duration 10 --out before.json
+#   python loadtest.py run --endpoints predict_crop,states --jitter 0.5
+#   python loadtest.py run --crop-url http://127.0.0.1:5000 --no-nitte   # already running server
+#   python loadtest.py compare before.json after.json [--threshold 10]
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NITTE_DIR = os.path.join(os.path.dirname(BASE_DIR), "nitte")
+CROP_CSV = os.path.join(BASE_DIR, "crop_recommendation.csv")
+FERT_CSV = os.path.join(BASE_DIR, "Fertilizer Prediction.csv")
+
+SAMPLE_ROWS = 5000
+READY_TIMEOUT = 120
+# The apps default to FLASK_DEBUG=1; measure them the way they are deployed
+SERVER_ENV_DEFAULTS = {"FLASK_DEBUG": "0"}
+
+
+# ==========================
+# PAYLOADS
+# ==========================
+def load_payloads(jitter, seed=42):
+    # Pre-serialized request bodies so the client spends its time on I/O.
+    # `jitter` adds +-jitter noise to numeric inputs to get past the prediction cache.
+    rng = np.random.default_rng(seed)
+
+    crop = pd.read_csv(CROP_CSV)
+    crop = crop.sample(SAMPLE_ROWS, replace=True, random_state=seed).reset_index(drop=True)
+    num = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+    if jitter:
+        crop[num] = crop[num] + rng.uniform(-jitter, jitter, size=(len(crop), len(num)))
+
+    fert = pd.read_csv(FERT_CSV).rename(columns=lambda s: s.strip())
+    fert = fert.sample(SAMPLE_ROWS, replace=True, random_state=seed).reset_index(drop=True)
+    fnum = ["Temparature", "Humidity", "Moisture", "Nitrogen", "Phosphorous", "Potassium"]
+    fert[fnum] = fert[fnum].astype(float)
+    if jitter:
+        fert[fnum] = fert[fnum] + rng.uniform(-jitter, jitter, size=(len(fert), len(fnum)))
+
+    crop_bodies = [json.dumps({k: round(float(r[k]), 3) for k in num}).encode() for _, r in crop.iterrows()]
+    fert_bodies = [json.dumps({
+        "soil_type": r["Soil Type"], "crop": r["Crop Type"],
+        "N": round(r["Nitrogen"], 3), "P": round(r["Phosphorous"], 3), "K": round(r["Potassium"], 3),
+        "moisture": round(r["Moisture"], 3), "temperature": round(r["Temparature"], 3),
+        "humidity": round(r["Humidity"], 3),
+    }).encode() for _, r in fert.iterrows()]
+    # Ask about the row's own crop half of the time and a random one otherwise
+    labels = crop["label"].unique()
+    suit_bodies = [json.dumps({
+        "crop": r["label"] if i % 2 == 0 else str(rng.choice(labels)),
+        "temperature": round(float(r["temperature"]), 3),
+        "humidity": round(float(r["humidity"]), 3),
+        "rainfall": round(float(r["rainfall"]), 3),
+    }).encode() for i, r in crop.iterrows()]
+
+    return {"crop": crop_bodies, "fertilizer": fert_bodies, "suitability": suit_bodies}
+
+
+# name -> (server, method, path, payload set)
+ENDPOINTS = {
+    "predict_crop": ("crop", "POST", "/api/predict_crop", "crop"),
+    "predict_fertilizer": ("crop", "POST", "/predict_fertilizer", "fertilizer"),
+    "check_suitability": ("crop", "POST", "/check_suitability", "suitability"),
+    "states": ("crop", "GET", "/states", None),
+    "meta": ("crop", "GET", "/meta", None),
+    "nitte_check": ("nitte", "POST", "/check", "suitability"),
+}
+
+
+# ==========================
+# SERVERS
+# ==========================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(script, port, log_path, env_overrides):
+    env = dict(os.environ, PORT=str(port), **env_overrides)
+    log = open(log_path, "w")
+    # Own process group so a Flask reloader child (FLASK_DEBUG=1) is stopped with it
+    proc = subprocess.Popen([sys.executable, os.path.basename(script)], cwd=os.path.dirname(script),
+                            env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    return proc, log
+
+
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, 15)
+        proc.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(proc.pid, 9)
+        except ProcessLookupError:
+            pass
+
+
+def wait_ready(url, proc=None):
+    u = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server for {url} exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(u.hostname, u.port, timeout=5)
+            conn.request("GET", "/readyz")
+            resp = conn.getresponse()
+            resp.read()
+            conn.close()
+            if resp.status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} not ready after {READY_TIMEOUT}s")
+
+
+# ==========================
+# LOAD GENERATION
+# ==========================
+def client_loop(url, method, path, bodies, stop_at, latencies, errors, seed):
+    u = urllib.parse.urlsplit(url)
+    rnd = random.Random(seed)
+    headers = {"Content-Type": "application/json"}
+    conn = None
+    while time.perf_counter() < stop_at:
+        body = bodies[rnd.randrange(len(bodies))] if bodies else None
+        if conn is None:
+            conn = http.client.HTTPConnection(u.hostname, u.port, timeout=30)
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers if body else {})
+            resp = conn.getresponse()
+            data = resp.read()
+            elapsed = time.perf_counter() - t0
+            if resp.status != 200 or b'"error"' in data[:200]:
+                errors.append(resp.status)
+            else:
+                latencies.append(elapsed)
+            if resp.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append(0)
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run_level(url, method, path, bodies, concurrency, duration, warmup):
+    # Warmup traffic is thrown away
+    if warmup > 0:
+        client_loop(url, method, path, bodies, time.perf_counter() + warmup, [], [], 0)
+
+    per_client = [([], []) for _ in range(concurrency)]
+    start = time.perf_counter()
+    stop_at = start + duration
+    threads = [threading.Thread(target=client_loop, args=(url, method, path, bodies, stop_at, lat, err, i))
+               for i, (lat, err) in enumerate(per_client)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    lat = np.array([x for l, _ in per_client for x in l]) * 1000
+    errs = [x for _, e in per_client for x in e]
+    out = {
+        "concurrency": concurrency,
+        "duration_s": round(wall, 3),
+        "requests": int(len(lat)),
+        "errors": len(errs),
+        "throughput_rps": round(len(lat) / wall, 1),
+    }
+    if len(lat):
+        out.update({
+            "mean_ms": round(float(lat.mean()), 3),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            "max_ms": round(float(lat.max()), 3),
+        })
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cmd_run(args):
+    names = [n.strip() for n in args.endpoints.split(",") if n.strip()]
+    for n in names:
+        if n not in ENDPOINTS:
+            sys.exit(f"unknown endpoint {n!r}; choose from {', '.join(ENDPOINTS)}")
+    if args.no_nitte:
+        names = [n for n in names if ENDPOINTS[n][0] != "nitte"]
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print("Sampling payloads...")
+    payloads = load_payloads(args.jitter)
+
+    env_overrides = dict(SERVER_ENV_DEFAULTS, **dict(kv.split("=", 1) for kv in args.server_env))
+    procs = []
+    urls = {"crop": args.crop_url, "nitte": args.nitte_url}
+    try:
+        for server, script in (("crop", os.path.join(BASE_DIR, "app.py")),
+                               ("nitte", os.path.join(NITTE_DIR, "app.py"))):
+            if not any(ENDPOINTS[n][0] == server for n in names):
+                continue
+            proc = None
+            if urls[server] is None:
+                port = free_port()
+                urls[server] = f"http://127.0.0.1:{port}"
+                proc, log = start_server(script, port, os.path.join(args.log_dir, f"loadtest_{server}.log"),
+                                         env_overrides)
+                procs.append((proc, log))
+                print(f"Started {script} on port {port} (pid {proc.pid})")
+            wait_ready(urls[server], proc)
+            print(f"✅ {server} ready at {urls[server]}")
+
+        results = {}
+        for name in names:
+            server, method, path, payload_key = ENDPOINTS[name]
+            bodies = payloads[payload_key] if payload_key else None
+            results[name] = []
+            for c in levels:
+                r = run_level(urls[server], method, path, bodies, c, args.duration, args.warmup)
+                results[name].append(r)
+                print(f"{name:<20} c={c:<4} {r['throughput_rps']:>9.1f} req/s  "
+                      f"p50 {r.get('p50_ms', 0):>8.2f}  p95 {r.get('p95_ms', 0):>8.2f}  "
+                      f"p99 {r.get('p99_ms', 0):>8.2f} ms  errors {r['errors']}")
+    finally:
+        for proc, log in procs:
+            stop_server(proc)
+            log.close()
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "label": args.label,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "jitter": args.jitter,
+            "server_env": env_overrides,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {args.out}")
+
+
+# ==========================
+# COMPARE
+# ==========================
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = 0
+    print(f"{'endpoint':<20}{'c':>5}{'rps':>22}{'p50 ms':>22}{'p99 ms':>22}")
+    for name, levels in new["results"].items():
+        old_levels = {r["concurrency"]: r for r in base["results"].get(name, [])}
+        for r in levels:
+            o = old_levels.get(r["concurrency"])
+            if o is None:
+                continue
+            cells = []
+            for key, higher_is_better in (("throughput_rps", True), ("p50_ms", False), ("p99_ms", False)):
+                a, b = o.get(key), r.get(key)
+                if not a or b is None:
+                    cells.append(f"{'-':>22}")
+                    continue
+                change = (b - a) / a * 100
+                worse = -change if higher_is_better else change
+                flag = " !" if worse > args.threshold else "  "
+                regressions += worse > args.threshold
+                cells.append(f"{a:>8.1f} -> {b:>8.1f}{flag}".rjust(22))
+            print(f"{name:<20}{r['concurrency']:>5}" + "".join(cells))
+    print(f"\n{regressions} metric(s) regressed by more than {args.threshold}%")
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test the crop / fertilizer / suitability APIs")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run")
+    run.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    run.add_argument("--concurrency", default="1,8,32", help="comma separated client counts")
+    run.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint and level")
+    run.add_argument("--warmup", type=float, default=1.0)
+    run.add_argument("--jitter", type=float, default=0.0, help="+- noise on numeric inputs")
+    run.add_argument("--crop-url", help="use a running app.py instead of starting one")
+    run.add_argument("--nitte-url", help="use a running nitte/app.py instead of starting one")
+    run.add_argument("--no-nitte", action="store_true", help="skip the nitte server endpoints")
+    run.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                     help="extra environment for started servers, e.g. MICROBATCH=1 "
+                          "(defaults: FLASK_DEBUG=0)")
+    run.add_argument("--log-dir", default=BASE_DIR)
+    run.add_argument("--label", help="free text stored with the results")
+    run.add_argument("--out", default="loadtest_results.json")
+    run.set_defaults(func=cmd_run)
+
+    cmp = sub.add_parser("compare")
+    cmp.add_argument("base")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    cmp.add_argument("--fail-on-regression", action="store_true")
+    cmp.set_defaults(func=cmd_compare)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
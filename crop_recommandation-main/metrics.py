@@ -0,0 +1,196 @@
+# metrics.py
+# Minimal counters and histograms rendered in the Prometheus text format.
+#
+#   REQUESTS = Counter("http_requests_total", "Requests", ["route", "method", "status"])
+#   REQUESTS.inc("/meta", "GET", "200")
+#   LATENCY = Histogram("http_request_duration_seconds", "Latency", ["route"])
+#   LATENCY.observe(0.004, "/meta")
+#   with STAGES.time("fertilizer", "encode"):
+#       ...
+#   text = render()                        # serve as text/plain; version=0.0.4
+#
+#   trace = start_trace()                  # per-request breakdown on this thread
+#   ...                                    # every Histogram.time() also lands in trace
+#   end_trace().as_ms()                    # {"encode": 0.05, "predict": 0.31, ...}
+#
+# Observing is a bisect over the bucket bounds plus a few additions under a
+# lock, so it is cheap enough for every request. Values are per process: with
+# prefork_server.py each worker exposes its own numbers.
+
+import threading
+import time
+from bisect import bisect_left
+
+# Whole requests, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Single steps inside a request (parsing, encoding, predict, decoding)
+STAGE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_METRICS = []
+_COLLECTORS = []
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, lv)} {_num(v)}" for lv, v in items]
+
+
+class _Timer:
+    __slots__ = ("hist", "labelvalues", "start")
+
+    def __init__(self, hist, labelvalues):
+        self.hist, self.labelvalues = hist, labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.hist.observe(elapsed, *self.labelvalues)
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.add(self.labelvalues[-1], elapsed)
+
+
+class Trace:
+    # Stage timings for one request, keyed by the last label of each timer
+    def __init__(self):
+        self.stages = {}
+        self.notes = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_ms(self):
+        return {k: round(v * 1000, 3) for k, v in self.stages.items()}
+
+
+class _Span:
+    # Times a block into the current trace only
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.add(self.stage, time.perf_counter() - self.start)
+
+
+def start_trace():
+    _local.trace = Trace()
+    return _local.trace
+
+
+def end_trace():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def span(stage):
+    return _Span(stage)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series = {}                       # labelvalues -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _METRICS.append(self)
+
+    def observe(self, seconds, *labelvalues):
+        i = bisect_left(self.bounds, seconds)
+        with self._lock:
+            s = self._series.get(labelvalues)
+            if s is None:
+                s = self._series[labelvalues] = [0] * (len(self.bounds) + 1) + [0.0, 0]
+            s[i] += 1
+            s[-2] += seconds
+            s[-1] += 1
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((lv, list(s)) for lv, s in self._series.items())
+        lines = []
+        for lv, s in items:
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float("inf"),), s):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, lv, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, lv)} {_num(s[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, lv)} {s[-1]}")
+        return lines
+
+
+def add_collector(fn):
+    # fn() -> iterable of (name, type, help, [(labels dict, value), ...]),
+    # evaluated at scrape time; for values that already live elsewhere.
+    _COLLECTORS.append(fn)
+
+
+def render():
+    out = []
+    for m in _METRICS:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out.extend(m.samples())
+    for fn in _COLLECTORS:
+        for name, kind, help, samples in fn():
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                out.append(f"{name}{_labels(labels.keys(), labels.values())} {_num(value)}")
+    return "\n".join(out) + "\n"
+
@@ -0,0 +1,122 @@
+# microbatch.py
+# Collects concurrent single-row predictions for a few milliseconds and runs
+# them through the model as one matrix.
+#
+#   batcher = MicroBatcher("crop", predict_rows, max_batch=64, max_wait_ms=2)
+#   label = batcher.submit(bundle, row)     # blocks until the batch has run
+#
+# predict_rows(bundle, X) gets an (n, features) array and returns n results.
+# Rows are grouped by the bundle they were submitted with, so a request that
+# started before a hot reload is still scored by the model it picked up.
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# How many recent queue-wait samples to keep for the percentiles in stats()
+WAIT_SAMPLES = 2048
+
+
+class MicroBatcher:
+    def __init__(self, name, fn, max_batch=64, max_wait_ms=2.0):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max(int(max_batch), 1)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # A lock held by another thread at fork() would stay held in the child
+        os.register_at_fork(after_in_child=self._new_start_lock)
+        self._start()
+
+    def _new_start_lock(self):
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so a forked worker starts its own
+        # queue, batching thread and counters on first use. The check is repeated
+        # under the lock so concurrent first requests start one collector, not two.
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._size_counts = {}
+        self.batches = self.items = self.errors = 0
+        self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, bundle, row, timeout=30.0):
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((bundle, row, fut, time.perf_counter()))
+        return fut.result(timeout=timeout)
+
+    def _collect(self):
+        # Block for the first item, then keep taking items until the batch is
+        # full or max_wait has passed since the first one arrived.
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+            for items in groups.values():
+                futures = [it[2] for it in items]
+                try:
+                    results = self.fn(items[0][0], np.array([it[1] for it in items], dtype=np.float64))
+                    for fut, res in zip(futures, results):
+                        fut.set_result(res)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    for fut in futures:
+                        fut.set_exception(e)
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self._size_counts[len(batch)] = self._size_counts.get(len(batch), 0) + 1
+                self._waits.extend(started - it[3] for it in batch)
+
+    def stats(self):
+        self._ensure_started()
+        with self._lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "items": self.items,
+                "errors": self.errors,
+                "mean_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "batch_sizes": {str(k): v for k, v in sorted(self._size_counts.items())},
+                "queue_wait_ms": {
+                    "p50": float(np.percentile(waits, 50)),
+                    "p95": float(np.percentile(waits, 95)),
+                    "max": float(waits.max()),
+                },
+            }
@@ -0,0 +1,230 @@
+# model_registry.py
+# Loads model artifacts (pickles, CSVs, spreadsheets) on first use instead of
+# at import time, so the server can bind its port straight away.
+#
+#   registry = ModelRegistry()
+#   registry.register("crop", load_crop_bundle, required=True)
+#   crop = registry.get("crop")          # loads on first call, then cached
+#   registry.warm(background=True)       # preload everything in a thread
+#   registry.ready()                     # True once every required artifact is resident
+#   registry.reload("crop")              # load a new copy, smoke-check it, swap it in
+#   registry.start_watcher(5.0)          # reload automatically when watched files change
+#
+# Routes should call get() once per request and keep the returned object:
+# a reload swaps the reference, so requests already running finish on the
+# old model while new requests pick up the new one.
+
+import os
+import socket
+import threading
+import time
+
+# A failed load is retried on the next get() once this many seconds have passed
+RETRY_AFTER_SECONDS = 30.0
+
+
+class ModelUnavailable(Exception):
+    def __init__(self, name, reason):
+        super().__init__(f"{name} unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+class _Entry:
+    def __init__(self, loader, required, check, watch):
+        self.loader = loader
+        self.required = required
+        self.check = check
+        self.watch = tuple(watch)
+        self.current = (None, 0)     # (artifact, version), swapped as one reference
+        self.loaded = False
+        self.mtimes = None
+        self.pending_mtimes = None
+        self.error = None
+        self.reload_error = None
+        self.failed_at = 0.0
+        self.load_ms = None
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+    def load(self):
+        # Snapshot mtimes first so a file replaced mid-load is picked up again
+        mtimes = _mtimes(self.watch)
+        t0 = time.perf_counter()
+        value = self.loader()
+        if self.check is not None:
+            self.check(value)
+        return value, mtimes, (time.perf_counter() - t0) * 1000
+
+    @property
+    def value(self):
+        return self.current[0]
+
+    @property
+    def version(self):
+        return self.current[1]
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._warm_lock = threading.Lock()
+        self._warm_thread = None
+        self._watch_thread = None
+        self._listeners = []
+
+    def register(self, name, loader, required=False, check=None, watch=()):
+        # check(value) should raise if a freshly loaded artifact is unusable;
+        # watch lists the files whose changes trigger a reload.
+        self._entries[name] = _Entry(loader, required, check, watch)
+
+    def on_reload(self, callback):
+        # callback(name, version) runs after a new artifact has been swapped in
+        self._listeners.append(callback)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name):
+        return self.get_versioned(name)[0]
+
+    def get_versioned(self, name):
+        # Returns (artifact, version) from the same swap, e.g. for cache keys
+        entry = self._entries[name]
+        if entry.loaded:
+            return entry.current
+        with entry.lock:
+            if entry.loaded:
+                return entry.current
+            if entry.error is not None and time.monotonic() - entry.failed_at < RETRY_AFTER_SECONDS:
+                raise ModelUnavailable(name, entry.error)
+            try:
+                value, entry.mtimes, entry.load_ms = entry.load()
+            except Exception as e:
+                entry.error = str(e) or e.__class__.__name__
+                entry.failed_at = time.monotonic()
+                print(f"⚠️ Warning ({name}): {entry.error}")
+                raise ModelUnavailable(name, entry.error) from e
+            entry.current = (value, entry.version + 1)
+            entry.error = None
+            entry.loaded = True
+            print(f"✅ {name} loaded in {entry.load_ms:.0f} ms")
+            return entry.current
+
+    def version(self, name):
+        return self._entries[name].version
+
+    def reload(self, name):
+        # Loads and checks a fresh copy on the calling thread, then swaps it in
+        # with a single reference assignment. On failure the old artifact stays.
+        entry = self._entries[name]
+        with entry.reload_lock:
+            try:
+                value, mtimes, load_ms = entry.load()
+            except Exception as e:
+                entry.reload_error = str(e) or e.__class__.__name__
+                entry.mtimes = entry.pending_mtimes = _mtimes(entry.watch)
+                print(f"⚠️ Reload rejected ({name}): {entry.reload_error}")
+                raise ModelUnavailable(name, entry.reload_error) from e
+            with entry.lock:
+                version = entry.version + 1
+                entry.current = (value, version)
+                entry.mtimes, entry.load_ms = mtimes, load_ms
+                entry.error = entry.reload_error = None
+                entry.loaded = True
+        print(f"🔄 {name} reloaded (v{version}) in {load_ms:.0f} ms")
+        for callback in self._listeners:
+            callback(name, version)
+        return version
+
+    def start_watcher(self, interval):
+        # Polls watched files and reloads an artifact once its files have
+        # changed and then stayed unchanged for one more poll (no half-written pickles).
+        if self._watch_thread is None:
+            self._watch_thread = threading.Thread(
+                target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+            self._watch_thread.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            for name, entry in self._entries.items():
+                if not entry.loaded or not entry.watch:
+                    continue
+                current = _mtimes(entry.watch)
+                if current == entry.mtimes:
+                    entry.pending_mtimes = None
+                elif current != entry.pending_mtimes:
+                    entry.pending_mtimes = current
+                else:
+                    try:
+                        self.reload(name)
+                    except ModelUnavailable:
+                        pass
+
+    def peek(self, name):
+        # Returns the artifact if it is already resident, without loading it
+        entry = self._entries[name]
+        return entry.value if entry.loaded else None
+
+    def warm(self, names=None, background=False, wait_for_port=None):
+        # Loads every artifact (or just `names`). With background=True this runs
+        # once in a daemon thread; wait_for_port delays it until the server is
+        # accepting connections so startup is not slowed down by the warmup.
+        names = list(names or self._entries)
+        if not background:
+            self._warm(names, wait_for_port)
+            return
+        with self._warm_lock:
+            if self._warm_thread is None:
+                self._warm_thread = threading.Thread(
+                    target=self._warm, args=(names, wait_for_port), name="model-warmup", daemon=True)
+                self._warm_thread.start()
+
+    def _warm(self, names, wait_for_port):
+        if wait_for_port:
+            _wait_for_port(wait_for_port)
+        for name in names:
+            try:
+                self.get(name)
+            except ModelUnavailable:
+                pass
+
+    def ready(self):
+        return all(e.loaded for e in self._entries.values() if e.required)
+
+    def status(self):
+        out = {}
+        for name, e in self._entries.items():
+            if e.loaded:
+                state = "loaded"
+            elif e.lock.locked():
+                state = "loading"
+            elif e.error is not None:
+                state = "error"
+            else:
+                state = "not_loaded"
+            out[name] = {"state": state, "required": e.required, "version": e.version,
+                         "load_ms": e.load_ms, "error": e.error, "reload_error": e.reload_error}
+        return out
+
+
+def _mtimes(paths):
+    out = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            out.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+
+def _wait_for_port(port, host="127.0.0.1", timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
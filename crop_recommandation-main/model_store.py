@@ -0,0 +1,330 @@
+# model_store.py
+# Versioned, memory-mappable export of the served models.
+#
+# Each model is a directory holding one .npy file per array plus a
+# manifest.json with the format version, the model kind, the label classes as
+# plain lists and the sha256 of the pickles it was exported from:
+#
+#   model_store/crop/manifest.json, feature.npy, threshold.npy, ...
+#   model_store/fertilizer/...
+#   model_store/suitability/...
+#
+# Loading maps the arrays read-only (np.load(mmap_mode="r")), so it is
+# close to free, and every process reading the same files shares the same
+# page-cache pages. No XGBoost or scikit-learn objects are unpickled.
+#
+# The manifest also records the pickled model's predict_proba on a few probe
+# rows ("reference"), so a loaded export can be smoke-checked against the
+# model it came from without loading that model.
+#
+#   python model_store.py export              # pickles -> model_store/
+#   python model_store.py verify              # exported vs pickled predictions
+#   python model_store.py info
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from tree_ensemble import TreeEnsemble, ForestEnsemble
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(BASE_DIR, "model_store")
+
+FORMAT = "crop-model-store"
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+REFERENCE_ROWS = 32
+REFERENCE_TOLERANCE = 1e-4
+
+SOURCES = {
+    "crop": [os.path.join(BASE_DIR, "XGBoost.pkl"), os.path.join(BASE_DIR, "crop_label_encoder.pkl")],
+    "fertilizer": [os.path.join(BASE_DIR, "xgb_pipeline.pkl"), os.path.join(BASE_DIR, "fertilizer_label_encoder.pkl")],
+    "suitability": [os.path.join(BASE_DIR, "suitability_model.pkl"), os.path.join(BASE_DIR, "label_encoder.pkl")],
+}
+KINDS = {"xgboost_trees": TreeEnsemble, "sklearn_forest": ForestEnsemble}
+
+
+class StoreError(Exception):
+    pass
+
+
+class StoreMissing(StoreError):
+    pass
+
+
+class Labels:
+    # Stand-in for a fitted LabelEncoder, built from its class list
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+        self._index = {c: i for i, c in enumerate(self.classes_.tolist())}
+
+    def transform(self, values):
+        try:
+            return np.array([self._index[v] for v in values], dtype=np.int64)
+        except (KeyError, TypeError):
+            unseen = [v for v in values if v not in self._index]
+            raise ValueError(f"y contains previously unseen labels: {', '.join(map(repr, unseen))}")
+
+    def inverse_transform(self, idx):
+        idx = np.asarray(idx, dtype=np.int64)
+        if idx.size and (idx.min() < 0 or idx.max() >= len(self.classes_)):
+            raise ValueError(f"y contains previously unseen labels: {idx[(idx < 0) | (idx >= len(self.classes_))]}")
+        return self.classes_[idx]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ==========================
+# WRITE / READ
+# ==========================
+def save(path, kind, model, labels, meta=None, sources=(), reference=None):
+    # Writes into a temp directory and swaps it in, so readers never see a partial export
+    arrays, model_meta = model.to_arrays()
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    files = {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        np.save(os.path.join(tmp, name + ".npy"), arr)
+        files[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape)}
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "kind": kind,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "arrays": files,
+        "model": model_meta,
+        "labels": {k: [str(c) for c in v] for k, v in labels.items()},
+        "meta": meta or {},
+        "sources": {os.path.basename(p): file_sha256(p) for p in sources},
+        "reference": None if reference is None else {k: np.asarray(v).tolist() for k, v in reference.items()},
+    }
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path):
+    mpath = os.path.join(path, MANIFEST)
+    if not os.path.exists(mpath):
+        raise StoreMissing(f"no exported model at {path}")
+    with open(mpath) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT or manifest.get("format_version") != FORMAT_VERSION:
+        raise StoreError(f"{path}: unsupported format {manifest.get('format')} v{manifest.get('format_version')}; "
+                         f"re-run python model_store.py export")
+    if manifest.get("kind") not in KINDS:
+        raise StoreError(f"{path}: unknown model kind {manifest.get('kind')!r}")
+    return manifest
+
+
+def load(path, sources=None):
+    # Returns {"model", "labels": {name: Labels}, "meta", "reference", "manifest"}. With `sources`,
+    # raises StoreError when those files differ from the ones the export was made from.
+    manifest = read_manifest(path)
+    if sources:
+        for p in sources:
+            expected = manifest["sources"].get(os.path.basename(p))
+            if os.path.exists(p) and expected != file_sha256(p):
+                raise StoreError(f"{os.path.basename(p)} changed since the export")
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        arr = np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        if arr.dtype.str != spec["dtype"] or list(arr.shape) != spec["shape"]:
+            raise StoreError(f"{path}/{name}.npy does not match the manifest")
+        arrays[name] = arr
+    model = KINDS[manifest["kind"]].from_arrays(arrays, manifest["model"])
+    return {
+        "model": model,
+        "labels": {k: Labels(v) for k, v in manifest["labels"].items()},
+        "meta": manifest["meta"],
+        "reference": {k: np.asarray(v, dtype=np.float64) for k, v in (manifest.get("reference") or {}).items()} or None,
+        "manifest": manifest,
+    }
+
+
+def check_reference(model, reference):
+    # Raises StoreError when `model` no longer reproduces the recorded output of the pickle
+    if reference is None:
+        raise StoreError("export has no reference output")
+    got = model.predict_proba(reference["X"])
+    want = reference["proba"]
+    if got.shape != want.shape:
+        raise StoreError(f"reference output has shape {want.shape}, model gives {got.shape}")
+    diff = float(np.abs(got - want).max())
+    if diff > REFERENCE_TOLERANCE or (got.argmax(1) != want.argmax(1)).any():
+        raise StoreError(f"exported model disagrees with the pickle's reference output (max |dp| {diff:.2e})")
+
+
+class LazyPickle:
+    # Loads the original model on first use, for the calls the exported trees are
+    # slower at (large batches). `fallback` (the exported trees) answers instead
+    # when the pickle no longer matches `sha256`, the hash the export was made
+    # from, or fails to load for any reason, so every batch size gets one model.
+    def __init__(self, load_fn, fallback, name, source, sha256):
+        self._load_fn, self._fallback, self.name = load_fn, fallback, name
+        self._source, self._sha256 = source, sha256
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if not os.path.exists(self._source):
+            raise StoreError(f"{os.path.basename(self._source)} not found")
+        if self._sha256 != file_sha256(self._source):
+            raise StoreError(f"{os.path.basename(self._source)} changed since the export")
+        return self._load_fn()
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        self._model = self._open()
+                    except Exception as e:
+                        print(f"⚠️ {self.name}: original model unavailable ({e}); large batches use the exported trees")
+                        self._model = self._fallback
+        return self._model
+
+    def predict(self, X):
+        return self.load().predict(X)
+
+    def predict_proba(self, X):
+        return self.load().predict_proba(X)
+
+
+# ==========================
+# EXPORT FROM THE PICKLES
+# ==========================
+def _unpickle(path):
+    import joblib
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return joblib.load(path)
+
+
+def _probe(name, n_features, n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 300, size=(n, n_features))
+    if name == "suitability":
+        X = np.column_stack([X[:, 0] % 50, X[:, 1] % 100, X[:, 2]])
+    return X
+
+
+def _reference(name, model):
+    X = _probe(name, model.n_features_in_, REFERENCE_ROWS, seed=1)
+    return {"X": X, "proba": model.predict_proba(X)}
+
+
+def export_crop(store):
+    from tree_ensemble import compile_xgboost
+    model_path, le_path = SOURCES["crop"]
+    model = _unpickle(model_path)
+    return save(os.path.join(store, "crop"), "xgboost_trees", compile_xgboost(model),
+                {"crop": _unpickle(le_path).classes_}, sources=SOURCES["crop"],
+                reference=_reference("crop", model))
+
+
+def export_fertilizer(store):
+    from tree_ensemble import compile_xgboost
+    pipe_path, le_path = SOURCES["fertilizer"]
+    pipe = _unpickle(pipe_path)
+    ens = compile_xgboost(pipe["model"])
+    labels = {
+        "fertilizer": _unpickle(le_path).classes_,
+        "soil": pipe["soil_label_encoder"].classes_,
+        "crop": pipe["crop_label_encoder"].classes_,
+    }
+    return save(os.path.join(store, "fertilizer"), "xgboost_trees", ens, labels,
+                meta={"feature_order": list(pipe["feature_order"])}, sources=SOURCES["fertilizer"],
+                reference=_reference("fertilizer", pipe["model"]))
+
+
+def export_suitability(store):
+    from tree_ensemble import compile_sklearn_forest
+    model_path, le_path = SOURCES["suitability"]
+    model = _unpickle(model_path)
+    return save(os.path.join(store, "suitability"), "sklearn_forest", compile_sklearn_forest(model),
+                {"suitability": _unpickle(le_path).classes_}, sources=SOURCES["suitability"],
+                reference=_reference("suitability", model))
+
+
+EXPORTERS = {"crop": export_crop, "fertilizer": export_fertilizer, "suitability": export_suitability}
+
+
+def verify(store, name):
+    # Max probability difference between the export and the pickle on random rows
+    exported = load(os.path.join(store, name))["model"]
+    model = _unpickle(SOURCES[name][0])
+    if name == "fertilizer":
+        model = model["model"]
+    X = _probe(name, model.n_features_in_)
+    diff = np.abs(exported.predict_proba(X) - model.predict_proba(X))
+    agree = (exported.predict_proba(X).argmax(1) == model.predict_proba(X).argmax(1)).mean()
+    return float(diff.max()), float(agree)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export the served models to the memory-mappable store")
+    ap.add_argument("command", choices=["export", "verify", "info"])
+    ap.add_argument("--store", default=DEFAULT_STORE)
+    ap.add_argument("--only", help="comma separated subset of: " + ", ".join(EXPORTERS))
+    args = ap.parse_args()
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(EXPORTERS)
+
+    for name in names:
+        if name not in EXPORTERS:
+            print(f"ERROR: unknown model {name!r}")
+            sys.exit(1)
+        if args.command == "export":
+            missing = [p for p in SOURCES[name] if not os.path.exists(p)]
+            if missing:
+                print(f"⚠️ {name}: skipped, missing {', '.join(map(os.path.basename, missing))}")
+                continue
+            t0 = time.perf_counter()
+            manifest = EXPORTERS[name](args.store)
+            size = sum(os.path.getsize(os.path.join(args.store, name, a + ".npy")) for a in manifest["arrays"])
+            print(f"✅ {name}: exported {len(manifest['arrays'])} arrays ({size / 1e6:.1f} MB) "
+                  f"in {time.perf_counter() - t0:.1f}s")
+        elif args.command == "verify":
+            max_diff, agree = verify(args.store, name)
+            print(f"{name}: max |p_export - p_pickle| = {max_diff:.2e}, argmax agreement {agree:.4%}")
+        else:
+            path = os.path.join(args.store, name)
+            try:
+                manifest = read_manifest(path)
+            except StoreError as e:
+                print(f"{name}: {e}")
+                continue
+            t0 = time.perf_counter()
+            load(path)
+            load_ms = (time.perf_counter() - t0) * 1000
+            print(f"{name}: {manifest['kind']} v{manifest['format_version']} exported {manifest['created']}, "
+                  f"load {load_ms:.1f} ms, labels {', '.join(f'{k}={len(v)}' for k, v in manifest['labels'].items())}")
+
+
+if __name__ == "__main__":
+    main()
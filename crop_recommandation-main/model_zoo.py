@@ -0,0 +1,357 @@
+# model_zoo.py
+# The crop models shipped with the repo and a leaderboard that compares them.
+#
+#   python model_zoo.py bench                       # -> model_leaderboard.json
+#   python model_zoo.py bench --repeat 500 --markdown leaderboard.md
+#   CROP_MODEL=naive_bayes python app.py            # serve another zoo model
+#   python model_zoo.py cascade --cheap naive_bayes --thresholds 0.5,0.9,0.99
+#   CROP_CASCADE=naive_bayes CROP_CASCADE_THRESHOLD=0.9 python app.py
+#
+# Every model is scored on the same stratified held-out split of
+# crop_recommendation.csv that crop_recommendation.py uses (20%, seed 42).
+# The scikit-learn .pkl files were trained elsewhere, so their split is not
+# known and their held-out accuracy may be optimistic; agreement with XGBoost
+# is reported as well. RSS is measured by loading each model in a fresh
+# interpreter.
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CROP_CSV = os.path.join(BASE_DIR, "crop_recommendation.csv")
+CROP_LE_PATH = os.path.join(BASE_DIR, "crop_label_encoder.pkl")
+FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+RANDOM_STATE = 42
+TEST_SIZE = 0.2
+
+# name -> pickle file. XGBoost predicts label indices, the scikit-learn models predict crop names.
+ZOO = {
+    "xgboost": "XGBoost.pkl",
+    "decision_tree": "DecisionTree.pkl",
+    "logistic_regression": "LR.pkl",
+    "naive_bayes": "NBClassifier.pkl",
+    "svm": "SVM.pkl",
+}
+
+
+class FastGaussianNB:
+    # GaussianNB scored in plain NumPy, without scikit-learn's per-call input checks
+    def __init__(self, nb):
+        self.classes_ = nb.classes_
+        self.theta = nb.theta_
+        self.inv_var = 1.0 / nb.var_
+        self.log_base = np.log(nb.class_prior_) - 0.5 * np.sum(np.log(2.0 * np.pi * nb.var_), axis=1)
+
+    def _jll(self, X):
+        d = np.asarray(X, dtype=np.float64)[:, None, :] - self.theta
+        return self.log_base - 0.5 * np.einsum("nck,ck->nc", d * d, self.inv_var)
+
+    def predict_proba(self, X):
+        jll = self._jll(X)
+        p = np.exp(jll - jll.max(axis=1, keepdims=True))
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict_index(self, X):
+        return self._jll(X).argmax(axis=1)
+
+
+class FastDecisionTree:
+    # DecisionTreeClassifier walked level by level over flat node arrays.
+    # Inputs are rounded through float32 like scikit-learn does before comparing.
+    def __init__(self, tree):
+        t = tree.tree_
+        self.classes_ = tree.classes_
+        leaf = t.children_left == -1
+        nodes = np.arange(t.node_count)
+        self.feature = np.where(leaf, 0, t.feature)
+        self.threshold = np.where(leaf, np.inf, t.threshold)
+        self.left = np.where(leaf, nodes, t.children_left)      # leaves loop onto themselves
+        self.right = np.where(leaf, nodes, t.children_right)
+        value = t.value[:, 0, :]
+        self.proba = value / value.sum(axis=1, keepdims=True)
+        self.depth = int(t.max_depth)
+
+    def _leaves(self, X):
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        node = np.zeros(len(X), dtype=np.intp)
+        rows = np.arange(len(X))
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        return self.proba[self._leaves(X)]
+
+    def predict_index(self, X):
+        return self.proba[self._leaves(X)].argmax(axis=1)
+
+
+def compile_fast(model, probe):
+    # NumPy version of a GaussianNB / DecisionTreeClassifier, or None when there
+    # is none or it does not reproduce the model's probabilities on `probe`.
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.tree import DecisionTreeClassifier
+
+    if type(model) is GaussianNB:
+        fast = FastGaussianNB(model)
+    elif type(model) is DecisionTreeClassifier and model.n_outputs_ == 1:
+        fast = FastDecisionTree(model)
+    else:
+        return None
+    if not np.allclose(fast.predict_proba(probe), model.predict_proba(probe), atol=1e-6):
+        return None
+    return fast
+
+
+def probe_rows(n=512, seed=0):
+    # Random inputs over the crop feature ranges, for checking compiled models
+    lo = np.array([0, 5, 5, 8, 14, 3.5, 20])
+    hi = np.array([140, 145, 205, 44, 100, 10, 300])
+    return np.random.default_rng(seed).uniform(lo, hi, size=(n, len(lo)))
+
+
+class ClassIndexModel:
+    # Wraps a classifier that predicts crop names so it behaves like the
+    # XGBoost crop model: predict() returns indices into le.classes_ and the
+    # predict_proba() columns follow le.classes_.
+    def __init__(self, model, classes):
+        self.model = model
+        index = {c: i for i, c in enumerate(classes)}
+        missing = [c for c in model.classes_ if c not in index]
+        if missing:
+            raise ValueError(f"model predicts classes the label encoder does not know: {missing}")
+        self.n_classes = len(classes)
+        self.columns = np.array([index[c] for c in model.classes_])
+        self._index = index
+
+    def predict_proba(self, X):
+        p = self.model.predict_proba(X)
+        out = np.zeros((len(p), self.n_classes))
+        out[:, self.columns] = p
+        return out
+
+    def predict(self, X):
+        if hasattr(self.model, "predict_index"):
+            return self.columns[self.model.predict_index(X)]
+        return np.array([self._index[c] for c in self.model.predict(X)])
+
+
+def model_path(name):
+    if name not in ZOO:
+        raise ValueError(f"unknown crop model {name!r}; choose from {', '.join(ZOO)}")
+    return os.path.join(BASE_DIR, ZOO[name])
+
+
+def load_model(name, le, fast=True):
+    # Returns a model with the XGBoost interface (class indices into le.classes_).
+    # With `fast`, models that have a NumPy scorer use it.
+    with open(model_path(name), "rb") as f:
+        model = pickle.load(f)
+    if name == "xgboost":
+        return model
+    if fast:
+        model = compile_fast(model, probe_rows()) or model
+    return ClassIndexModel(model, list(le.classes_))
+
+
+# ==========================
+# LEADERBOARD
+# ==========================
+def holdout_split():
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+
+    df = pd.read_csv(CROP_CSV)
+    X = df[FEATURES].to_numpy(dtype=np.float64)
+    return train_test_split(X, df["label"].astype(str).values, test_size=TEST_SIZE,
+                            random_state=RANDOM_STATE, stratify=df["label"])
+
+
+def percentiles_us(fn, rows, repeat):
+    samples = []
+    for i in range(repeat):
+        x = rows[i % len(rows)]
+        t0 = time.perf_counter()
+        fn(x)
+        samples.append(time.perf_counter() - t0)
+    s = np.array(samples) * 1e6
+    return round(float(np.percentile(s, 50)), 1), round(float(np.percentile(s, 95)), 1)
+
+
+def measure_rss(name):
+    # Loads the model in a fresh interpreter: RSS added by the load, in MB
+    code = ("import os,pickle,warnings;warnings.filterwarnings('ignore');import numpy,sklearn,xgboost\n"
+            "def rss():\n"
+            "    for l in open('/proc/self/status'):\n"
+            "        if l.startswith('VmRSS:'): return int(l.split()[1])\n"
+            "a=rss();m=pickle.load(open(%r,'rb'));print((rss()-a)/1024)" % model_path(name))
+    try:
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120)
+        return round(float(out.stdout.strip().splitlines()[-1]), 2)
+    except (OSError, ValueError, IndexError, subprocess.TimeoutExpired):
+        return None
+
+
+def bench(names, repeat):
+    from tree_ensemble import compile_xgboost
+
+    with open(CROP_LE_PATH, "rb") as f:
+        le = pickle.load(f)
+    X_train, X_test, y_train, y_test = holdout_split()
+    rows = [X_test[i:i + 1] for i in range(len(X_test))]
+    reference = None
+
+    candidates = []
+    for name in names:
+        model = load_model(name, le, fast=False)
+        candidates.append((name, name, model))
+        if name == "xgboost":
+            try:
+                candidates.append(("xgboost_native", name, compile_xgboost(model)))
+            except Exception as e:
+                print(f"⚠️ Skipping xgboost_native: {e}")
+        else:
+            fast = compile_fast(model.model, probe_rows())
+            if fast is not None:
+                candidates.append((name + "_numpy", name, ClassIndexModel(fast, list(le.classes_))))
+
+    board = []
+    for label, name, model in candidates:
+        print(f"Scoring {label}...")
+        pred = le.classes_[model.predict(X_test)]
+        if label == "xgboost":
+            reference = pred
+        single_p50, single_p95 = percentiles_us(model.predict_proba, rows, repeat)
+        t0 = time.perf_counter()
+        for _ in range(5):
+            model.predict_proba(X_test)
+        batch_us = (time.perf_counter() - t0) / 5 / len(X_test) * 1e6
+        board.append({
+            "model": label,
+            "file": ZOO[name],
+            "accuracy": round(float((pred == y_test).mean()), 4),
+            "predictions": pred,
+            "single_row_p50_us": single_p50,
+            "single_row_p95_us": single_p95,
+            "batch_us_per_row": round(batch_us, 2),
+            "file_kb": round(os.path.getsize(model_path(name)) / 1024, 1),
+            "rss_mb": measure_rss(name),
+        })
+
+    for row in board:
+        preds = row.pop("predictions")
+        row["agreement_with_xgboost"] = round(float((preds == reference).mean()), 4) if reference is not None else None
+    board.sort(key=lambda r: (-r["accuracy"], r["single_row_p50_us"]))
+    return board, len(X_test)
+
+
+def cascade_report(cheap_name, full_name, thresholds, repeat):
+    # Escalation rate, agreement with the full model alone and expected latency
+    # of a cascade where `cheap_name` answers when its top probability >= threshold.
+    from tree_ensemble import compile_xgboost
+
+    with open(CROP_LE_PATH, "rb") as f:
+        le = pickle.load(f)
+    X_train, X_test, y_train, y_test = holdout_split()
+    rows = [X_test[i:i + 1] for i in range(len(X_test))]
+    cheap = load_model(cheap_name, le)
+    full = load_model(full_name, le)
+    if full_name == "xgboost":
+        # What the app uses for single rows, when the trees compile
+        try:
+            full = compile_xgboost(full)
+        except Exception as e:
+            print(f"⚠️ Timing {full_name} with XGBoost predict: {e}")
+
+    p = cheap.predict_proba(X_test)
+    conf, cheap_pred = p.max(axis=1), p.argmax(axis=1)
+    full_pred = full.predict(X_test)
+    cheap_us = percentiles_us(cheap.predict_proba, rows, repeat)[0]
+    full_us = percentiles_us(full.predict_proba, rows, repeat)[0]
+
+    out = []
+    for t in thresholds:
+        escalated = conf < t
+        final = np.where(escalated, full_pred, cheap_pred)
+        rate = float(escalated.mean())
+        out.append({
+            "threshold": t,
+            "escalation_rate": round(rate, 4),
+            "agreement_with_full": round(float((final == full_pred).mean()), 4),
+            "accuracy": round(float((le.classes_[final] == y_test).mean()), 4),
+            "expected_us": round(cheap_us + rate * full_us, 1),
+        })
+    return {"cheap": cheap_name, "full": full_name, "holdout_rows": len(X_test),
+            "cheap_us": cheap_us, "full_us": full_us,
+            "full_accuracy": round(float((le.classes_[full_pred] == y_test).mean()), 4),
+            "thresholds": out}
+
+
+def print_board(board):
+    cols = ["model", "accuracy", "agreement_with_xgboost", "single_row_p50_us", "single_row_p95_us",
+            "batch_us_per_row", "file_kb", "rss_mb"]
+    lines = ["| " + " | ".join(cols) + " |", "|" + "---|" * len(cols)]
+    for r in board:
+        lines.append("| " + " | ".join(str(r[c]) for c in cols) + " |")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare the shipped crop models")
+    ap.add_argument("command", choices=["bench", "cascade"])
+    ap.add_argument("--models", default=",".join(ZOO))
+    ap.add_argument("--repeat", type=int, default=300, help="single-row calls per model")
+    ap.add_argument("--out", help="JSON output (default model_leaderboard.json / cascade_report.json)")
+    ap.add_argument("--markdown", help="also write the table as markdown here")
+    ap.add_argument("--cheap", default="naive_bayes", help="cascade: model that answers first")
+    ap.add_argument("--full", default="xgboost", help="cascade: model escalated to")
+    ap.add_argument("--thresholds", default="0.5,0.7,0.8,0.9,0.95,0.99,0.999")
+    args = ap.parse_args()
+
+    if args.command == "cascade":
+        for n in (args.cheap, args.full):
+            model_path(n)
+        report = cascade_report(args.cheap, args.full, [float(t) for t in args.thresholds.split(",")], args.repeat)
+        print(f"cheap {args.cheap}: {report['cheap_us']} us, full {args.full}: {report['full_us']} us, "
+              f"full accuracy {report['full_accuracy']}")
+        print(f"{'threshold':>10}{'escalated':>11}{'agreement':>11}{'accuracy':>10}{'expected us':>13}")
+        for r in report["thresholds"]:
+            print(f"{r['threshold']:>10}{r['escalation_rate']:>11.2%}{r['agreement_with_full']:>11.4f}"
+                  f"{r['accuracy']:>10.4f}{r['expected_us']:>13}")
+        out = args.out or os.path.join(BASE_DIR, "cascade_report.json")
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {out}")
+        return
+
+    names = [n.strip() for n in args.models.split(",") if n.strip()]
+    for n in names:
+        model_path(n)
+    board, n_test = bench(names, args.repeat)
+    table = print_board(board)
+    print("\n" + table)
+
+    out = args.out or os.path.join(BASE_DIR, "model_leaderboard.json")
+    with open(out, "w") as f:
+        json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "holdout_rows": n_test,
+                   "test_size": TEST_SIZE, "random_state": RANDOM_STATE, "leaderboard": board}, f, indent=2)
+    print(f"\nSaved {out}")
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            f.write(table + "\n")
+
+
+if __name__ == "__main__":
+    main()
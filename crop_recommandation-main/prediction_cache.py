@@ -0,0 +1,93 @@
+# prediction_cache.py
+# Bounded LRU + TTL cache placed in front of a model.
+#
+# Keys are the model version plus the input features rounded to a fixed
+# number of decimals, so near-identical submissions (same farm, same sensor
+# readings give or take noise) share one entry. The rounding is only used for
+# the key: a miss scores the exact input, and a hit returns the answer for the
+# first input seen in that key's bucket. Raise `digits` to narrow the buckets.
+#
+#   cache = PredictionCache("crop", maxsize=4096, ttl=600, digits=1)
+#   key = (version, cache.key_for(row))
+#   hit = cache.get(key)
+#   if hit is MISS: cache.put(key, model(row))
+
+import threading
+import time
+from collections import OrderedDict
+
+MISS = object()
+
+
+class PredictionCache:
+    def __init__(self, name, maxsize=4096, ttl=600.0, digits=1):
+        self.name = name
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self.digits = int(digits)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def key_for(self, values):
+        if not self.enabled:
+            return tuple(float(v) for v in values)
+        return tuple(round(float(v), self.digits) for v in values)
+
+    def get(self, key):
+        if not self.enabled:
+            return MISS
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISS
+            expires, value = item
+            if self.ttl > 0 and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "digits": self.digits,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
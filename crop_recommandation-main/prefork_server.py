@@ -0,0 +1,208 @@
+# prefork_server.py
+# Production launcher for app.py: load every artifact once in a master
+# process, then fork N workers that share those pages copy-on-write.
+#
+#   python prefork_server.py --workers 4 --port 5000
+#   python prefork_server.py --workers 4 --report-interval 60 --report-file memory.json
+#   kill -USR1 <master pid>      # print the per-worker memory report now
+#
+# The master binds the listening socket and every worker accepts on it. The
+# memory report reads /proc/<pid>/smaps_rollup and splits each process into
+# unique memory (private pages, what one more worker would cost) and shared
+# memory (pages still shared with the master and the other workers).
+#
+# The IoT routes (/api/telemetry, /api/irrigation, /api/suitability/stream) keep
+# their state in process memory and write one set of rollup files, so with more
+# than one worker they answer 503; serve devices with --workers 1 or app.py.
+# A worker that dies within MIN_UPTIME_SECONDS of starting is restarted after a
+# doubling delay (up to RESPAWN_MAX_DELAY), so a crash at boot does not spin.
+
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+import app as api
+
+MIN_UPTIME_SECONDS = 10.0
+RESPAWN_MAX_DELAY = 60.0
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid):
+    # Values in kB from /proc/<pid>/smaps_rollup (Linux 4.14+)
+    out = dict.fromkeys(SMAPS_FIELDS, 0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in out:
+                    out[key] = int(rest.split()[0])
+    except OSError:
+        return None
+    return {
+        "rss_kb": out["Rss"],
+        "pss_kb": out["Pss"],
+        "unique_kb": out["Private_Clean"] + out["Private_Dirty"],
+        "shared_kb": out["Shared_Clean"] + out["Shared_Dirty"],
+    }
+
+
+def memory_report(master_pid, workers):
+    procs = [("master", master_pid)] + [(f"worker-{i}", pid) for i, pid in sorted(workers.items())]
+    rows = []
+    for role, pid in procs:
+        mem = read_memory(pid)
+        if mem is not None:
+            rows.append(dict(role=role, pid=pid, **mem))
+    worker_rows = [r for r in rows if r["role"] != "master"]
+    summary = {
+        "workers": len(worker_rows),
+        "total_pss_mb": round(sum(r["pss_kb"] for r in rows) / 1024, 1),
+        "mean_worker_unique_mb": round(sum(r["unique_kb"] for r in worker_rows) / max(len(worker_rows), 1) / 1024, 1),
+    }
+    return {"time": time.time(), "processes": rows, "summary": summary}
+
+
+def print_report(report):
+    print(f"\n{'process':<12}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'unique MB':>11}{'shared MB':>11}")
+    for r in report["processes"]:
+        print(f"{r['role']:<12}{r['pid']:>8}{r['rss_kb'] / 1024:>10.1f}{r['pss_kb'] / 1024:>10.1f}"
+              f"{r['unique_kb'] / 1024:>11.1f}{r['shared_kb'] / 1024:>11.1f}")
+    s = report["summary"]
+    print(f"total PSS {s['total_pss_mb']} MB; each extra worker costs ~{s['mean_worker_unique_mb']} MB\n")
+    sys.stdout.flush()
+
+
+def run_worker(sock, host, port, telemetry_feed):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    if api.MODEL_WATCH_SECONDS > 0:
+        api.registry.start_watcher(api.MODEL_WATCH_SECONDS)
+    if telemetry_feed:
+        api.start_telemetry_feed()
+    server = make_server(host, port, api.app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pre-fork server for app.py")
+    ap.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", os.cpu_count() or 2)))
+    ap.add_argument("--report-interval", type=float, default=0, help="seconds between memory reports (0 = off)")
+    ap.add_argument("--report-file", help="write the latest memory report here as JSON")
+    args = ap.parse_args()
+
+    # Load everything before forking so workers inherit it instead of unpickling their own copies
+    t0 = time.perf_counter()
+    api.registry.warm()
+    api.load_lazy_models()
+    print(f"Loaded artifacts in {time.perf_counter() - t0:.1f}s: "
+          f"{ {n: s['state'] for n, s in api.registry.status().items()} }")
+    if not api.registry.ready():
+        print("❌ Required models failed to load; not starting workers")
+        sys.exit(1)
+    if args.workers > 1:
+        api.disable_telemetry("IoT routes are off under prefork_server.py with several workers; "
+                              "run it with --workers 1 or serve devices from app.py")
+        print(f"⚠️ {args.workers} workers: /api/telemetry, /api/irrigation and /api/suitability/stream "
+              f"will answer 503 (use --workers 1 to serve them)")
+
+    # Move everything allocated so far out of the GC's reach: collections in
+    # the workers would otherwise write to these objects and un-share the pages.
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((args.host, args.port), backlog=2048, reuse_port=False)
+    sock.set_inheritable(True)
+
+    master_pid = os.getpid()
+    workers = {}
+    started = {}                # slot -> monotonic start time
+    crashes = {}                # slot -> consecutive early exits
+    respawn_at = {}             # slot -> monotonic time the replacement is due
+    stopping = False
+    report_due = [False]
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, args.host, args.port, args.workers == 1)
+            finally:
+                os._exit(0)
+        workers[slot] = pid
+        started[slot] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report_due.__setitem__(0, True))
+
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"✅ Master {master_pid} serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    next_report = time.monotonic() + args.report_interval if args.report_interval > 0 else None
+    while not stopping:
+        # Respawn workers that died
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid:
+            slot = next((s for s, p in workers.items() if p == pid), None)
+            if slot is not None and not stopping:
+                del workers[slot]
+                if time.monotonic() - started[slot] < MIN_UPTIME_SECONDS:
+                    crashes[slot] = crashes.get(slot, 0) + 1
+                else:
+                    crashes[slot] = 0
+                delay = min(RESPAWN_MAX_DELAY, 2 ** (crashes[slot] - 1)) if crashes[slot] else 0
+                print(f"⚠️ Worker {pid} exited ({status}); restarting in {delay:.0f}s")
+                respawn_at[slot] = time.monotonic() + delay
+            continue
+        for slot, due in list(respawn_at.items()):
+            if time.monotonic() >= due:
+                del respawn_at[slot]
+                spawn(slot)
+
+        if next_report is not None and time.monotonic() >= next_report:
+            report_due[0] = True
+            next_report = time.monotonic() + args.report_interval
+        if report_due[0]:
+            report_due[0] = False
+            report = memory_report(master_pid, workers)
+            print_report(report)
+            if args.report_file:
+                with open(args.report_file, "w") as f:
+                    json.dump(report, f, indent=2)
+        time.sleep(0.2)
+
+    for pid in workers.values():
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers.values():
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
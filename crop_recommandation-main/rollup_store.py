@@ -0,0 +1,371 @@
+# rollup_store.py
+# Long-term sensor history: a short window of raw readings plus min / max /
+# mean / count rollups at 1 minute, 1 hour and 1 day, kept on disk per device.
+#
+#   <root>/<device>/raw/<hour>.bin     raw readings (RAW structs), hourly segments,
+#                                      deleted after --raw-retention seconds
+#   <root>/<device>/60.bin             ROLLUP structs, one per minute with data
+#   <root>/<device>/3600.bin           ... per hour
+#   <root>/<device>/86400.bin          ... per day
+#
+# Every file is a bare array of fixed-size structs, so it can be opened with
+# np.memmap / np.fromfile and is only ever appended to; the one exception is
+# the last row of a rollup file, the still-open bucket, which is rewritten in
+# place until a reading lands in a later bucket. A batch updates all three
+# resolutions with a few reduceat calls, without re-reading older data.
+#
+#   store = RollupStore("telemetry_history")
+#   store.append("esp32-01", ts, values)             # time ordered, as in telemetry.py
+#   store.series("esp32-01", start, end)             # one resolution, <= max_points buckets
+#   store.summary("esp32-01", start, end)            # whole days, then hours, minutes, raw
+#                                                    # (minutes where raw has expired)
+#
+#   python rollup_store.py import readings.bin --root telemetry_history   # serial_reader.py --store output
+#   python rollup_store.py summary esp32-01 --root telemetry_history --hours 48
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from telemetry import FIELDS, RECORD, DEVICE_ID
+
+FORMAT_VERSION = 1
+RESOLUTIONS = (60, 3600, 86400)
+RAW_SEGMENT_SECONDS = 3600
+RAW_RETENTION_SECONDS = 6 * 3600
+
+F = len(FIELDS)
+RAW = np.dtype([("ts", "<f8"), ("values", "<f4", (F,))])
+ROLLUP = np.dtype([("t", "<i8"), ("count", "<u4", (F,)), ("min", "<f4", (F,)),
+                   ("max", "<f4", (F,)), ("sum", "<f8", (F,))])
+
+
+def rollup_rows(ts, values, resolution):
+    # One ROLLUP row per bucket touched by the (time ordered) readings
+    buckets = (np.floor(ts / resolution) * resolution).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    present = ~np.isnan(values)
+    rows = np.zeros(len(starts), dtype=ROLLUP)
+    rows["t"] = buckets[starts]
+    rows["count"] = np.add.reduceat(present, starts, axis=0)
+    rows["min"] = np.fmin.reduceat(values, starts, axis=0)
+    rows["max"] = np.fmax.reduceat(values, starts, axis=0)
+    rows["sum"] = np.add.reduceat(np.where(present, values, 0).astype(np.float64), starts, axis=0)
+    return rows
+
+
+def merge_rows(a, b):
+    # Combines two rollup rows for the same bucket
+    out = a.copy()
+    out["count"] = a["count"] + b["count"]
+    out["min"] = np.fmin(a["min"], b["min"])
+    out["max"] = np.fmax(a["max"], b["max"])
+    out["sum"] = a["sum"] + b["sum"]
+    return out
+
+
+def _read_array(path, dtype, mmap=True):
+    if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+        return np.zeros(0, dtype=dtype)
+    n = os.path.getsize(path) // dtype.itemsize
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+    return np.fromfile(path, dtype=dtype, count=n)
+
+
+class _Device:
+    # Write state for one device: newest ts and the open bucket of each resolution
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "raw"), exist_ok=True)
+        self.last_rows = {}
+        self.last_ts = -np.inf
+        for r in RESOLUTIONS:
+            rows = _read_array(self._rollup_path(r), ROLLUP)
+            if len(rows):
+                self.last_rows[r] = (len(rows) - 1, rows[-1].copy())
+                self.last_ts = max(self.last_ts, float(rows[-1]["t"]))
+        segments = self.raw_segments()
+        if segments:
+            raw = _read_array(self._raw_path(segments[-1]), RAW)
+            if len(raw):
+                self.last_ts = max(self.last_ts, float(raw["ts"][-1]))
+
+    def _rollup_path(self, resolution):
+        return os.path.join(self.path, f"{resolution}.bin")
+
+    def _raw_path(self, segment):
+        return os.path.join(self.path, "raw", f"{segment}.bin")
+
+    def raw_segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(os.path.join(self.path, "raw"))
+                      if name.endswith(".bin") and name[:-4].isdigit())
+
+
+class RollupStore:
+    def __init__(self, root, raw_retention=RAW_RETENTION_SECONDS):
+        self.root = root
+        self.raw_retention = raw_retention
+        self._devices = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        meta_path = os.path.join(root, "meta.json")
+        meta = {"format_version": FORMAT_VERSION, "fields": list(FIELDS), "resolutions": list(RESOLUTIONS)}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                found = json.load(f)
+            if found != meta:
+                raise ValueError(f"{root} was written with a different layout: {found}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+
+    def _device(self, device, create=True):
+        if not DEVICE_ID.match(device):
+            raise ValueError(f"Invalid device id: {device!r}")
+        dev = self._devices.get(device)
+        if dev is None:
+            path = os.path.join(self.root, device)
+            if not create and not os.path.isdir(path):
+                raise KeyError(f"No history for {device}")
+            dev = self._devices[device] = _Device(path)
+        return dev
+
+    def devices(self):
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    # --- writes ---
+    def append(self, device, ts, values):
+        # ts sorted ascending; readings older than the newest stored one are dropped.
+        # Returns the number stored.
+        with self._lock:
+            dev = self._device(device)
+            keep = ts >= dev.last_ts
+            ts, values = ts[keep], np.asarray(values, dtype=np.float32)[keep]
+            if not len(ts):
+                return 0
+            self._append_raw(dev, ts, values)
+            for r in RESOLUTIONS:
+                rows = rollup_rows(ts, values, r)
+                path = dev._rollup_path(r)
+                last = dev.last_rows.get(r)
+                with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                    if last is not None and last[1]["t"] == rows[0]["t"]:
+                        rows[0] = merge_rows(last[1], rows[0])
+                        f.seek(last[0] * ROLLUP.itemsize)
+                        index = last[0]
+                    else:
+                        f.seek(0, os.SEEK_END)
+                        index = f.tell() // ROLLUP.itemsize
+                    f.write(rows.tobytes())
+                dev.last_rows[r] = (index + len(rows) - 1, rows[-1].copy())
+            dev.last_ts = float(ts[-1])
+            return len(ts)
+
+    def _append_raw(self, dev, ts, values):
+        raw = np.empty(len(ts), dtype=RAW)
+        raw["ts"], raw["values"] = ts, values
+        segment = (ts // RAW_SEGMENT_SECONDS).astype(np.int64) * RAW_SEGMENT_SECONDS
+        cuts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1], True])
+        for lo, hi in zip(cuts[:-1], cuts[1:]):
+            with open(dev._raw_path(int(segment[lo])), "ab") as f:
+                f.write(raw[lo:hi].tobytes())
+        # Retention: drop whole segments that ended before the window
+        horizon = ts[-1] - self.raw_retention
+        for seg in dev.raw_segments():
+            if seg + RAW_SEGMENT_SECONDS < horizon:
+                os.remove(dev._raw_path(seg))
+
+    def ingest(self, devices, ts, values):
+        # Mixed-device batch (e.g. telemetry.RECORD columns); returns the number stored
+        uniq, inverse = np.unique(devices, return_inverse=True)
+        order = np.lexsort((ts, inverse))
+        bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+        stored = 0
+        for k, device in enumerate(uniq.tolist()):
+            rows = order[bounds[k]:bounds[k + 1]]
+            name = device.decode("ascii", "replace") if isinstance(device, bytes) else str(device)
+            stored += self.append(name, ts[rows], values[rows])
+        return stored
+
+    def ingest_records(self, buf):
+        rec = np.frombuffer(buf, dtype=RECORD)
+        values = np.column_stack([rec[f] for f in FIELDS]).astype(np.float32)
+        return self.ingest(rec["device"], rec["ts"].astype(np.float64), values)
+
+    # --- reads ---
+    def _raw(self, dev, start, end):
+        parts = []
+        for seg in dev.raw_segments():
+            if seg + RAW_SEGMENT_SECONDS <= start or seg >= end:
+                continue
+            raw = _read_array(dev._raw_path(seg), RAW)
+            lo, hi = np.searchsorted(raw["ts"], [start, end])
+            parts.append(np.array(raw[lo:hi]))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RAW)
+
+    def _rollups(self, dev, resolution, start, end):
+        # Buckets starting in [start, end)
+        rows = _read_array(dev._rollup_path(resolution), ROLLUP)
+        lo, hi = np.searchsorted(rows["t"], [start, end])
+        return np.array(rows[lo:hi])
+
+    def raw_start(self, device):
+        with self._lock:
+            segments = self._device(device, create=False).raw_segments()
+        return segments[0] if segments else None
+
+    def series(self, device, start, end, max_points=1000, resolution=None):
+        # Picks the finest resolution that fits in max_points buckets (raw counts as
+        # 1 s steps, and only while its window still covers `start`), or the one
+        # asked for. Returns (resolution, columns); resolution 0 means raw readings.
+        start, end = float(start), float(end)
+        with self._lock:
+            dev = self._device(device, create=False)
+            if resolution is None:
+                segments = dev.raw_segments()
+                if segments and segments[0] <= start and end - start <= max_points:
+                    resolution = 0
+                else:
+                    resolution = next((r for r in RESOLUTIONS if (end - start) / r <= max_points), RESOLUTIONS[-1])
+            if resolution == 0:
+                return 0, _raw_columns(self._raw(dev, start, end))
+            if resolution not in RESOLUTIONS:
+                raise ValueError(f"resolution must be 0 (raw) or one of {RESOLUTIONS}")
+            return resolution, _rollup_columns(self._rollups(dev, resolution, start, end))
+
+    def plan(self, start, end, raw_from=-np.inf):
+        # [(resolution, lo, hi)] covering [start, end): whole buckets of the coarsest
+        # resolution that fits, finer ones towards the edges, raw for what is left.
+        # Raw readings before `raw_from` are gone (retention), so a sub-minute edge
+        # there widens to its whole 1-minute bucket instead.
+        pieces = []
+        finest = min(RESOLUTIONS)
+
+        def cover(lo, hi, levels):
+            if lo >= hi:
+                return
+            if not levels:
+                if lo < raw_from:
+                    pieces.append((finest, float(np.floor(lo / finest) * finest),
+                                   float(np.ceil(hi / finest) * finest)))
+                else:
+                    pieces.append((0, lo, hi))
+                return
+            r = levels[0]
+            a, b = float(np.ceil(lo / r) * r), float(np.floor(hi / r) * r)
+            if a >= b:
+                return cover(lo, hi, levels[1:])
+            cover(lo, a, levels[1:])
+            pieces.append((r, a, b))
+            cover(b, hi, levels[1:])
+
+        cover(float(start), float(end), sorted(RESOLUTIONS, reverse=True))
+        return pieces
+
+    def summary(self, device, start, end):
+        # min / max / mean / count per field over the pieces of plan(). "start" and
+        # "end" are the range actually covered, which is wider than the one asked
+        # for when an edge falls where raw readings are no longer kept.
+        # rows_read shows how many rows each resolution gave.
+        parts, rows_read = [], {}
+        with self._lock:
+            dev = self._device(device, create=False)
+            segments = dev.raw_segments()
+            pieces = self.plan(start, end, segments[0] if segments else np.inf)
+            for resolution, lo, hi in pieces:
+                if resolution == 0:
+                    cols = _raw_columns(self._raw(dev, lo, hi))
+                else:
+                    cols = _rollup_columns(self._rollups(dev, resolution, lo, hi))
+                parts.append(cols)
+                key = str(resolution or "raw")
+                rows_read[key] = rows_read.get(key, 0) + len(cols["t"])
+        count = np.concatenate([p["count"] for p in parts]).sum(axis=0)
+        total = np.concatenate([p["sum"] for p in parts]).sum(axis=0)
+        lo = np.fmin.reduce(np.concatenate([p["min"] for p in parts]), axis=0)
+        hi = np.fmax.reduce(np.concatenate([p["max"] for p in parts]), axis=0)
+        fields = {f: {"count": int(count[i]),
+                      "min": float(lo[i]) if count[i] else None,
+                      "max": float(hi[i]) if count[i] else None,
+                      "mean": float(total[i] / count[i]) if count[i] else None}
+                  for i, f in enumerate(FIELDS)}
+        covered = (min(p[1] for p in pieces), max(p[2] for p in pieces)) if pieces else (start, end)
+        return {"start": covered[0], "end": covered[1], "requested": {"start": start, "end": end},
+                "rows_read": rows_read, "fields": fields}
+
+
+def _rollup_columns(rows):
+    return {"t": rows["t"].astype(np.float64), "count": rows["count"].astype(np.int64),
+            "min": rows["min"], "max": rows["max"], "sum": rows["sum"]}
+
+
+def _raw_columns(raw):
+    # Raw readings as one-reading buckets, so they combine like rollup rows
+    present = ~np.isnan(raw["values"])
+    return {"t": raw["ts"], "count": present.astype(np.int64), "min": raw["values"],
+            "max": raw["values"], "sum": np.where(present, raw["values"], 0).astype(np.float64)}
+
+
+def columns_to_json(resolution, cols):
+    # Series as columnar JSON: bucket starts, then mean/min/max/count per field
+    count = cols["count"]
+    has = count > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = cols["sum"] / count
+
+    def column(a, i):
+        return [v if h else None for v, h in zip(a[:, i].tolist(), has[:, i].tolist())]
+
+    return {"resolution": resolution or "raw", "t": cols["t"].tolist(),
+            "fields": {f: {"mean": column(mean, i), "min": column(cols["min"], i),
+                           "max": column(cols["max"], i), "count": count[:, i].tolist()}
+                       for i, f in enumerate(FIELDS)}}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-resolution sensor history")
+    ap.add_argument("command", choices=["import", "summary", "series", "info"])
+    ap.add_argument("target", nargs="?", help="records file for import, device for summary/series")
+    ap.add_argument("--root", default=os.environ.get("TELEMETRY_ROLLUP_DIR", "telemetry_history"))
+    ap.add_argument("--hours", type=float, default=24, help="look-back window for summary/series")
+    ap.add_argument("--max-points", type=int, default=1000)
+    args = ap.parse_args()
+    store = RollupStore(args.root)
+
+    if args.command == "import":
+        if not args.target or not os.path.exists(args.target):
+            print("ERROR: give the records file written by serial_reader.py --store")
+            sys.exit(1)
+        t0 = time.perf_counter()
+        buf = open(args.target, "rb").read()
+        buf = buf[:len(buf) - len(buf) % RECORD.itemsize]
+        stored = store.ingest_records(buf)
+        print(f"✅ {stored} of {len(buf) // RECORD.itemsize} readings stored in {time.perf_counter() - t0:.2f}s")
+    elif args.command == "info":
+        for device in store.devices():
+            dev = store._device(device)
+            sizes = {r: len(_read_array(dev._rollup_path(r), ROLLUP)) for r in RESOLUTIONS}
+            print(f"{device}: rollup rows {sizes}, raw segments {len(dev.raw_segments())}")
+    else:
+        if not args.target:
+            print("ERROR: give a device id")
+            sys.exit(1)
+        end = time.time()
+        start = end - args.hours * 3600
+        if args.command == "summary":
+            print(json.dumps(store.summary(args.target, start, end), indent=2))
+        else:
+            resolution, cols = store.series(args.target, start, end, args.max_points)
+            series = columns_to_json(resolution, cols)
+            print(f"{len(series['t'])} points at resolution {series['resolution']}")
+            print(json.dumps({f: v["mean"][-10:] for f, v in series["fields"].items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+# serial_reader.py
+# Reads the serial output of nitte_iot.ino devices ("Soil: 42%  Gate: CLOSED")
+# and forwards it to the backend in batches.
+#
+#   python serial_reader.py /dev/ttyUSB0 field-b=/dev/ttyUSB1 --url http://127.0.0.1:5000
+#   python serial_reader.py field-a=/tmp/field-a.log --store readings.bin    # file stand-in
+#
+# One asyncio loop serves every source. Serial ports and pseudo-terminals are
+# put in raw mode at --baud and read through loop.add_reader, so an idle port
+# costs nothing; regular files are tailed every --poll-seconds. Bytes are
+# split into lines incrementally, parsed, stamped with the host clock and
+# appended to a telemetry.RECORD array. The array is flushed when it holds
+# --batch-size readings or is --flush-seconds old:
+#   --url      POST to <url>/api/telemetry as application/octet-stream
+#   --store    append the raw records to a file (np.fromfile(path, telemetry.RECORD))
+#   --rollups  write them into a rollup_store.py history folder
+# Sends run in a background task with retries, so a slow backend never stalls
+# reading. A batch a sink rejects outright (HTTP 4xx other than 408/429, an
+# invalid device id for --rollups) is not retried: it is logged, counted as
+# dropped, and the next batch goes out. A port that disappears is reopened
+# every --retry-seconds.
+
+import argparse
+import asyncio
+import errno
+import os
+import re
+import signal
+import stat
+import sys
+import termios
+import time
+import tty
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from telemetry import RECORD, FIELD_INDEX, GATE_STATES, RECORD_CONTENT_TYPE
+
+MAX_LINE_BYTES = 512
+# Batches kept while the backend is unreachable; older ones are dropped first
+MAX_PENDING_BATCHES = 100
+# HTTP 4xx answers that are worth retrying; any other 4xx rejects the batch for good
+RETRY_STATUS = {408, 429}
+
+KEYS = {b"soil": "soil", b"gate": "gate", b"temp": "temperature",
+        b"temperature": "temperature", b"humidity": "humidity"}
+PAIR = re.compile(rb"([A-Za-z]+)\s*:\s*(-?\d+(?:\.\d+)?|[A-Za-z]+)")
+
+
+def parse_line(line):
+    # b"Soil: 42%  Gate: CLOSED" -> {"soil": 42.0, "gate": 0.0}; {} for other lines
+    out = {}
+    for key, value in PAIR.findall(line):
+        field = KEYS.get(key.lower())
+        if field == "gate":
+            state = GATE_STATES.get(value.upper().decode("ascii"))
+            if state is not None:
+                out[field] = state
+        elif field is not None:
+            try:
+                out[field] = float(value)
+            except ValueError:
+                pass
+    return out
+
+
+def device_id(spec):
+    # "field-a=/dev/ttyUSB0" or just a path, named after its file name
+    if "=" in spec:
+        name, path = spec.split("=", 1)
+    else:
+        path = spec
+        name = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"[^A-Za-z0-9_.:-]", "_", name)[:32] or "device", path
+
+
+# ==========================
+# BATCHING AND SINKS
+# ==========================
+class Rejected(Exception):
+    # A sink refused the batch itself; sending it again would fail the same way
+    pass
+
+
+class Batcher:
+    def __init__(self, size, flush_seconds, sinks):
+        self.size, self.flush_seconds, self.sinks = size, flush_seconds, sinks
+        self.queue = asyncio.Queue()
+        self._new()
+        self.readings = self.batches = self.sent = self.failed = self.dropped = 0
+        self.queued = 0                         # readings waiting in the queue
+        self.inflight = 0                       # readings in the batch being sent
+
+    def _new(self):
+        self.rec = np.zeros(self.size, dtype=RECORD)
+        for f in FIELD_INDEX:
+            self.rec[f] = np.nan                 # fields a line did not carry
+        self.n = 0
+        self.started = None
+
+    def add(self, device, ts, fields):
+        r = self.rec[self.n]
+        r["device"], r["ts"] = device, ts
+        for f, v in fields.items():
+            r[f] = v
+        self.n += 1
+        self.readings += 1
+        if self.started is None:
+            self.started = time.monotonic()
+        if self.n >= self.size:
+            self.flush()
+
+    def unsent(self):
+        return self.queued + self.inflight
+
+    def flush(self):
+        if self.n:
+            self.queue.put_nowait(self.rec[:self.n].tobytes())
+            self.queued += self.n
+            self.batches += 1
+            self._new()
+            while self.queue.qsize() > MAX_PENDING_BATCHES:
+                lost = len(self.queue.get_nowait()) // RECORD.itemsize
+                self.queued -= lost
+                self.dropped += lost
+
+    async def timer(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds / 4)
+            if self.started is not None and time.monotonic() - self.started >= self.flush_seconds:
+                self.flush()
+
+    async def sender(self, retry_seconds):
+        while True:
+            body = await self.queue.get()
+            self.inflight = len(body) // RECORD.itemsize
+            self.queued -= self.inflight
+            delay = retry_seconds
+            pending = list(self.sinks)
+            rejected = False
+            while True:
+                # Only the sinks that failed are retried, so the others never get a batch twice
+                failed = []
+                for sink in pending:
+                    try:
+                        await sink.send(body)
+                    except Rejected as e:
+                        rejected = True
+                        print(f"❌ {type(sink).__name__} rejected a batch of {self.inflight} readings ({e}); dropping it")
+                    except Exception as e:
+                        failed.append(sink)
+                        print(f"⚠️ {type(sink).__name__} flush failed ({e}); retrying in {delay:.0f}s")
+                if not failed:
+                    if rejected:
+                        self.dropped += self.inflight
+                    else:
+                        self.sent += self.inflight
+                    self.inflight = 0
+                    break
+                self.failed += 1
+                pending = failed
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+
+class HttpSink:
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url.rstrip("/") + "/api/telemetry"
+        self.headers = {"Content-Type": RECORD_CONTENT_TYPE}
+        if token:
+            self.headers["X-Device-Token"] = token
+        self.timeout = timeout
+
+    def _post(self, body):
+        req = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                resp.read()
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in RETRY_STATUS:
+                raise Rejected(f"HTTP {e.code}: {e.read()[:200].decode('utf-8', 'replace').strip()}") from e
+            raise
+
+    async def send(self, body):
+        await asyncio.get_running_loop().run_in_executor(None, self._post, body)
+
+
+class RollupSink:
+    def __init__(self, root):
+        from rollup_store import RollupStore
+        self.store = RollupStore(root)
+
+    def _write(self, body):
+        try:
+            self.store.ingest_records(body)
+        except ValueError as e:                 # invalid device id
+            raise Rejected(str(e)) from e
+
+    async def send(self, body):
+        # File writes run off the event loop so serial reads keep flowing
+        await asyncio.get_running_loop().run_in_executor(None, self._write, body)
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def _write(self, body):
+        with open(self.path, "ab") as f:
+            f.write(body)
+
+    async def send(self, body):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, body)
+
+
+# ==========================
+# SOURCES
+# ==========================
+class Source:
+    def __init__(self, spec, batcher, baud, poll_seconds, retry_seconds, from_start):
+        self.device, self.path = device_id(spec)
+        self.device_bytes = self.device.encode("ascii")
+        self.batcher, self.baud = batcher, baud
+        self.poll_seconds, self.retry_seconds, self.from_start = poll_seconds, retry_seconds, from_start
+        self.buf = bytearray()
+        self.fd = None
+        self.lines = self.bad_lines = 0
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK | os.O_NOCTTY)
+        if os.isatty(fd):
+            tty.setraw(fd)
+            attrs = termios.tcgetattr(fd)
+            speed = getattr(termios, f"B{self.baud}")
+            attrs[2] |= termios.CLOCAL | termios.CREAD
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        return fd
+
+    def feed(self, data):
+        # Incremental line splitting: a partial line waits for the next read
+        self.buf += data
+        if b"\n" not in data:
+            if len(self.buf) > MAX_LINE_BYTES:
+                self.buf.clear()
+                self.bad_lines += 1
+            return
+        *lines, rest = self.buf.split(b"\n")
+        self.buf = bytearray(rest)
+        now = time.time()
+        for line in lines:
+            self.lines += 1
+            fields = parse_line(line)
+            if fields:
+                self.batcher.add(self.device_bytes, now, fields)
+            elif line.strip():
+                self.bad_lines += 1
+
+    def _close(self, loop):
+        if self.fd is not None:
+            loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def _on_readable(self, loop, lost):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            data = b""
+            if e.errno not in (errno.EIO, errno.ENXIO, errno.ENODEV):
+                print(f"⚠️ {self.device}: {e}")
+        if data:
+            self.feed(data)
+        else:
+            # Device unplugged or the other end of the pty went away
+            self._close(loop)
+            lost.set_result(None)
+
+    async def _stream(self, loop):
+        # Serial ports, ptys and FIFOs: woken by the event loop when bytes arrive
+        lost = loop.create_future()
+        loop.add_reader(self.fd, self._on_readable, loop, lost)
+        try:
+            await lost
+        finally:
+            self._close(loop)
+
+    async def _tail(self, loop):
+        # Regular files: poll for appended bytes, like tail -f
+        if not self.from_start:
+            os.lseek(self.fd, 0, os.SEEK_END)
+        try:
+            while True:
+                data = os.read(self.fd, 1 << 16)
+                if data:
+                    self.feed(data)
+                    continue
+                if os.fstat(self.fd).st_size < os.lseek(self.fd, 0, os.SEEK_CUR):
+                    os.lseek(self.fd, 0, os.SEEK_SET)       # truncated / rotated in place
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.fd = self._open()
+            except OSError as e:
+                print(f"⚠️ {self.device}: cannot open {self.path} ({e.strerror}); retrying in {self.retry_seconds:.0f}s")
+                await asyncio.sleep(self.retry_seconds)
+                continue
+            print(f"✅ {self.device}: reading {self.path}")
+            if stat.S_ISREG(os.fstat(self.fd).st_mode):
+                await self._tail(loop)
+            else:
+                await self._stream(loop)
+            print(f"⚠️ {self.device}: {self.path} closed; reopening in {self.retry_seconds:.0f}s")
+            await asyncio.sleep(self.retry_seconds)
+
+
+async def report(sources, batcher, every):
+    last, last_t = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(every)
+        now = time.monotonic()
+        rate = (batcher.readings - last) / (now - last_t)
+        last, last_t = batcher.readings, now
+        bad = sum(s.bad_lines for s in sources)
+        print(f"{batcher.readings} readings ({rate:.0f}/s) from {sum(s.fd is not None for s in sources)}/"
+              f"{len(sources)} sources, {bad} unparsed lines, {batcher.sent} sent, "
+              f"{batcher.unsent()} pending, {batcher.dropped} dropped")
+
+
+async def serve(args):
+    sinks = []
+    if args.url:
+        sinks.append(HttpSink(args.url, args.token))
+    if args.store:
+        sinks.append(FileSink(args.store))
+    if args.rollups:
+        sinks.append(RollupSink(args.rollups))
+    batcher = Batcher(args.batch_size, args.flush_seconds, sinks)
+    sources = [Source(spec, batcher, args.baud, args.poll_seconds, args.retry_seconds, args.from_start)
+               for spec in args.sources]
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(s.run()) for s in sources]
+    tasks += [asyncio.create_task(batcher.timer()), asyncio.create_task(batcher.sender(args.retry_seconds))]
+    if args.stats_seconds > 0:
+        tasks.append(asyncio.create_task(report(sources, batcher, args.stats_seconds)))
+    await stop.wait()
+
+    for t in tasks[:len(sources) + 1]:
+        t.cancel()
+    batcher.flush()
+    # Give the sender a moment to drain what is already read
+    deadline = time.monotonic() + args.drain_seconds
+    while batcher.unsent() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for t in tasks:
+        t.cancel()
+    print(f"Stopped: {batcher.readings} readings, {batcher.sent} sent, "
+          f"{batcher.unsent()} unsent, {batcher.dropped} dropped")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Forward nitte_iot.ino serial output to the telemetry API")
+    ap.add_argument("sources", nargs="+", help="[device=]path of a serial port, pty or log file")
+    ap.add_argument("--url", help="backend base URL, e.g. http://127.0.0.1:5000")
+    ap.add_argument("--store", help="append raw telemetry.RECORD batches to this file")
+    ap.add_argument("--rollups", help="also keep 1m/1h/1d history in this rollup_store.py folder")
+    ap.add_argument("--token", default=os.environ.get("TELEMETRY_TOKEN"), help="sent as X-Device-Token")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--flush-seconds", type=float, default=1.0)
+    ap.add_argument("--poll-seconds", type=float, default=0.2, help="how often regular files are checked")
+    ap.add_argument("--retry-seconds", type=float, default=5.0)
+    ap.add_argument("--from-start", action="store_true", help="read files from the beginning instead of the end")
+    ap.add_argument("--stats-seconds", type=float, default=30.0, help="progress line interval (0 = off)")
+    ap.add_argument("--drain-seconds", type=float, default=5.0, help="time allowed to send the last batches on exit")
+    args = ap.parse_args()
+
+    if not (args.url or args.store or args.rollups):
+        print("ERROR: give --url, --store and/or --rollups")
+        sys.exit(1)
+    if not hasattr(termios, f"B{args.baud}"):
+        print(f"ERROR: unsupported baud rate {args.baud}")
+        sys.exit(1)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
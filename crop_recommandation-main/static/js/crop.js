@@ -43,6 +43,24 @@ function loadDistricts() {
     }
 }
 
+// 2b. Auto-fill Rainfall from the District's Seasonal Average
+function fillRainfall() {
+    const state = document.getElementById('state').value;
+    const district = document.getElementById('district').value;
+    const rainfallInput = document.getElementById('rainfall');
+
+    if(state && district) {
+        fetch(`/rainfall?state=${encodeURIComponent(state)}&district=${encodeURIComponent(district)}`)
+            .then(response => response.json())
+            .then(data => {
+                if(data.rainfall !== undefined) {
+                    rainfallInput.value = data.rainfall;
+                }
+            })
+            .catch(error => console.error('Error loading rainfall:', error));
+    }
+}
+
 // 3. Handle Prediction Form Submission
 document.getElementById('cropForm').addEventListener('submit', function(e) {
     e.preventDefault(); // Stop page reload
@@ -59,7 +77,9 @@ document.getElementById('cropForm').addEventListener('submit', function(e) {
         temperature: document.getElementById('temperature').value,
         humidity: document.getElementById('humidity').value,
         ph: document.getElementById('ph').value,
-        rainfall: document.getElementById('rainfall').value
+        rainfall: document.getElementById('rainfall').value,
+        state: document.getElementById('state').value,
+        district: document.getElementById('district').value
     };
 
     // Send to Backend
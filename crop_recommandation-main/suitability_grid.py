@@ -0,0 +1,353 @@
+# suitability_grid.py
+# Precomputed probability grid for the suitability RandomForest.
+#
+# The forest only sees three inputs (temperature, humidity, rainfall), so we
+# can evaluate it once, offline, on a regular grid over those inputs and then
+# answer requests by snapping to the nearest grid point. The grid is saved as
+# a float32 .npy (memory-mapped at startup), a .mask.npy and a .json with the
+# axes, the class names, a hash of the model it was built from and an
+# accuracy report.
+#
+# Snapping changes answers wherever the forest has a split between a request
+# and its grid point, so only some cells are served: a cell (the box between
+# 8 neighbouring grid points) is marked in the mask when the forest's
+# probabilities at its 8 corners are within CELL_TOLERANCE of each other,
+# rank the same top 3, and keep each of the top 3 more than CELL_TOLERANCE
+# above the next class (or tied with it at zero). Corners miss narrow bands
+# of the forest that fall between grid points, so a cell that passes is also
+# checked the same way at its centre and the centres of its 6 faces. Requests in any other cell, or outside the grid, go to
+# the forest. The report measures the served requests against the exact
+# forest, and load_grid() refuses a grid that falls short of
+# MIN_TOP3_AGREEMENT or exceeds MAX_ABS_ERROR on any sample set. The apps
+# only use a grid when USE_SUITABILITY_GRID=1.
+#
+#   python suitability_grid.py build --data crop_recommendation.csv
+#   python suitability_grid.py build --temperature 8:44:0.25 --humidity 14:100:0.5 --rainfall 20:300:1
+#   python suitability_grid.py report        # re-print the saved accuracy report
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PREFIX = os.path.join(BASE_DIR, "suitability_grid")
+DEFAULT_MODEL = os.path.join(BASE_DIR, "suitability_model.pkl")
+DEFAULT_LE = os.path.join(BASE_DIR, "label_encoder.pkl")
+
+FEATURES = ["temperature", "humidity", "rainfall"]
+
+# (start, stop, step) per feature, inclusive of stop; covers the training data
+DEFAULT_AXES = {
+    "temperature": (8.0, 44.0, 0.5),
+    "humidity": (14.0, 100.0, 1.0),
+    "rainfall": (20.0, 300.0, 2.5),
+}
+
+BUILD_CHUNK_ROWS = 200000
+FORMAT_VERSION = 2
+
+# A cell is served when every class probability at its 8 corners is within this of
+# each other and the top 3 at every corner are separated by more than this
+CELL_TOLERANCE = 0.01
+
+# A grid is only served when the requests it answers are this close to the exact forest
+MIN_TOP3_AGREEMENT = 0.99
+MAX_ABS_ERROR = 0.05
+
+
+class SuitabilityGrid:
+    def __init__(self, probs, axes, classes, mask):
+        self.probs = probs                      # (n_temp, n_hum, n_rain, n_classes)
+        self.mask = mask                        # (n_temp - 1, n_hum - 1, n_rain - 1) served cells
+        self.classes = np.asarray(classes)
+        self.start = np.array([axes[f][0] for f in FEATURES])
+        self.stop = np.array([axes[f][1] for f in FEATURES])
+        self.step = np.array([axes[f][2] for f in FEATURES])
+        self.shape = np.array(probs.shape[:3])
+
+    def _served(self, X):
+        # Nearest grid point of every row, and whether the row's cell is served
+        inside = np.all((X >= self.start) & (X <= self.stop), axis=1)
+        with np.errstate(invalid="ignore"):
+            pos = (X - self.start) / self.step
+            cell = np.clip(np.nan_to_num(np.floor(pos)).astype(int), 0, self.shape - 2)
+            near = np.clip(np.nan_to_num(np.rint(pos)).astype(int), 0, self.shape - 1)
+        return near, inside & self.mask[cell[:, 0], cell[:, 1], cell[:, 2]]
+
+    def lookup(self, temperature, humidity, rainfall):
+        # Returns the class probabilities at the nearest grid point, or None
+        # when the inputs fall outside the grid or in a cell that is not served.
+        near, served = self._served(np.array([[temperature, humidity, rainfall]], dtype=np.float64))
+        if not served[0]:
+            return None
+        i = near[0]
+        return _widen(self.probs[i[0], i[1], i[2]])
+
+    def lookup_many(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        near, served = self._served(X)
+        return _widen(self.probs[near[:, 0], near[:, 1], near[:, 2]]), served
+
+
+def _widen(probs):
+    # float32 storage: drop the digits float32 cannot hold, so 0.345 is not 0.3449999988
+    return np.round(probs.astype(np.float64), 6)
+
+
+def predict_proba(grid, model, X):
+    # Grid lookups for the rows in served cells, the model for the rest (or all rows without a grid)
+    X = np.asarray(X, dtype=np.float64)
+    if grid is None:
+        return model.predict_proba(X)
+    probs, served = grid.lookup_many(X)
+    if not served.all():
+        probs[~served] = model.predict_proba(X[~served])
+    return probs
+
+
+def top3_agreement(exact, approx):
+    # Per row: True when approx's top 3 (in order) are a valid top 3 of exact.
+    # Classes tied in exact, such as the many zero-probability ones, are interchangeable.
+    mine = np.argsort(-approx, axis=-1, kind="stable")[..., :3]
+    want = -np.sort(-exact, axis=-1)[..., :3]
+    return (np.take_along_axis(exact, mine, axis=-1) == want).all(axis=-1)
+
+
+def axis_points(start, stop, step):
+    n = int(round((stop - start) / step)) + 1
+    return start + step * np.arange(n)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_grid(model, axes, dtype=np.float32):
+    pts = [axis_points(*axes[f]) for f in FEATURES]
+    shape = tuple(len(p) for p in pts)
+    n_classes = len(model.classes_)
+    out = np.empty(shape + (n_classes,), dtype=dtype)
+    flat = out.reshape(-1, n_classes)
+
+    # Grid points in C order, generated chunk by chunk from their flat index
+    total = flat.shape[0]
+    for lo in range(0, total, BUILD_CHUNK_ROWS):
+        idx = np.unravel_index(np.arange(lo, min(lo + BUILD_CHUNK_ROWS, total)), shape)
+        X = np.column_stack([p[i] for p, i in zip(pts, idx)])
+        flat[lo:lo + len(X)] = model.predict_proba(X)
+        print(f"  {min(lo + BUILD_CHUNK_ROWS, total)}/{total} grid points")
+    return out
+
+
+def clear_top3(probs, margin):
+    # Per row: each of the top 3 is more than `margin` above the next class, or
+    # both are zero, so a small change inside a cell cannot reorder them
+    s = -np.sort(-probs, axis=-1)[..., :4]
+    gap = s[..., :3] - s[..., 1:]
+    return ((gap > margin) | ((gap == 0) & (s[..., 1:] == 0))).all(axis=-1)
+
+
+# Points inside a cell (in steps from its first corner) checked against the forest
+INTERIOR_POINTS = [(0.5, 0.5, 0.5), (0.0, 0.5, 0.5), (1.0, 0.5, 0.5), (0.5, 0.0, 0.5),
+                   (0.5, 1.0, 0.5), (0.5, 0.5, 0.0), (0.5, 0.5, 1.0)]
+
+
+def _agree(ref, probs, tolerance):
+    return ((np.abs(probs - ref).max(axis=-1) <= tolerance) & clear_top3(probs, tolerance)
+            & top3_agreement(ref, probs) & top3_agreement(probs, ref))
+
+
+def build_mask(model, probs, axes, tolerance=CELL_TOLERANCE):
+    # Cells whose 8 corners, centre and face centres are within `tolerance` of
+    # each other and rank the same, clearly separated top 3
+    shape = tuple(n - 1 for n in probs.shape[:3])
+    mask = np.empty(shape, dtype=bool)
+    for i in range(shape[0]):
+        slab = np.asarray(probs[i:i + 2], dtype=np.float64)
+        corners = [slab[a, b:b + shape[1], c:c + shape[2]] for a in (0, 1) for b in (0, 1) for c in (0, 1)]
+        ok = (np.max(corners, axis=0) - np.min(corners, axis=0)).max(axis=-1) <= tolerance
+        for corner in corners:
+            ok &= _agree(corners[0], corner, tolerance)
+        mask[i] = ok
+
+    start = np.array([axes[f][0] for f in FEATURES])
+    step = np.array([axes[f][2] for f in FEATURES])
+    cells = np.argwhere(mask)
+    for lo in range(0, len(cells), BUILD_CHUNK_ROWS):
+        chunk = cells[lo:lo + BUILD_CHUNK_ROWS]
+        ref = np.asarray(probs[chunk[:, 0], chunk[:, 1], chunk[:, 2]], dtype=np.float64)
+        keep = np.ones(len(chunk), dtype=bool)
+        for offset in INTERIOR_POINTS:
+            keep &= _agree(ref, model.predict_proba(start + (chunk + offset) * step), tolerance)
+        drop = chunk[~keep]
+        mask[drop[:, 0], drop[:, 1], drop[:, 2]] = False
+    return mask
+
+
+def accuracy_report(model, grid, X):
+    # Compares the grid's answers with the exact forest on the rows it serves
+    approx, served = grid.lookup_many(X)
+    checked = len(X)
+    X, approx = X[served], approx[served]
+    if len(X) == 0:
+        return {"samples": int(checked), "served": 0, "coverage": 0.0}
+    exact = model.predict_proba(X)
+    err = np.abs(exact - approx)
+    return {
+        "samples": int(checked),
+        "served": int(len(X)),
+        "coverage": float(served.mean()),
+        "top1_agreement": float((exact.argmax(1) == approx.argmax(1)).mean()),
+        "top3_agreement": float(top3_agreement(exact, approx).mean()),
+        "max_abs_error": float(err.max()),
+        "mean_abs_error": float(err.mean()),
+        "p99_abs_error": float(np.percentile(err.max(axis=1), 99)),
+    }
+
+
+def load_samples(path):
+    from columnar_cache import read_table
+    df = read_table(path)
+    return df[FEATURES].to_numpy(dtype=np.float64)
+
+
+def save_grid(prefix, probs, mask, meta):
+    np.save(prefix + ".npy", probs)
+    np.save(prefix + ".mask.npy", mask)
+    with open(prefix + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def accuracy_problems(report, min_top3=MIN_TOP3_AGREEMENT, max_error=MAX_ABS_ERROR):
+    # Reasons the report rules the grid out (empty when it is within bounds)
+    if not report:
+        return ["no accuracy report"]
+    problems = []
+    for name, r in report.items():
+        if not r.get("served"):
+            continue
+        if r["top3_agreement"] < min_top3:
+            problems.append(f"{name} top-3 agreement {r['top3_agreement']:.3f} < {min_top3}")
+        if r["max_abs_error"] > max_error:
+            problems.append(f"{name} max |dp| {r['max_abs_error']:.3f} > {max_error}")
+    return problems
+
+
+def load_grid(prefix=DEFAULT_PREFIX, model_path=None, min_top3=MIN_TOP3_AGREEMENT, max_error=MAX_ABS_ERROR):
+    # Memory-maps the grid. Returns None when it is missing, was built from a
+    # different model file than `model_path`, or its accuracy report is out of bounds.
+    if not all(os.path.exists(prefix + ext) for ext in (".npy", ".mask.npy", ".json")):
+        return None
+    with open(prefix + ".json") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        print(f"⚠️ {os.path.basename(prefix)}.npy has no cell mask (format v{meta.get('format_version')}); "
+              f"rebuild it with: python suitability_grid.py build")
+        return None
+    if model_path and meta.get("model_sha256") != file_sha256(model_path):
+        print(f"⚠️ {os.path.basename(prefix)}.npy was built from a different model; ignoring it")
+        return None
+    problems = accuracy_problems(meta.get("report"), min_top3, max_error)
+    if problems:
+        print(f"⚠️ {os.path.basename(prefix)}.npy is not accurate enough to serve ({'; '.join(problems)}); ignoring it")
+        return None
+    probs = np.load(prefix + ".npy", mmap_mode="r")
+    mask = np.load(prefix + ".mask.npy")
+    return SuitabilityGrid(probs, {f: tuple(meta["axes"][f]) for f in FEATURES}, meta["classes"], mask)
+
+
+def print_verdict(report):
+    problems = accuracy_problems(report)
+    if problems:
+        print(f"⚠️ load_grid() will refuse this grid: {'; '.join(problems)}")
+        return
+    served = ", ".join(f"{r['coverage']:.1%} of {name} requests" for name, r in report.items())
+    print(f"✅ within bounds (top-3 agreement >= {MIN_TOP3_AGREEMENT}, max |dp| <= {MAX_ABS_ERROR}); "
+          f"the grid serves {served}, the forest the rest")
+
+
+def parse_axis(text):
+    start, stop, step = (float(v) for v in text.split(":"))
+    if step <= 0 or stop <= start:
+        raise argparse.ArgumentTypeError(f"bad axis {text!r}, expected start:stop:step")
+    return start, stop, step
+
+
+def main():
+    import joblib
+
+    ap = argparse.ArgumentParser(description="Build the suitability probability grid")
+    ap.add_argument("command", choices=["build", "report"])
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--le", default=DEFAULT_LE)
+    ap.add_argument("--out", default=DEFAULT_PREFIX, help="output path without extension")
+    ap.add_argument("--data", help="CSV/XLSX with temperature, humidity, rainfall for the accuracy report")
+    ap.add_argument("--random-samples", type=int, default=100000)
+    ap.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                    help="float16 halves the file but adds ~1e-3 noise to every probability")
+    ap.add_argument("--tolerance", type=float, default=CELL_TOLERANCE,
+                    help="max spread of a class probability across a served cell's 8 corners")
+    for f in FEATURES:
+        ap.add_argument(f"--{f}", type=parse_axis, default=DEFAULT_AXES[f], help="start:stop:step")
+    args = ap.parse_args()
+
+    if args.command == "report":
+        with open(args.out + ".json") as f:
+            report = json.load(f)["report"]
+        print(json.dumps(report, indent=2))
+        print_verdict(report)
+        return
+
+    for p in (args.model, args.le):
+        if not os.path.exists(p):
+            print(f"ERROR: required file not found -> {p}")
+            sys.exit(1)
+
+    model = joblib.load(args.model)
+    le = joblib.load(args.le)
+    axes = {f: getattr(args, f) for f in FEATURES}
+
+    print("Building grid:", {f: len(axis_points(*axes[f])) for f in FEATURES})
+    t0 = time.perf_counter()
+    probs = build_grid(model, axes, np.dtype(args.dtype))
+    print("Checking cells")
+    mask = build_mask(model, probs, axes, args.tolerance)
+    build_s = time.perf_counter() - t0
+    grid = SuitabilityGrid(probs, axes, le.classes_, mask)
+
+    report = {}
+    rng = np.random.default_rng(42)
+    uniform = np.column_stack([rng.uniform(axes[f][0], axes[f][1], args.random_samples) for f in FEATURES])
+    report["random"] = accuracy_report(model, grid, uniform)
+    if args.data:
+        report["dataset"] = accuracy_report(model, grid, load_samples(args.data))
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "features": FEATURES,
+        "axes": {f: list(axes[f]) for f in FEATURES},
+        "cell_tolerance": args.tolerance,
+        "cells_served": float(mask.mean()),
+        "classes": [str(c) for c in le.classes_],
+        "model_sha256": file_sha256(args.model),
+        "build_seconds": round(build_s, 1),
+        "report": report,
+    }
+    save_grid(args.out, probs, mask, meta)
+    print(f"Saved {args.out}.npy ({probs.nbytes / 1e6:.1f} MB) in {build_s:.1f}s; "
+          f"{mask.mean():.1%} of cells are served")
+    print(json.dumps(report, indent=2))
+    print_verdict(report)
+
+
+if __name__ == "__main__":
+    main()
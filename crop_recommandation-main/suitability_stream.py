@@ -0,0 +1,209 @@
+# suitability_stream.py
+# Live suitability scores for a field, pushed to browsers over Server-Sent Events.
+#
+# The hub listens to every run of readings the TelemetryStore stores
+# (on_append). A topic is one (device, crop, rainfall) a client watches; it
+# keeps the inputs its last score was computed from. A reading only updates
+# the topic's pending temperature / humidity. A scorer thread rescores the
+# topics whose inputs moved more than DELTAS since their last score, at most
+# once per DEBOUNCE_SECONDS each, and all due topics in one batched model
+# call. Sensor ticks that don't move the inputs cost a dict lookup.
+#
+#   hub = StreamHub(score)                 # score(X, crops) -> one event dict per row
+#   store.on_append(hub.on_append)
+#   topic, q = hub.subscribe("esp32-01", "rice", 180.0, seed=store.latest("esp32-01"))
+#   event = q.get()                        # {"device", "ts", "inputs", "crop", "isSuitable", ...}
+#   hub.unsubscribe(topic, q)
+#
+#   for chunk in sse_events(hub, topic, q): ...   # text/event-stream body
+#
+# Each subscriber has a small queue; a client that falls behind loses the
+# oldest updates, never the newest.
+
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+from telemetry import FIELD_INDEX
+
+INPUTS = ("temperature", "humidity")
+DELTAS = (0.5, 2.0)          # degrees C, % relative humidity
+DEBOUNCE_SECONDS = 2.0
+KEEPALIVE_SECONDS = 15.0
+QUEUE_SIZE = 16
+
+_COLUMNS = [FIELD_INDEX[f] for f in INPUTS]
+
+
+class Topic:
+    __slots__ = ("key", "device", "crop", "rainfall", "pending", "pending_ts",
+                 "scored", "scored_at", "last_event", "queues")
+
+    def __init__(self, device, crop, rainfall):
+        self.key = (device, crop, rainfall)
+        self.device, self.crop, self.rainfall = device, crop, rainfall
+        self.pending = np.full(len(INPUTS), np.nan)
+        self.pending_ts = None
+        self.scored = None                  # inputs of the last score
+        self.scored_at = -np.inf
+        self.last_event = None
+        self.queues = []
+
+    def moved(self, deltas):
+        if not np.isfinite(self.pending).all():
+            return False
+        return self.scored is None or bool((np.abs(self.pending - self.scored) > deltas).any())
+
+
+class StreamHub:
+    def __init__(self, score, deltas=DELTAS, debounce_seconds=DEBOUNCE_SECONDS, queue_size=QUEUE_SIZE):
+        self.score = score
+        self.deltas = np.asarray(deltas, dtype=np.float64)
+        self.debounce_seconds = float(debounce_seconds)
+        self.queue_size = int(queue_size)
+        self._topics = {}
+        self._by_device = {}                # device -> [Topic]
+        self._dirty = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.readings = 0
+        self.rescored = 0
+        self.events = 0
+
+    # --- feed ---
+    def on_append(self, device, ts, values):
+        # TelemetryStore listener (runs after every ingest): keep the newest
+        # reported value of each input, nothing else
+        topics = self._by_device.get(device)
+        if not topics:
+            return
+        newest = []
+        for col in _COLUMNS:
+            ok = np.flatnonzero(np.isfinite(values[:, col]))
+            newest.append(values[ok[-1], col] if len(ok) else np.nan)
+        with self._cond:
+            for topic in self._by_device.get(device, ()):
+                fresh = np.isfinite(newest)
+                topic.pending[fresh] = np.asarray(newest)[fresh]
+                topic.pending_ts = float(ts[-1])
+                self._dirty.add(topic.key)
+            self.readings += len(ts)
+            self._cond.notify()
+
+    # --- subscribers ---
+    def subscribe(self, device, crop, rainfall, seed=None):
+        # seed: a TelemetryStore.latest() dict, so the first score needs no new reading
+        q = queue.Queue(self.queue_size)
+        with self._cond:
+            key = (device, crop, rainfall)
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = Topic(device, crop, rainfall)
+                self._by_device.setdefault(device, []).append(topic)
+                if seed:
+                    topic.pending[:] = [np.nan if seed.get(f) is None else seed[f] for f in INPUTS]
+                    topic.pending_ts = seed.get("ts")
+                    self._dirty.add(key)
+            topic.queues.append(q)
+            if topic.last_event is not None:
+                q.put_nowait(topic.last_event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="suitability-stream", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return topic, q
+
+    def unsubscribe(self, topic, q):
+        with self._cond:
+            if q in topic.queues:
+                topic.queues.remove(q)
+            if not topic.queues and self._topics.get(topic.key) is topic:
+                del self._topics[topic.key]
+                self._by_device[topic.device].remove(topic)
+                if not self._by_device[topic.device]:
+                    del self._by_device[topic.device]
+                self._dirty.discard(topic.key)
+
+    def _publish(self, topic, event):
+        topic.last_event = event
+        for q in topic.queues:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+            self.events += 1
+
+    # --- scorer ---
+    def _due(self, now):
+        # Topics to rescore now, and how long until the next debounced one is due
+        due, wait = [], None
+        for key in list(self._dirty):
+            topic = self._topics.get(key)
+            if topic is None or not topic.moved(self.deltas):
+                self._dirty.discard(key)
+                continue
+            left = topic.scored_at + self.debounce_seconds - now
+            if left <= 0:
+                due.append(topic)
+                self._dirty.discard(key)
+            else:
+                wait = left if wait is None else min(wait, left)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, wait = self._due(time.time())
+                while not due:
+                    self._cond.wait(wait)
+                    due, wait = self._due(time.time())
+                inputs = [(t, t.pending.copy(), t.pending_ts) for t in due]
+            X = np.array([np.append(x, t.rainfall) for t, x, _ in inputs])
+            try:
+                events = self.score(X, [t.crop for t, _, _ in inputs])
+            except Exception as e:
+                events = [{"error": f"Scoring failed: {e}"}] * len(inputs)
+            now = time.time()
+            with self._cond:
+                for (topic, x, ts), event in zip(inputs, events):
+                    topic.scored_at = now
+                    if "error" in event:
+                        # Retried after the debounce interval; the error is sent once
+                        self._dirty.add(topic.key)
+                        if topic.last_event is not None and topic.last_event.get("error") == event["error"]:
+                            continue
+                    else:
+                        topic.scored = x
+                    event = {"device": topic.device, "ts": ts, "rainfall": topic.rainfall,
+                             "inputs": dict(zip(INPUTS, x.tolist())), **event}
+                    self._publish(topic, event)
+                self.rescored += len(inputs)
+
+    def stats(self):
+        with self._cond:
+            return {"topics": len(self._topics), "subscribers": sum(len(t.queues) for t in self._topics.values()),
+                    "readings": self.readings, "rescored": self.rescored, "events": self.events}
+
+
+def sse_events(hub, topic, q, keepalive_seconds=KEEPALIVE_SECONDS):
+    # text/event-stream chunks for one subscriber. A closed connection surfaces at
+    # the next write (at most keepalive_seconds later), which unsubscribes it.
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = q.get(timeout=keepalive_seconds)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: suitability\ndata: {json.dumps(event)}\n\n"
+    finally:
+        hub.unsubscribe(topic, q)
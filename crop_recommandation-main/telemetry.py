@@ -0,0 +1,343 @@
+# telemetry.py
+# In-memory time-series store for the readings the nitte_iot.ino devices send.
+#
+# Every device gets a fixed-size ring buffer (timestamps as float64 epoch
+# seconds, readings as a float32 row per timestamp) allocated the first time
+# it reports. A batch is grouped by device with one sort and copied into the
+# rings as slices, so no Python object is created per reading on the binary
+# path. A fleet table keeps the newest reading of every device in one array,
+# which is what fleet-wide checks read.
+#
+#   store = TelemetryStore(capacity=3600)
+#   store.ingest_json({"device": "esp32-01", "ts": [...], "soil": [42, 41], "gate": ["CLOSED", "CLOSED"]})
+#   store.ingest_records(body)            # packed RECORD structs, np.frombuffer, no parsing
+#   store.latest("esp32-01")              # {"ts": ..., "soil": 41.0, "temperature": None, ...}
+#   store.window("esp32-01", since=t0)    # (ts, values) copies of the matching slice
+#   devices, ts, values = store.fleet()   # newest reading of every device
+#   follow_records(store, "readings.bin") # tail a serial_reader.py --store file instead of HTTP
+#
+# Readings must arrive in time order per device. A reading older than the
+# newest one already stored for its device is dropped (and counted).
+#
+# The store lives in process memory: prefork_server.py with several workers
+# switches the IoT routes off, so point devices at a single-process server.
+
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+FIELDS = ("temperature", "humidity", "soil", "gate")
+FIELD_INDEX = {f: i for i, f in enumerate(FIELDS)}
+
+# Binary ingestion layout (little endian, 56 bytes per reading). A ts <= 0
+# means "stamp it on arrival"; NaN marks a sensor that did not report.
+RECORD = np.dtype([("device", "S32"), ("ts", "<f8"), ("temperature", "<f4"),
+                   ("humidity", "<f4"), ("soil", "<f4"), ("gate", "<f4")])
+RECORD_CONTENT_TYPE = "application/octet-stream"
+
+DEVICE_ID = re.compile(r"^[A-Za-z0-9_.:-]{1,32}$")
+GATE_STATES = {"OPEN": 1.0, "CLOSED": 0.0}
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+class UnknownDevice(LookupError):
+    pass
+
+
+class Ring:
+    # Fixed-size ring: `end` counts every reading ever written, so the
+    # oldest kept reading is at logical position max(0, end - capacity).
+    __slots__ = ("ts", "values", "end")
+
+    def __init__(self, capacity):
+        self.ts = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty((capacity, len(FIELDS)), dtype=np.float32)
+        self.end = 0
+
+    def __len__(self):
+        return min(self.end, len(self.ts))
+
+    def last_ts(self):
+        return self.ts[(self.end - 1) % len(self.ts)] if self.end else -np.inf
+
+    def append(self, ts, values):
+        cap = len(self.ts)
+        if len(ts) > cap:
+            ts, values = ts[-cap:], values[-cap:]
+        n = len(ts)
+        pos = self.end % cap
+        first = min(n, cap - pos)
+        self.ts[pos:pos + first] = ts[:first]
+        self.values[pos:pos + first] = values[:first]
+        if first < n:
+            self.ts[:n - first] = ts[first:]
+            self.values[:n - first] = values[first:]
+        self.end += n
+
+    def _locate(self, t, side):
+        # searchsorted over the logical (time ordered) sequence, without unrolling it
+        cap, count = len(self.ts), len(self)
+        start = (self.end - count) % cap
+        head = self.ts[start:start + count] if start + count <= cap else self.ts[start:]
+        if len(head) == count or t <= head[-1]:
+            return int(np.searchsorted(head, t, side))
+        return len(head) + int(np.searchsorted(self.ts[:count - len(head)], t, side))
+
+    def slice(self, since=None, until=None, last=None):
+        count = len(self)
+        lo = self._locate(since, "left") if since is not None else 0
+        hi = self._locate(until, "right") if until is not None else count
+        if last is not None:
+            lo = max(lo, hi - last)
+        if hi <= lo:
+            return np.empty(0), np.empty((0, len(FIELDS)), dtype=np.float32)
+        idx = (self.end - count + np.arange(lo, hi)) % len(self.ts)
+        return self.ts[idx], self.values[idx]
+
+
+class TelemetryStore:
+    def __init__(self, capacity=3600, max_devices=10000):
+        self.capacity = int(capacity)
+        self.max_devices = int(max_devices)
+        self._rings = {}
+        self._slots = {}                       # device -> row in the fleet table
+        self._devices = []
+        self._latest_ts = np.full(64, np.nan)
+        self._latest = np.full((64, len(FIELDS)), np.nan, dtype=np.float32)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.dropped = 0
+        self.listener_errors = 0
+        self._listeners = []
+        self._pending = deque()                # stored runs not yet passed to the listeners
+        self._notify_lock = threading.Lock()
+
+    def on_append(self, fn):
+        # fn(device, ts, values) for every stored run of readings, in time order
+        # per device (e.g. rollup_store persisting them). Called after the store
+        # lock is released, so a slow listener never blocks reads or other ingests.
+        self._listeners.append(fn)
+
+    def __len__(self):
+        return len(self._rings)
+
+    def _ring(self, device):
+        ring = self._rings.get(device)
+        if ring is None:
+            if len(self._rings) >= self.max_devices:
+                raise TelemetryError(f"Too many devices (max {self.max_devices})")
+            ring = self._rings[device] = Ring(self.capacity)
+            slot = self._slots[device] = len(self._devices)
+            self._devices.append(device)
+            if slot == len(self._latest_ts):
+                self._latest_ts = np.concatenate([self._latest_ts, np.full(slot, np.nan)])
+                self._latest = np.concatenate([self._latest, np.full((slot, len(FIELDS)), np.nan, np.float32)])
+        return ring
+
+    # --- writes ---
+    def ingest(self, devices, ts, values, now=None):
+        # devices: (n,) array of ids, ts: (n,) float64, values: (n, len(FIELDS)) float32.
+        # Returns (accepted, dropped).
+        n = len(ts)
+        if n == 0:
+            return 0, 0
+        now = time.time() if now is None else now
+        ts = np.where(np.isfinite(ts) & (ts > 0), ts, now)
+        uniq, inverse = np.unique(devices, return_inverse=True)
+        ids = [d.decode("ascii", "replace") if isinstance(d, bytes) else str(d) for d in uniq.tolist()]
+        bad = [d for d in ids if not DEVICE_ID.match(d)]
+        if bad:
+            raise TelemetryError(f"Invalid device id: {bad[0]!r}")
+        order = np.lexsort((ts, inverse))          # by device, then time
+        bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+        accepted = 0
+        with self._lock:
+            # Check the device cap before touching any ring, so a rejected batch stores nothing
+            new = sum(1 for d in ids if d not in self._rings)
+            if new and len(self._rings) + new > self.max_devices:
+                raise TelemetryError(f"Too many devices (max {self.max_devices})")
+            for k, device in enumerate(ids):
+                rows = order[bounds[k]:bounds[k + 1]]
+                ring = self._ring(device)
+                rows = rows[ts[rows] >= ring.last_ts()]
+                if not len(rows):
+                    continue
+                ring.append(ts[rows], values[rows])
+                if self._listeners:
+                    self._pending.append((device, ts[rows], values[rows]))
+                slot = self._slots[device]
+                self._latest_ts[slot] = ts[rows[-1]]
+                self._latest[slot] = values[rows[-1]]
+                accepted += len(rows)
+            self.accepted += accepted
+            self.dropped += n - accepted
+        self._notify()
+        return accepted, n - accepted
+
+    def _notify(self):
+        # Runs were queued under the store lock in ring order; whichever ingest
+        # holds _notify_lock drains them all, the others return immediately.
+        # The outer loop picks up runs queued just before the drainer let go.
+        while self._pending:
+            if not self._notify_lock.acquire(blocking=False):
+                return
+            try:
+                while self._pending:
+                    device, ts, values = self._pending.popleft()
+                    for fn in self._listeners:
+                        try:
+                            fn(device, ts, values)
+                        except Exception as e:
+                            self.listener_errors += 1
+                            print(f"⚠️ Telemetry listener {getattr(fn, '__qualname__', fn)} failed: {e}")
+            finally:
+                self._notify_lock.release()
+
+    def ingest_records(self, buf, now=None):
+        if len(buf) % RECORD.itemsize:
+            raise TelemetryError(f"Body is not a whole number of {RECORD.itemsize}-byte records")
+        rec = np.frombuffer(buf, dtype=RECORD)
+        values = np.empty((len(rec), len(FIELDS)), dtype=np.float32)
+        for i, f in enumerate(FIELDS):
+            values[:, i] = rec[f]
+        return self.ingest(rec["device"], rec["ts"].copy(), values, now)
+
+    def ingest_json(self, payload, now=None):
+        # Accepts one columnar batch {"device", "ts": [...], "<field>": [...]},
+        # {"batches": [batch, ...]}, or row form [{"device", "ts", "<field>"}, ...]
+        # / {"readings": [...]}.
+        if isinstance(payload, dict) and "batches" in payload:
+            batches = payload["batches"]
+        elif isinstance(payload, dict) and "device" in payload:
+            batches = [payload]
+        else:
+            rows = payload.get("readings") if isinstance(payload, dict) else payload
+            if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+                raise TelemetryError("Expected a batch object, {\"batches\": [...]} or a list of readings")
+            batches = _rows_to_batches(rows)
+        if not isinstance(batches, list):
+            raise TelemetryError("'batches' must be a list")
+
+        devices, ts, values = [], [], []
+        for b in batches:
+            d, t, v = _parse_batch(b)
+            devices.append(d)
+            ts.append(t)
+            values.append(v)
+        if not ts:
+            return 0, 0
+        return self.ingest(np.concatenate(devices), np.concatenate(ts), np.concatenate(values), now)
+
+    # --- reads ---
+    def _get(self, device):
+        ring = self._rings.get(device)
+        if ring is None:
+            raise UnknownDevice(f"Unknown device: {device}")
+        return ring
+
+    def latest(self, device):
+        with self._lock:
+            self._get(device)
+            slot = self._slots[device]
+            ts, row = float(self._latest_ts[slot]), self._latest[slot].tolist()
+        return {"ts": ts, **{f: (None if v != v else v) for f, v in zip(FIELDS, row)}}
+
+    def window(self, device, since=None, until=None, last=None):
+        with self._lock:
+            return self._get(device).slice(since, until, last)
+
+    def fleet(self):
+        # Snapshot of (device ids, newest ts, newest readings) for every device
+        with self._lock:
+            n = len(self._devices)
+            return list(self._devices), self._latest_ts[:n].copy(), self._latest[:n].copy()
+
+    def devices(self):
+        with self._lock:
+            return [{"device": d, "readings": len(r), "last_ts": float(r.last_ts())}
+                    for d, r in self._rings.items()]
+
+    def stats(self):
+        return {"devices": len(self._rings), "capacity": self.capacity,
+                "accepted": self.accepted, "dropped": self.dropped, "listener_errors": self.listener_errors}
+
+
+def follow_records(store, path, poll_seconds=1.0, from_start=False, stop=None):
+    # Feeds the RECORD structs appended to `path` (serial_reader.py --store) into
+    # the store, as a local stand-in for devices posting to /api/telemetry.
+    # Runs until `stop` (a threading.Event) is set; starts over if the file shrinks.
+    stop = stop or threading.Event()
+    pos = None
+    while not stop.is_set():
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            stop.wait(poll_seconds)
+            continue
+        if pos is None:
+            pos = 0 if from_start else size - size % RECORD.itemsize
+        elif size < pos:
+            pos = 0
+        n = (size - pos) // RECORD.itemsize
+        if n:
+            with open(path, "rb") as f:
+                f.seek(pos)
+                buf = f.read(n * RECORD.itemsize)
+            buf = buf[:len(buf) - len(buf) % RECORD.itemsize]
+            pos += len(buf)
+            try:
+                store.ingest_records(buf)
+            except TelemetryError as e:
+                print(f"⚠️ {os.path.basename(path)}: skipped {n} records ({e})")
+            continue
+        stop.wait(poll_seconds)
+
+
+def _column(values, name, n):
+    if len(values) != n:
+        raise TelemetryError(f"'{name}' has {len(values)} values, expected {n}")
+    if name == "gate":
+        values = [GATE_STATES.get(v.strip().upper(), np.nan) if isinstance(v, str) else v for v in values]
+    try:
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        raise TelemetryError(f"'{name}' must contain numbers")
+
+
+def _parse_batch(batch):
+    if not isinstance(batch, dict):
+        raise TelemetryError("Every batch must be a JSON object")
+    device = batch.get("device")
+    if not isinstance(device, str) or not DEVICE_ID.match(device):
+        raise TelemetryError(f"Invalid device id: {device!r}")
+    present = [f for f in FIELDS if f in batch]
+    if not present:
+        raise TelemetryError(f"Batch for {device} has none of: {', '.join(FIELDS)}")
+    first = batch[present[0]]
+    n = len(first) if isinstance(first, list) else 1
+
+    def as_list(v):
+        return v if isinstance(v, list) else [v]
+
+    ts = _column(as_list(batch["ts"]), "ts", n) if batch.get("ts") is not None else np.zeros(n)
+    values = np.full((n, len(FIELDS)), np.nan, dtype=np.float32)
+    for f in present:
+        values[:, FIELD_INDEX[f]] = _column(as_list(batch[f]), f, n)
+    return np.full(n, device, dtype=object), ts, values
+
+
+def _rows_to_batches(rows):
+    # Row form is regrouped per device so it goes through the same parser
+    by_device = {}
+    for r in rows:
+        by_device.setdefault(r.get("device"), []).append(r)
+    return [{"device": device, "ts": [r.get("ts") for r in group],
+             **{f: [r.get(f) for r in group] for f in FIELDS}}
+            for device, group in by_device.items()]
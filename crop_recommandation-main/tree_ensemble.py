@@ -0,0 +1,261 @@
+# tree_ensemble.py
+# Flattens a trained XGBoost booster into contiguous NumPy arrays and scores
+# rows with a vectorized tree walk, skipping DMatrix construction entirely.
+#
+#   ens = compile_xgboost(crop_model)
+#   ens.predict_proba(X)   # same class probabilities as crop_model.predict_proba
+#   ens.predict(X)         # encoded class index, like crop_model.predict
+#
+#   forest = compile_sklearn_forest(suitability_model)   # RandomForest / DecisionTree
+#   forest.predict_proba(X)
+#
+# Both classes round-trip through to_arrays() / from_arrays(), which is how
+# model_store.py saves them as memory-mappable .npy files.
+
+import json
+import numpy as np
+
+# Rows are scored in chunks so the (rows x trees) index matrix stays small
+CHUNK_ROWS = 1024
+# Forests gather a (rows x trees x classes) block per chunk
+FOREST_CHUNK_ROWS = 128
+
+
+class TreeEnsemble:
+    # All trees live in one node table. Leaves point at themselves, and trees
+    # are stored deepest first, so step `d` of the walk only has to touch the
+    # first `active[d]` trees (those deeper than `d`).
+    def __init__(self, feature, threshold, left, right, default_left, value,
+                 roots, tree_class, depth, num_class, bias, objective):
+        order = np.argsort(-np.asarray(depth), kind="stable")
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float32)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float32)
+        self.roots = np.ascontiguousarray(np.asarray(roots)[order], dtype=np.int32)
+        self.tree_class = np.ascontiguousarray(np.asarray(tree_class)[order], dtype=np.int32)
+        self.depth = np.ascontiguousarray(np.asarray(depth)[order], dtype=np.int32)
+        self.num_class = int(num_class)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float64)
+        self.objective = objective
+
+        self.max_depth = int(self.depth.max()) if len(self.depth) else 0
+        self.active = [int((self.depth > d).sum()) for d in range(self.max_depth)]
+
+        # (trees x classes) one-hot so per-class leaf sums are one matmul
+        self._class_matrix = np.zeros((len(self.roots), max(self.num_class, 1)), dtype=np.float32)
+        self._class_matrix[np.arange(len(self.roots)), self.tree_class] = 1.0
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    @property
+    def num_nodes(self):
+        return len(self.feature)
+
+    def _leaf_values(self, X):
+        n, n_features = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.int64) * n_features)[:, None]
+        idx = np.tile(self.roots, (n, 1))
+        for k in self.active:
+            cur = idx[:, :k]
+            xv = flat[row_base + self.feature[cur]]
+            go_left = xv < self.threshold[cur]
+            missing = np.isnan(xv)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[cur], go_left)
+            idx[:, :k] = np.where(go_left, self.left[cur], self.right[cur])
+        return self.value[idx]
+
+    def margin(self, X):
+        # XGBoost compares float32 features against float32 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        out = np.empty((X.shape[0], self._class_matrix.shape[1]))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            out[start:start + len(chunk)] = self._leaf_values(chunk) @ self._class_matrix
+        return out + self.bias
+
+    def predict_proba(self, X):
+        m = self.margin(X)
+        if self.objective.startswith("multi:"):
+            m = m - m.max(axis=1, keepdims=True)
+            e = np.exp(m)
+            return e / e.sum(axis=1, keepdims=True)
+        p = 1.0 / (1.0 + np.exp(-m[:, 0]))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+    ARRAYS = ("feature", "threshold", "left", "right", "default_left", "value",
+              "roots", "tree_class", "depth", "bias")
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}, \
+            {"num_class": self.num_class, "objective": self.objective}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        # Arrays that already have the right dtype (e.g. memory-mapped) are used in place
+        return cls(*(arrays[name] for name in cls.ARRAYS[:-1]), meta["num_class"],
+                   arrays["bias"], meta["objective"])
+
+
+class ForestEnsemble:
+    # scikit-learn trees in one node table, same layout as TreeEnsemble.
+    # value holds each node's class distribution; predict_proba averages the
+    # leaves reached in every tree, like RandomForestClassifier.predict_proba.
+    def __init__(self, feature, threshold, left, right, value, roots, depth):
+        order = np.argsort(-np.asarray(depth), kind="stable")
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float32)
+        self.roots = np.ascontiguousarray(np.asarray(roots)[order], dtype=np.int32)
+        self.depth = np.ascontiguousarray(np.asarray(depth)[order], dtype=np.int32)
+        self.max_depth = int(self.depth.max()) if len(self.depth) else 0
+        self.active = [int((self.depth > d).sum()) for d in range(self.max_depth)]
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    @property
+    def num_nodes(self):
+        return len(self.feature)
+
+    def predict_proba(self, X):
+        # scikit-learn compares float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        n, n_features = X.shape
+        out = np.empty((n, self.value.shape[1]))
+        for start in range(0, n, FOREST_CHUNK_ROWS):
+            chunk = X[start:start + FOREST_CHUNK_ROWS]
+            flat = chunk.ravel()
+            row_base = (np.arange(len(chunk), dtype=np.int64) * n_features)[:, None]
+            idx = np.tile(self.roots, (len(chunk), 1))
+            for k in self.active:
+                cur = idx[:, :k]
+                go_left = flat[row_base + self.feature[cur]] <= self.threshold[cur]
+                idx[:, :k] = np.where(go_left, self.left[cur], self.right[cur])
+            out[start:start + len(chunk)] = self.value[idx].sum(axis=1, dtype=np.float64)
+        return out / self.num_trees
+
+    def predict(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "depth")
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}, {}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        return cls(*(arrays[name] for name in cls.ARRAYS))
+
+
+def compile_sklearn_forest(model):
+    """Compile a fitted RandomForestClassifier / ExtraTreesClassifier / DecisionTreeClassifier."""
+    estimators = getattr(model, "estimators_", [model])
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Multi-output forests are not supported")
+    feature, threshold, left, right, value, roots, depth, offset = [], [], [], [], [], [], [], 0
+    for est in estimators:
+        t = est.tree_
+        is_leaf = t.children_left == -1
+        self_idx = np.arange(t.node_count) + offset
+        dist = t.value[:, 0, :]
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(np.where(is_leaf, 0.0, t.threshold))
+        left.append(np.where(is_leaf, self_idx, t.children_left + offset))
+        right.append(np.where(is_leaf, self_idx, t.children_right + offset))
+        value.append(dist / dist.sum(axis=1, keepdims=True))
+        roots.append(offset)
+        depth.append(int(t.max_depth))
+        offset += t.node_count
+    return ForestEnsemble(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                          np.concatenate(right), np.concatenate(value), roots, depth)
+
+
+def _tree_depth(left, right):
+    depth, stack = 0, [(0, 0)]
+    while stack:
+        node, d = stack.pop()
+        if left[node] == -1:
+            depth = max(depth, d)
+        else:
+            stack.append((left[node], d + 1))
+            stack.append((right[node], d + 1))
+    return depth
+
+
+def compile_xgboost(model):
+    """Compile an XGBClassifier (or raw Booster) into a TreeEnsemble."""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    objective = learner["objective"]["name"]
+    if not (objective.startswith("multi:") or objective == "binary:logistic"):
+        raise ValueError(f"Unsupported objective: {objective}")
+
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"Unsupported booster: {gbm['name']}")
+    trees = gbm["model"]["trees"]
+    num_class = max(int(learner["learner_model_param"]["num_class"]), 1)
+
+    tree_info = gbm["model"]["tree_info"] if num_class > 1 else [0] * len(trees)
+
+    feature, threshold, left, right, default_left, value = [], [], [], [], [], []
+    roots, tree_class, depth, offset = [], [], [], 0
+    const = np.zeros(num_class)
+    for tree, cls in zip(trees, tree_info):
+        if any(tree["split_type"]):
+            raise ValueError("Categorical splits are not supported")
+        lc = np.asarray(tree["left_children"], dtype=np.int64)
+        rc = np.asarray(tree["right_children"], dtype=np.int64)
+        cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+        is_leaf = lc == -1
+
+        # Single-leaf trees add the same value to every row: fold them into the bias
+        if is_leaf[0]:
+            const[cls] += cond[0]
+            continue
+        self_idx = np.arange(len(lc)) + offset
+
+        feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+        threshold.append(np.where(is_leaf, 0.0, cond))
+        left.append(np.where(is_leaf, self_idx, lc + offset))
+        right.append(np.where(is_leaf, self_idx, rc + offset))
+        default_left.append(np.asarray(tree["default_left"], dtype=bool))
+        value.append(np.where(is_leaf, cond, 0.0))
+
+        roots.append(offset)
+        tree_class.append(cls)
+        depth.append(_tree_depth(lc, rc))
+        offset += len(lc)
+
+    if not roots:
+        feature = threshold = left = right = default_left = value = [np.zeros(0)]
+    ens = TreeEnsemble(
+        np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+        np.concatenate(right), np.concatenate(default_left), np.concatenate(value),
+        roots, tree_class, depth, num_class, const, objective,
+    )
+
+    # How base_score maps to a margin offset has changed across XGBoost
+    # releases, so read the intercept back from the booster itself.
+    import xgboost as xgb
+    probe = np.zeros((1, booster.num_features()), dtype=np.float32)
+    ref = booster.predict(xgb.DMatrix(probe), output_margin=True).reshape(1, -1)
+    ens.bias = ens.bias + (ref - ens.margin(probe))[0]
+    return ens
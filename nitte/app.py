@@ -1,36 +1,66 @@
 from flask import Flask, request, jsonify, send_file, render_template_string
 import os
+import sys
 import joblib
 import numpy as np
 import pandas as pd
+# model_registry, suitability_grid and columnar_cache are shared with crop_recommandation-main
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "crop_recommandation-main"))
+from model_registry import ModelRegistry, ModelUnavailable
+from suitability_grid import load_grid
+from columnar_cache import read_table
 
 app = Flask(__name__, static_folder=".", template_folder=".")
 
 # Try to load model / label encoder / dataset from current folder.
 MODEL_PATH = "suitability_model.pkl"
 LE_PATH = "label_encoder.pkl"
+# read via Crop_recommendation.cols.npz when fresh:
+#   python ../crop_recommandation-main/columnar_cache.py build Crop_recommendation.xlsx
 XLSX_PATH = "Crop_recommendation.xlsx"
+# built by: python ../crop_recommandation-main/suitability_grid.py build --model suitability_model.pkl
+#           --le label_encoder.pkl --out suitability_grid --data Crop_recommendation.xlsx
+GRID_PREFIX = "suitability_grid"
 
-model = None
-le = None
-df = None
+# Opt-in: answer /check from the precomputed grid when one matches the model and
+# its accuracy report is within the bounds in suitability_grid.py
+USE_SUITABILITY_GRID = os.environ.get("USE_SUITABILITY_GRID", "0") == "1"
+
+# Artifacts that must be resident before /readyz reports ready
+REQUIRED_MODELS = [m.strip() for m in os.environ.get("REQUIRED_MODELS", "suitability,dataset").split(",") if m.strip()]
+
+
+# Loaded lazily on first use so the server can bind its port straight away.
+def _require(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found")
+
+
+def load_suitability():
+    _require(MODEL_PATH)
+    _require(LE_PATH)
+    suit = {"model": joblib.load(MODEL_PATH), "le": joblib.load(LE_PATH), "grid": None}
+    if USE_SUITABILITY_GRID:
+        suit["grid"] = load_grid(GRID_PREFIX, MODEL_PATH)
+        if suit["grid"] is not None and list(suit["grid"].classes) != list(suit["le"].classes_):
+            print("Warning: suitability grid classes do not match label_encoder.pkl; ignoring it")
+            suit["grid"] = None
+    return suit
+
+
+def load_dataset():
+    _require(XLSX_PATH)
+    return read_table(XLSX_PATH)
 
-if os.path.exists(MODEL_PATH) and os.path.exists(LE_PATH) and os.path.exists(XLSX_PATH):
-    try:
-        model = joblib.load(MODEL_PATH)
-        le = joblib.load(LE_PATH)
-        df = pd.read_excel(XLSX_PATH)
-        print("Loaded model, encoder, and dataset.")
-    except Exception as e:
-        print("Warning: failed to load model/encoder/dataset:", e)
-        model = None
-        le = None
-        df = None
-else:
-    if not os.path.exists(XLSX_PATH):
-        print(f"Warning: {XLSX_PATH} not found.")
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(LE_PATH):
-        print("Warning: model or encoder .pkl not found; using mock.")
+
+def _plain(value):
+    # Shortest decimal for the value's own precision (float32 from the columnar cache)
+    return float(np.format_float_positional(value))
+
+
+registry = ModelRegistry()
+registry.register("suitability", load_suitability, required="suitability" in REQUIRED_MODELS)
+registry.register("dataset", load_dataset, required="dataset" in REQUIRED_MODELS)
 
 
 @app.route("/")
@@ -38,6 +68,19 @@ def home():
     return send_file("index.html")
 
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    # Kick off a background warmup on the first probe (e.g. under gunicorn)
+    registry.warm(background=True)
+    ready = registry.ready()
+    return jsonify({"ready": ready, "models": registry.status()}), (200 if ready else 503)
+
+
 @app.route("/check", methods=["POST"])
 def check():
     data = request.get_json() or {}
@@ -50,9 +93,18 @@ def check():
     except Exception:
         return jsonify({"error": "Invalid numeric inputs"}), 400
 
-    if model is not None and le is not None and df is not None:
-        X = np.array([[temperature, humidity, rainfall]])
-        probs = model.predict_proba(X)[0]
+    try:
+        suit = registry.get("suitability")
+        df = registry.get("dataset")
+    except ModelUnavailable:
+        suit = df = None
+
+    if suit is not None and df is not None:
+        model, le = suit["model"], suit["le"]
+        # Inputs in a served cell of the precomputed grid skip the forest
+        probs = suit["grid"].lookup(temperature, humidity, rainfall) if suit["grid"] is not None else None
+        if probs is None:
+            probs = model.predict_proba(np.array([[temperature, humidity, rainfall]]))[0]
         top_idxs = probs.argsort()[-3:][::-1]
         top_crops = le.inverse_transform(top_idxs)
 
@@ -82,9 +134,9 @@ def check():
         if not row.empty:
             details = {
                 "best_crop": best_crop,
-                "temperature": float(row['temperature'].values[0]),
-                "humidity": float(row['humidity'].values[0]),
-                "rainfall": float(row['rainfall'].values[0])
+                "temperature": _plain(row['temperature'].values[0]),
+                "humidity": _plain(row['humidity'].values[0]),
+                "rainfall": _plain(row['rainfall'].values[0])
             }
         else:
             details = {"best_crop": best_crop, "temperature": None, "humidity": None, "rainfall": None}
@@ -119,4 +171,11 @@ def check():
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    PORT = int(os.environ.get("PORT", 5000))
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # Bind first, then load models in the background. Under the debug reloader
+    # only the serving child process (WERKZEUG_RUN_MAIN) warms up; the watching
+    # parent never serves a request.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        registry.warm(background=True, wait_for_port=PORT)
+    app.run(debug=debug, port=PORT)
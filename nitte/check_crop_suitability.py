@@ -1,10 +1,15 @@
+import os
+import sys
 import joblib
 import numpy as np
 import pandas as pd
+# columnar_cache is shared with crop_recommandation-main
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "crop_recommandation-main"))
+from columnar_cache import read_table
 
 model = joblib.load("suitability_model.pkl")
 le = joblib.load("label_encoder.pkl")
-df = pd.read_excel("Crop_recommendation.xlsx")
+df = read_table("Crop_recommendation.xlsx")
 
 print("\n Multi-Crop Suitability Checker \n")
 